@@ -3,9 +3,11 @@
 import os
 import sys
 
+from yatube import settings_module
+
 
 def main():
-    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module())
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc:
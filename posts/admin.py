@@ -1,21 +1,41 @@
 from django.contrib import admin
 
 from .models import Group, Post, Comment, Profile_Author
+from .search import find
 
 
-class PostAdmin(admin.ModelAdmin):
+class FullTextSearchMixin:
+    """Admin search through posts.search instead of icontains scans.
+
+    search_fields only turns the search box on.
+    """
+    search_kind = None
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        pks = [pk for _, pk, _ in find(search_term, [self.search_kind])]
+        return queryset.filter(pk__in=pks), False
+
+
+class PostAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ("pk", "text", "pub_date", "author")
     search_fields = ("text",)
+    search_kind = 'post'
     list_filter = ("pub_date",)
     empty_value_display = "-пусто-"
 
 
-class GroupAdmin(admin.ModelAdmin):
+class GroupAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ("title", "slug", "description")
+    search_fields = ("title",)
+    search_kind = 'group'
 
 
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ('post', 'text', 'author', 'created')
+    search_fields = ('text',)
+    search_kind = 'comment'
 
 
 class ProfileAdmin(admin.ModelAdmin):
@@ -0,0 +1,162 @@
+import math
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .replicas import read_source, reads_own_writes
+
+POSTS = 'posts'
+LIKES = 'likes'
+LEADERBOARDS = 'leaderboards'
+
+_local = threading.local()
+
+
+def _generation_key(name):
+    return f'generation:{name}'
+
+
+def get_generation(name):
+    key = _generation_key(name)
+    value = cache.get(key)
+    if value is None:
+        # Seeded from the clock so a lost counter never reuses old keys
+        value = int(time.time() * 1000)
+        if not cache.add(key, value, None):
+            value = cache.get(key, value)
+    return value
+
+
+def bump_generation(*names):
+    for name in names:
+        try:
+            cache.incr(_generation_key(name))
+        except ValueError:
+            get_generation(name)
+
+
+def timeline_generation(user):
+    return f'timeline:{user.pk}'
+
+
+def feed_page(request):
+    return '&'.join(
+        f'{param}={request.GET[param]}'
+        for param in ('page', 'after', 'before') if param in request.GET
+    )
+
+
+def feed_version(*names):
+    return '.'.join(str(get_generation(name)) for name in names)
+
+
+def _expiring(entry, now):
+    # Probabilistic early expiration: the closer to expiry and the
+    # slower the value is to compute, the likelier one request is to
+    # recompute it ahead of time, before anybody finds it expired
+    early = entry['delta'] * settings.CACHE_EARLY_EXPIRY_BETA * -math.log(
+        1 - random.random()
+    )
+    return now + early >= entry['expires']
+
+
+def _wait(key, version):
+    deadline = time.monotonic() + settings.CACHE_LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(settings.CACHE_POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None and entry['version'] == version:
+            return entry
+    return None
+
+
+def served_outdated():
+    # Whether remember() gave this thread a value from an older version
+    # since reset_outdated(); the page holding it is older than its state
+    return getattr(_local, 'outdated', False)
+
+
+def reset_outdated():
+    _local.outdated = False
+
+
+def remember(key, compute, ttl, version=None):
+    """The cached value of ``compute()``, with stale-while-revalidate.
+
+    A value is fresh for ``ttl`` seconds while ``version`` is the same
+    and is kept CACHE_STALE_TTL seconds longer. Only the request that
+    takes the lock recomputes a stale one; the others are given the
+    stale copy meanwhile, or wait for the new one when there is none.
+    Values are kept per database read from, and a writer pinned to the
+    primary is never given a copy from before the version it made.
+    Handing out a copy from an older version shows in served_outdated().
+    """
+    # The database in front, so key_prefix() still groups them by name
+    key = f'{read_source()}:{key}'
+    entry = cache.get(key)
+    now = time.time()
+    if (
+        entry is not None
+        and entry['version'] == version
+        and not _expiring(entry, now)
+    ):
+        return entry['value']
+    lock = f'{key}:lock'
+    locked = cache.add(lock, 1, settings.CACHE_LOCK_TIMEOUT)
+    if not locked:
+        if entry is not None and (
+            entry['version'] == version or not reads_own_writes()
+        ):
+            if entry['version'] != version:
+                _local.outdated = True
+            return entry['value']
+        entry = _wait(key, version)
+        if entry is not None:
+            return entry['value']
+    try:
+        started = time.monotonic()
+        value = compute()
+        cache.set(key, {
+            'value': value,
+            'version': version,
+            'expires': time.time() + ttl,
+            'delta': time.monotonic() - started,
+        }, ttl + settings.CACHE_STALE_TTL)
+    finally:
+        if locked:
+            cache.delete(lock)
+    return value
+
+
+def _stamp_key(name):
+    return f'stamp:{name}'
+
+
+def touch(*names):
+    """Record that these objects changed now, for conditional GETs."""
+    now = int(time.time() * 1000)
+    cache.set_many({_stamp_key(name): now for name in names}, None)
+
+
+def stamps(*names):
+    # When each object last changed, in ms. An unknown one counts as
+    # changed now, so a lost cache can not produce a stale 304.
+    keys = [_stamp_key(name) for name in names]
+    found = cache.get_many(keys)
+    now = int(time.time() * 1000)
+    for key in keys:
+        if key not in found:
+            cache.add(key, now, None)
+            found[key] = cache.get(key, now)
+    return [found[key] for key in keys]
+
+
+def post_stamp(post_id):
+    return f'post:{post_id}'
+
+
+def user_stamp(username):
+    return f'user:{username}'
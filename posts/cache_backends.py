@@ -0,0 +1,209 @@
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.utils.module_loading import import_string
+
+from .profiling import cache_event
+
+STATS_PREFIX = 'cachestats'
+EVENTS = ('hits', 'misses', 'evictions')
+
+
+# Parts of a key that differ from one key to the next
+VARYING = re.compile(r'^(\d+|[0-9a-f]{32}|lock)$')
+
+
+def key_prefix(key):
+    # 'generation:timeline:5' -> 'generation:timeline',
+    # 'default:template.cache.index_page.<md5>:lock'
+    #     -> 'default:template.cache.index_page'
+    key = str(key)
+    parts = re.split(r'[:.]', key)
+    if len(parts) == 1:
+        return key
+    # Every trailing id, hash and lock, or else the last part, so the
+    # prefixes stay few whatever the keys are
+    keep = len(parts) - 1
+    while keep > 1 and VARYING.match(parts[keep - 1]):
+        keep -= 1
+    return key[:len(':'.join(parts[:keep]))]
+
+
+class MeteredCache(BaseCache):
+    """Wraps any cache backend and counts hits, misses and evictions.
+
+    The real backend is named by the ``backend`` option, every other
+    setting is passed through to it. Counters are grouped by key prefix,
+    buffered in memory and periodically added to the wrapped cache
+    itself, so every process sharing the cache reports into one place.
+    """
+
+    def __init__(self, location, params):
+        options = dict(params.get('OPTIONS', {}))
+        backend = options.pop('backend')
+        self.flush_every = options.pop('flush_every', 100)
+        self.flush_interval = options.pop('flush_interval', 10)
+        self.tracked_keys = options.pop('tracked_keys', 10000)
+        inner_params = dict(params, OPTIONS=options)
+        super().__init__(inner_params)
+        self.inner = import_string(backend)(location, inner_params)
+        self.lock = threading.Lock()
+        self.counts = defaultdict(int)
+        self.pending = 0
+        self.flushed_at = time.monotonic()
+        # Keys this process stored, with their expiry, to tell an
+        # eviction apart from an ordinary miss
+        self.expiries = OrderedDict()
+
+    def record(self, key, event):
+        cache_event(event)
+        with self.lock:
+            self.counts[(key_prefix(key), event)] += 1
+            self.pending += 1
+            due = (
+                self.pending >= self.flush_every
+                or time.monotonic() - self.flushed_at >= self.flush_interval
+            )
+        if due:
+            self.flush_stats()
+
+    def remember(self, key, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        expiry = None if timeout is None else time.time() + timeout
+        with self.lock:
+            self.expiries[key] = expiry
+            self.expiries.move_to_end(key)
+            while len(self.expiries) > self.tracked_keys:
+                self.expiries.popitem(last=False)
+
+    def forget(self, key):
+        with self.lock:
+            self.expiries.pop(key, None)
+
+    def miss(self, key):
+        with self.lock:
+            known = key in self.expiries
+            expiry = self.expiries.pop(key, None)
+        evicted = known and (expiry is None or expiry > time.time())
+        self.record(key, 'evictions' if evicted else 'misses')
+
+    def flush_stats(self):
+        with self.lock:
+            counts, self.counts = self.counts, defaultdict(int)
+            self.pending = 0
+            self.flushed_at = time.monotonic()
+        if not counts:
+            return
+        prefixes = set(self.inner.get(f'{STATS_PREFIX}:prefixes') or ())
+        for (prefix, event), amount in counts.items():
+            prefixes.add(prefix)
+            key = f'{STATS_PREFIX}:{prefix}:{event}'
+            if not self.inner.add(key, amount, None):
+                try:
+                    self.inner.incr(key, amount)
+                except ValueError:
+                    self.inner.set(key, amount, None)
+        self.inner.set(f'{STATS_PREFIX}:prefixes', sorted(prefixes), None)
+
+    def stats(self):
+        self.flush_stats()
+        prefixes = self.inner.get(f'{STATS_PREFIX}:prefixes') or ()
+        keys = [
+            f'{STATS_PREFIX}:{prefix}:{event}'
+            for prefix in prefixes for event in EVENTS
+        ]
+        values = self.inner.get_many(keys)
+        return {
+            prefix: {
+                event: values.get(f'{STATS_PREFIX}:{prefix}:{event}', 0)
+                for event in EVENTS
+            }
+            for prefix in prefixes
+        }
+
+    def reset_stats(self):
+        with self.lock:
+            self.counts.clear()
+            self.pending = 0
+        prefixes = self.inner.get(f'{STATS_PREFIX}:prefixes') or ()
+        self.inner.delete_many([
+            f'{STATS_PREFIX}:{prefix}:{event}'
+            for prefix in prefixes for event in EVENTS
+        ])
+        self.inner.delete(f'{STATS_PREFIX}:prefixes')
+
+    _missing = object()
+
+    def get(self, key, default=None, version=None):
+        value = self.inner.get(key, self._missing, version=version)
+        if value is self._missing:
+            self.miss(key)
+            return default
+        self.record(key, 'hits')
+        return value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        found = self.inner.get_many(keys, version=version)
+        for key in keys:
+            if key in found:
+                self.record(key, 'hits')
+            else:
+                self.miss(key)
+        return found
+
+    def has_key(self, key, version=None):
+        return self.inner.has_key(key, version=version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.inner.add(key, value, timeout, version=version)
+        if added:
+            self.remember(key, timeout)
+        return added
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.inner.set(key, value, timeout, version=version)
+        self.remember(key, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.inner.set_many(data, timeout, version=version)
+        for key in data:
+            if key not in failed:
+                self.remember(key, timeout)
+        return failed
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        touched = self.inner.touch(key, timeout, version=version)
+        if touched:
+            self.remember(key, timeout)
+        return touched
+
+    def incr(self, key, delta=1, version=None):
+        return self.inner.incr(key, delta, version=version)
+
+    def decr(self, key, delta=1, version=None):
+        return self.inner.decr(key, delta, version=version)
+
+    def delete(self, key, version=None):
+        self.forget(key)
+        return self.inner.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        for key in keys:
+            self.forget(key)
+        return self.inner.delete_many(keys, version=version)
+
+    def clear(self):
+        with self.lock:
+            self.expiries.clear()
+            self.counts.clear()
+            self.pending = 0
+        return self.inner.clear()
+
+    def close(self, **kwargs):
+        return self.inner.close(**kwargs)
@@ -0,0 +1,103 @@
+import hashlib
+from functools import wraps
+
+from django.db.models import Max
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+from .cache import (
+    LEADERBOARDS, LIKES, POSTS, post_stamp, reset_outdated, served_outdated,
+    stamps, user_stamp
+)
+from .models import Comment, Post
+
+
+def conditional(state):
+    """ETag/Last-Modified for a GET view, answering 304 when unchanged.
+
+    ``state(request, *args, **kwargs)`` returns the newest relevant
+    date from one indexed MAX() query, or None, and the names of the
+    cache stamps (posts.cache.touch) covering everything else on the
+    page: edits, likes, deletes, counters. The page is never rendered
+    to find out whether it changed.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            newest, names = state(request, *args, **kwargs)
+            changed = max(stamps(*names)) / 1000
+            if newest is not None:
+                changed = max(changed, newest.timestamp())
+            # Pages differ per visitor: the nav, follow buttons, forms
+            etag = quote_etag(hashlib.md5(
+                f'{request.user.pk}:{newest}:{changed}'.encode()
+            ).hexdigest())
+            # Whole seconds; clients sending If-None-Match, as browsers
+            # do, are checked by the ETag and so to the millisecond
+            last_modified = int(changed)
+            # For the page cache, to keep with the copy it stores
+            request.validators = (etag, last_modified)
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+            if response is None:
+                reset_outdated()
+                response = view(request, *args, **kwargs)
+                if response.has_header('ETag'):
+                    # A cached copy: its body is as old as its validators
+                    etag = response['ETag']
+                    last_modified = parse_http_date_safe(
+                        response['Last-Modified']
+                    )
+                    response = get_conditional_response(
+                        request, etag=etag, last_modified=last_modified,
+                        response=response
+                    )
+            if response.status_code in (200, 304):
+                # Parts of it predate the validators: a 304 against them
+                # later would keep the old parts for good
+                if not served_outdated():
+                    response['ETag'] = etag
+                    response['Last-Modified'] = http_date(last_modified)
+                # Always revalidate; the answer is usually a cheap 304
+                patch_cache_control(response, private=True, no_cache=True)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def newest(queryset, field):
+    return queryset.aggregate(newest=Max(field))['newest']
+
+
+def index_state(request):
+    return (
+        newest(Post.objects.all(), 'pub_date'),
+        [POSTS, LIKES, LEADERBOARDS]
+    )
+
+
+def group_state(request, slug):
+    return (
+        newest(Post.objects.filter(group__slug=slug), 'pub_date'),
+        [POSTS, LIKES]
+    )
+
+
+def profile_state(request, username):
+    return (
+        newest(Post.objects.filter(author__username=username), 'pub_date'),
+        [POSTS, LIKES, user_stamp(username)]
+    )
+
+
+def post_state(request, username, post_id):
+    return (
+        newest(Comment.objects.filter(post_id=post_id), 'created'),
+        [post_stamp(post_id), user_stamp(username)]
+    )
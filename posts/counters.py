@@ -0,0 +1,55 @@
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Counter, Follow, Post, User
+
+
+def _count(queryset, field):
+    counted = queryset.filter(**{field: OuterRef('pk')}).order_by().values(
+        field
+    ).annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(counted, output_field=IntegerField()), 0)
+
+
+def counted_users(users=None):
+    if users is None:
+        users = User.objects.all()
+    return users.annotate(
+        followers_total=_count(Follow.objects.all(), 'author'),
+        following_total=_count(Follow.objects.all(), 'user'),
+        posts_total=_count(Post.objects.all(), 'author'),
+    )
+
+
+def rebuild_counters(users=None, batch_size=500):
+    rebuilt = 0
+    for user in counted_users(users).iterator(chunk_size=batch_size):
+        Counter.objects.update_or_create(
+            user_id=user.pk,
+            defaults={
+                'followers': user.followers_total,
+                'following': user.following_total,
+                'posts': user.posts_total,
+            }
+        )
+        rebuilt += 1
+    return rebuilt
+
+
+def get_counter(user):
+    counter = Counter.objects.filter(user=user).first()
+    if counter is None:
+        rebuild_counters(User.objects.filter(pk=user.pk))
+        counter = Counter.objects.get(user=user)
+    return counter
+
+
+def change_counter(user_id, **deltas):
+    # Called from the signals, in the transaction that made the change.
+    # A missing row is left to get_counter(), which counts it afresh;
+    # rebuilding here could recreate it while the user is being deleted.
+    # Clamped, since rows from before the signals may have drifted low
+    Counter.objects.filter(user_id=user_id).update(**{
+        field: Greatest(F(field) + delta, 0)
+        for field, delta in deltas.items()
+    })
@@ -0,0 +1,278 @@
+import itertools
+import json
+import logging
+import os
+import threading
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from . import tasks
+from .page_cache import invalidate
+from .thumbnails import POST_THUMBNAIL, PROFILE_THUMBNAIL
+
+logger = logging.getLogger(__name__)
+
+MIME_TYPES = {
+    'avif': 'image/avif', 'webp': 'image/webp', 'jpeg': 'image/jpeg'
+}
+# Pillow's names for them
+SAVE_AS = {'avif': 'AVIF', 'webp': 'WEBP', 'jpeg': 'JPEG'}
+# Variants keep the crop the templates always showed
+GEOMETRY = {
+    'posts.post': POST_THUMBNAIL[0],
+    'posts.profile_author': PROFILE_THUMBNAIL[0],
+}
+# What invalidate() reads from each
+RELATED = {
+    'posts.post': ('author', 'group'),
+    'posts.profile_author': ('author',),
+}
+
+# (label, pk) waiting for build_pending()
+_pending = set()
+_lock = threading.Lock()
+_draining = False
+_drains = itertools.count()
+
+
+def geometry(size):
+    width, height = size.split('x')
+    return int(width), int(height)
+
+
+def formats():
+    # AVIF needs a Pillow built with it; whatever it can not write is left out
+    Image.init()
+    return [
+        name for name in settings.IMAGE_VARIANT_FORMATS
+        if SAVE_AS[name] in Image.SAVE
+    ]
+
+
+def widths(source_width):
+    # No upscaling, but always at least the smallest width
+    fitting = [
+        width for width in settings.IMAGE_VARIANT_WIDTHS
+        if width <= source_width
+    ]
+    return fitting or [min(settings.IMAGE_VARIANT_WIDTHS)]
+
+
+def encode(image, name):
+    data = BytesIO()
+    if name == 'jpeg':
+        image.convert('RGB').save(
+            data, 'JPEG', quality=settings.IMAGE_VARIANT_QUALITY,
+            optimize=True, progressive=True
+        )
+    else:
+        # method=6: WebP's slowest, smallest encoding; it runs once per upload
+        image.save(
+            data, SAVE_AS[name], quality=settings.IMAGE_VARIANT_QUALITY,
+            method=6
+        )
+    return data.getvalue()
+
+
+def render(source, ratio):
+    """{format: [(width, height, bytes)]} for one source image.
+
+    Cropped to ``ratio`` (width, height) around the centre, like the
+    thumbnails, and never wider than the source.
+    """
+    with Image.open(source) as original:
+        original = ImageOps.exif_transpose(original)
+        if original.mode not in ('RGB', 'RGBA'):
+            has_alpha = 'A' in original.mode or 'transparency' in original.info
+            original = original.convert('RGBA' if has_alpha else 'RGB')
+        rendered = {name: [] for name in formats()}
+        for width in widths(original.width):
+            height = max(round(width * ratio[1] / ratio[0]), 1)
+            image = ImageOps.fit(original, (width, height), Image.LANCZOS)
+            for name in rendered:
+                rendered[name].append((width, height, encode(image, name)))
+    return rendered
+
+
+def variant_name(source, width, name):
+    stem, _ = os.path.splitext(os.path.basename(source))
+    folder = os.path.dirname(source)
+    return f'variants/{folder}/{stem}_{width}w.{name}'
+
+
+class Variants:
+    """The recorded variants of an image, as the templates use them."""
+
+    def __init__(self, data):
+        self.data = data
+
+    def srcset(self, name):
+        return ', '.join(
+            f'{default_storage.url(file)} {width}w'
+            for width, _, file, _ in self.data['files'][name]
+        )
+
+    @property
+    def sources(self):
+        # (type, srcset) of the modern formats, best first
+        return [
+            (MIME_TYPES[name], self.srcset(name))
+            for name in self.data['files'] if name != 'jpeg'
+        ]
+
+    @property
+    def fallback(self):
+        # The JPEG closest to the width the page lays the image out at
+        files = self.data['files']['jpeg']
+        return min(
+            files, key=lambda file: abs(file[0] - self.data['layout'])
+        )
+
+    @property
+    def src(self):
+        return default_storage.url(self.fallback[2])
+
+    @property
+    def jpeg_srcset(self):
+        return self.srcset('jpeg')
+
+    @property
+    def width(self):
+        return self.fallback[0]
+
+    @property
+    def height(self):
+        return self.fallback[1]
+
+
+def recorded(instance):
+    # What build() recorded for the image the instance has now, if anything
+    data = json.loads(instance.image_variants or 'null')
+    if data is None or data['source'] != instance.image.name:
+        return None
+    return data
+
+
+def variants(instance):
+    """Variants of a Post or Profile_Author image, None if it has none.
+
+    Images uploaded before the variants existed are queued here, on
+    their first render.
+    """
+    if not getattr(instance, 'image', None):
+        return None
+    data = recorded(instance)
+    if data is None:
+        schedule(instance)
+        return None
+    if not data['files']:
+        return None  # not an image Pillow could read
+    return Variants(data)
+
+
+def build(label, pk):
+    """Write the variants of one Post or Profile_Author image and record
+    them on the row, unless the image was replaced meanwhile.
+
+    Returns the instance when they were recorded, else None.
+    """
+    model = apps.get_model(label)
+    instance = model.objects.select_related(*RELATED[label]).filter(
+        pk=pk
+    ).first()
+    if instance is None or not instance.image:
+        return None
+    name = instance.image.name
+    ratio = geometry(GEOMETRY[label])
+    previous = json.loads(instance.image_variants or 'null')
+    try:
+        with default_storage.open(name) as source:
+            rendered = render(source, ratio)
+    except (OSError, Image.DecompressionBombError):
+        logger.warning('No variants for %s, can not read it', name)
+        rendered = {}
+    files = {}
+    for format_name, sizes in rendered.items():
+        files[format_name] = []
+        for width, height, data in sizes:
+            path = variant_name(name, width, format_name)
+            default_storage.delete(path)
+            # The storage may pick another name, e.g. if a delete failed
+            path = default_storage.save(path, ContentFile(data))
+            files[format_name].append([width, height, path, len(data)])
+    updated = model.objects.filter(pk=pk, image=name).update(
+        image_variants=json.dumps({
+            'source': name,
+            'layout': ratio[0],
+            'files': files,
+        })
+    )
+    if not updated:
+        return None
+    if previous and previous['source'] != name:
+        for sizes in previous['files'].values():
+            for _, _, path, _ in sizes:
+                default_storage.delete(path)
+    return instance
+
+
+def build_pending():
+    """Build everything schedule() queued, including what it queues
+    meanwhile, then invalidate the pages of all of it at once."""
+    global _draining
+    built = []
+    while True:
+        with _lock:
+            if not _pending:
+                _draining = False
+                break
+            label, pk = _pending.pop()
+        try:
+            instance = build(label, pk)
+        except Exception:
+            logger.exception('Variants of %s %s failed', label, pk)
+            continue
+        if instance is not None:
+            built.append(instance)
+    # The pages showing the images were cached with the plain <img>;
+    # one bump of POSTS for the whole batch rather than one per image
+    invalidate(*built)
+
+
+def schedule(instance):
+    global _draining
+    if not instance.image or recorded(instance) is not None:
+        return
+    with _lock:
+        _pending.add((instance._meta.label_lower, instance.pk))
+        if _draining:
+            return  # the running build_pending() picks it up
+        _draining = True
+    # A key of its own: the last drain may not have let go of its key yet
+    tasks.submit(('variants', next(_drains)), build_pending)
+
+
+def report(paths, ratio=POST_THUMBNAIL[0]):
+    """Bytes of every source image against the variants made from it.
+
+    [(path, original bytes, {format: {width: bytes}})]; nothing is
+    written. Files Pillow can not read are left out, as in build().
+    """
+    rows = []
+    for path in paths:
+        try:
+            with open(path, 'rb') as source:
+                rendered = render(source, geometry(ratio))
+        except (OSError, Image.DecompressionBombError):
+            logger.warning('Skipped %s, can not read it', path)
+            continue
+        rows.append((path, os.path.getsize(path), {
+            name: {size[0]: len(size[2]) for size in sizes}
+            for name, sizes in rendered.items()
+        }))
+    return rows
@@ -0,0 +1,173 @@
+import time
+from abc import ABC, abstractmethod
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+from django.utils import timezone
+
+from . import tasks
+from .cache import LEADERBOARDS, touch
+from .models import Counter, Follow, Group, Post, Preference, User
+
+
+def since():
+    return timezone.now() - timedelta(days=settings.LEADERBOARD_WINDOW_DAYS)
+
+
+class Board(ABC):
+    """One top-N list: how to rank everything and how to score one."""
+
+    @abstractmethod
+    def compute(self, limit):
+        """[(pk, score)], best first."""
+
+    @abstractmethod
+    def score(self, pk):
+        """The current score of one."""
+
+    @abstractmethod
+    def resolve(self, pks):
+        """pk -> object to show."""
+
+
+class Authors(Board):
+    # Most followed, straight from the counters
+    def compute(self, limit):
+        return list(Counter.objects.filter(followers__gt=0).order_by(
+            '-followers', 'user_id'
+        ).values_list('user_id', 'followers')[:limit])
+
+    def score(self, pk):
+        return Follow.objects.filter(author_id=pk).count()
+
+    def resolve(self, pks):
+        return User.objects.in_bulk(pks)
+
+
+class Groups(Board):
+    # Most posts in the window
+    def compute(self, limit):
+        return list(Post.objects.filter(
+            pub_date__gte=since(), group__isnull=False
+        ).order_by().values('group').annotate(
+            total=Count('pk')
+        ).order_by('-total', 'group').values_list('group', 'total')[:limit])
+
+    def score(self, pk):
+        return Post.objects.filter(group_id=pk, pub_date__gte=since()).count()
+
+    def resolve(self, pks):
+        return Group.objects.in_bulk(pks)
+
+
+class Posts(Board):
+    # Most liked in the window
+    def compute(self, limit):
+        return list(Preference.objects.filter(
+            created__gte=since()
+        ).order_by().values('post').annotate(
+            total=Count('pk')
+        ).order_by('-total', 'post').values_list('post', 'total')[:limit])
+
+    def score(self, pk):
+        return Preference.objects.filter(
+            post_id=pk, created__gte=since()
+        ).count()
+
+    def resolve(self, pks):
+        return Post.objects.select_related('author').in_bulk(pks)
+
+
+BOARDS = {'authors': Authors(), 'groups': Groups(), 'posts': Posts()}
+
+
+def _key(name):
+    return f'leaderboard:{name}'
+
+
+def _rows_key(name):
+    return f'leaderboard:{name}:rows'
+
+
+def capacity():
+    # Tracking more than is shown leaves room for members to drop out
+    return settings.LEADERBOARD_SIZE * settings.LEADERBOARD_SLACK
+
+
+def rebuild(name):
+    cache.set(_key(name), {
+        'scores': dict(BOARDS[name].compute(capacity())),
+        'built': time.time(),
+    }, None)
+    cache.delete(_rows_key(name))
+    touch(LEADERBOARDS)
+
+
+def rebuild_all():
+    for name in BOARDS:
+        rebuild(name)
+
+
+def offer(name, pk, delta):
+    """Apply a +1/-1 event to a board kept in the cache.
+
+    Members are adjusted in place; an outsider is scored with one
+    indexed COUNT and let in if it beats the lowest member. Members
+    that fall can hide an outsider that is now ahead, and concurrent
+    events can overwrite each other: the periodic rebuild() puts that
+    right.
+    """
+    board = cache.get(_key(name))
+    if board is None:
+        return  # the next read builds it from scratch
+    scores = board['scores']
+    if pk in scores:
+        scores[pk] += delta
+    elif delta > 0:
+        score = BOARDS[name].score(pk)
+        full = len(scores) >= capacity()
+        if full and score <= min(scores.values()):
+            return
+        scores[pk] = score
+    else:
+        return
+    ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+    board['scores'] = {
+        pk: score for pk, score in ranked[:capacity()] if score > 0
+    }
+    cache.set(_key(name), board, None)
+    cache.delete(_rows_key(name))
+    touch(LEADERBOARDS)
+
+
+def schedule_rebuild(name):
+    tasks.submit(_key(name), rebuild, name)
+
+
+def top(name):
+    """[(object, score)] of a board, best first; empty until it is built.
+
+    Reads only the cache, plus one query to load the objects after the
+    board changed. Building and periodic rebuilds run in the background.
+    """
+    rows = cache.get(_rows_key(name))
+    if rows is not None:
+        return rows
+    board = cache.get(_key(name))
+    if board is None or (
+        time.time() - board['built'] >= settings.LEADERBOARD_REFRESH_INTERVAL
+    ):
+        schedule_rebuild(name)
+        # Done already if the tasks run inline
+        board = cache.get(_key(name), board)
+    if board is None:
+        return []
+    ranked = sorted(
+        board['scores'].items(), key=lambda item: (-item[1], item[0])
+    )[:settings.LEADERBOARD_SIZE]
+    objects = BOARDS[name].resolve([pk for pk, _ in ranked])
+    rows = [(objects[pk], score) for pk, score in ranked if pk in objects]
+    cache.set(_rows_key(name), rows, settings.LEADERBOARD_REFRESH_INTERVAL)
+    return rows
@@ -0,0 +1,119 @@
+import threading
+import time
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.template import engines
+
+from posts.cache import remember
+from posts.models import Post
+from posts.profiling import percentile
+
+FEED = (
+    '{% for post in page %}'
+    '{% include "includes/post_item.html" with post=post %}'
+    '{% endfor %}'
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Hammer the index feed fragment from many threads while new posts '
+        'keep invalidating it, with a plain cache and with remember()'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--ttl', type=int, default=20)
+        parser.add_argument(
+            '--bump-every', type=float, default=0.5,
+            help='Seconds between simulated new posts'
+        )
+        parser.add_argument(
+            '--think-ms', type=float, default=5,
+            help='Pause between the requests of a thread, the rest of a '
+                 'request; without it threads only fight over the GIL'
+        )
+
+    def handle(self, *args, **options):
+        if not Post.objects.exists():
+            raise CommandError('No posts, run seed_data first')
+        template = engines.all()[0].from_string(FEED)
+        self.stdout.write(
+            f'{"cache":<6} {"requests":>9} {"renders":>8} {"per bump":>9} '
+            f'{"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"max ms":>8}'
+        )
+        for name in ('plain', 'swr'):
+            cache.delete_many([f'bench:{name}', f'bench:{name}:lock'])
+            self.report(name, *self.run(name, template, options))
+
+    def run(self, name, template, options):
+        renders = []
+        latencies = defaultdict(list)
+        state = {'version': 0}
+        stop = threading.Event()
+
+        def render():
+            posts = Post.objects.feed().order_by('-pub_date')[:10]
+            renders.append(1)
+            return template.render({'page': posts})
+
+        def plain():
+            # What {% cache %} does with the version in the key
+            key = f'bench:plain:{state["version"]}'
+            value = cache.get(key)
+            if value is None:
+                value = render()
+                cache.set(key, value, options['ttl'])
+            return value
+
+        def swr():
+            return remember(
+                'bench:swr', render, options['ttl'], state['version']
+            )
+
+        read = {'plain': plain, 'swr': swr}[name]
+
+        def worker(index):
+            try:
+                while not stop.is_set():
+                    started = time.perf_counter()
+                    read()
+                    latencies[index].append(
+                        (time.perf_counter() - started) * 1000
+                    )
+                    time.sleep(options['think_ms'] / 1000)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=worker, args=(i,))
+            for i in range(options['threads'])
+        ]
+        for thread in threads:
+            thread.start()
+        deadline = time.monotonic() + options['seconds']
+        bumps = 0
+        while time.monotonic() < deadline:
+            time.sleep(options['bump_every'])
+            state['version'] += 1
+            bumps += 1
+        stop.set()
+        for thread in threads:
+            thread.join()
+        merged = sorted(
+            latency for values in latencies.values() for latency in values
+        )
+        return merged, len(renders), bumps
+
+    def report(self, name, latencies, renders, bumps):
+        self.stdout.write(
+            f'{name:<6} {len(latencies):>9} {renders:>8} '
+            f'{renders / max(bumps, 1):>9.1f} '
+            f'{percentile(latencies, 50):>8.2f} '
+            f'{percentile(latencies, 95):>8.2f} '
+            f'{percentile(latencies, 99):>8.2f} {latencies[-1]:>8.2f}'
+        )
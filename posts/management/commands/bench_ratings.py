@@ -0,0 +1,105 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from posts.models import Post, Preference, User
+from posts.ratings import RatingBuffer, apply_ratings
+
+
+class Rollback(Exception):
+    pass
+
+
+class UpdateCounter:
+    def __init__(self):
+        self.updates = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.startswith('UPDATE'):
+            self.updates += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = 'Compare per-like rating writes with buffered flushing on a burst'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--likes', type=int, default=2000)
+        parser.add_argument('--posts', type=int, default=3)
+        parser.add_argument(
+            '--window', type=int, default=500,
+            help='Likes accumulated between two buffer flushes'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options['likes'], options['posts'], options['window'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, likes, posts):
+        author = User.objects.create(username='bench_ratings_author')
+        Post.objects.bulk_create(
+            Post(text=f'viral {i}', author=author) for i in range(posts)
+        )
+        User.objects.bulk_create(
+            User(username=f'bench_ratings_{i}') for i in range(likes)
+        )
+        post_ids = list(author.posts.values_list('pk', flat=True))
+        fans = User.objects.filter(username__startswith='bench_ratings_')
+        fan_ids = list(fans.exclude(pk=author.pk).values_list('pk', flat=True))
+        return [(fan, post_ids[i % posts]) for i, fan in enumerate(fan_ids)]
+
+    def burst(self, likes, write, finish=None):
+        counter = UpdateCounter()
+        with connection.execute_wrapper(counter):
+            started = time.perf_counter()
+            for user_id, post_id in likes:
+                with transaction.atomic():
+                    Preference.objects.create(user_id=user_id, post_id=post_id)
+                    write(post_id)
+            if finish is not None:
+                finish()
+            elapsed = time.perf_counter() - started
+        return elapsed, counter.updates
+
+    def report(self, name, likes, elapsed, updates):
+        self.stdout.write(
+            f'{name:<10} {likes:>7} likes  {elapsed:8.3f}s  '
+            f'{likes / elapsed:10.0f} likes/s  {updates:>6} UPDATEs'
+        )
+
+    def run(self, likes, posts, window):
+        pairs = self.seed(likes, posts)
+
+        direct, direct_updates = self.burst(
+            pairs, lambda post_id: apply_ratings({post_id: 1})
+        )
+        self.report('per-like', len(pairs), direct, direct_updates)
+
+        Preference.objects.filter(post__author__username='bench_ratings_author').delete()
+        Post.objects.filter(author__username='bench_ratings_author').update(rating=0)
+
+        buffer = RatingBuffer()
+        seen = []
+
+        def buffered(post_id):
+            buffer.add(post_id, 1)
+            seen.append(post_id)
+            if len(seen) % window == 0:
+                buffer.flush()
+
+        elapsed, updates = self.burst(pairs, buffered, finish=buffer.flush)
+        self.report('buffered', len(pairs), elapsed, updates)
+
+        ratings = sum(Post.objects.filter(
+            author__username='bench_ratings_author'
+        ).values_list('rating', flat=True))
+        self.stdout.write(
+            f'speedup x{direct / elapsed:.2f}, '
+            f'{direct_updates - updates} UPDATEs saved, '
+            f'final ratings consistent: {ratings == len(pairs)}'
+        )
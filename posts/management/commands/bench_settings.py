@@ -0,0 +1,60 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from yatube import SETTINGS_MODULES
+
+
+class Command(BaseCommand):
+    help = (
+        'Run the same loadtest under the development and production '
+        'settings and compare them per view'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--prefix', default='seed')
+        parser.add_argument(
+            '--mix', default='index=60,follow=20,comment=10,like=10'
+        )
+
+    def loadtest(self, module, options):
+        # Settings are fixed once Django starts, so each run is a process
+        result = subprocess.run(
+            [
+                sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'),
+                'loadtest', '--json',
+                '--requests', str(options['requests']),
+                '--threads', str(options['threads']),
+                '--prefix', options['prefix'],
+                '--mix', options['mix'],
+            ],
+            env=dict(os.environ, DJANGO_SETTINGS_MODULE=module),
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            universal_newlines=True
+        )
+        if result.returncode:
+            raise CommandError(f'{module}: {result.stderr.strip()}')
+        return json.loads(result.stdout)['views']
+
+    def handle(self, *args, **options):
+        before = self.loadtest(SETTINGS_MODULES['development'], options)
+        after = self.loadtest(SETTINGS_MODULES['production'], options)
+        self.stdout.write(
+            f'{"view":<10} {"p50 dev":>9} {"p50 prod":>9} '
+            f'{"p95 dev":>9} {"p95 prod":>9} '
+            f'{"req/s dev":>10} {"req/s prod":>10} {"speedup":>8}'
+        )
+        for name, dev in before.items():
+            prod = after[name]
+            self.stdout.write(
+                f'{name:<10} {dev["p50"]:>9} {prod["p50"]:>9} '
+                f'{dev["p95"]:>9} {prod["p95"]:>9} '
+                f'{dev["rps"]:>10} {prod["rps"]:>10} '
+                f'{dev["p50"] / prod["p50"]:>7.2f}x'
+            )
@@ -0,0 +1,68 @@
+import time
+import uuid
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.template import engines
+from PIL import Image
+from sorl.thumbnail import delete
+
+from posts import tasks
+from posts.models import Post, User
+
+
+class Command(BaseCommand):
+    help = 'Measure first-render latency of a post card with a new image'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument('--width', type=int, default=4000)
+        parser.add_argument('--height', type=int, default=3000)
+
+    def upload(self, width, height):
+        data = BytesIO()
+        Image.new('RGB', (width, height), color='navy').save(data, 'JPEG')
+        name = f'posts/bench_{uuid.uuid4().hex}.jpg'
+        return default_storage.save(name, ContentFile(data.getvalue()))
+
+    def templates(self):
+        # The current card queues the resize; the old card, without
+        # lazy=True, resized inline during the render
+        engine = engines['django']
+        card = engine.get_template('includes/post_item.html')
+        source = card.template.source
+        return {
+            'inline': engine.from_string(source.replace(' lazy=True', '')),
+            'background': card,
+        }
+
+    def first_render(self, template, name):
+        post = Post(
+            pk=1, text='bench', author=User(username='bench'), image=name
+        )
+        started = time.perf_counter()
+        template.render({'post': post})
+        return (time.perf_counter() - started) * 1000
+
+    def handle(self, *args, **options):
+        templates = self.templates()
+        results = {mode: [] for mode in templates}
+        names = []
+        try:
+            for _ in range(options['runs']):
+                for mode, template in templates.items():
+                    name = self.upload(options['width'], options['height'])
+                    names.append(name)
+                    results[mode].append(self.first_render(template, name))
+            tasks.wait()
+        finally:
+            for name in names:
+                delete(name)
+        for mode, timings in results.items():
+            timings.sort()
+            self.stdout.write(
+                f'{mode:<11} median {timings[len(timings) // 2]:8.1f} ms  '
+                f'max {timings[-1]:8.1f} ms'
+            )
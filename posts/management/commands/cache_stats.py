@@ -0,0 +1,33 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Show cache hits, misses and evictions per key prefix'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset', action='store_true', help='Zero the counters'
+        )
+
+    def handle(self, *args, **options):
+        if not hasattr(cache, 'stats'):
+            raise CommandError(
+                'The default cache is not a posts.cache_backends.MeteredCache'
+            )
+        if options['reset']:
+            cache.reset_stats()
+            self.stdout.write(self.style.SUCCESS('Cache counters reset'))
+            return
+        stats = cache.stats()
+        self.stdout.write(
+            f'{"prefix":<40} {"hits":>10} {"misses":>10} '
+            f'{"evictions":>10} {"hit rate":>9}'
+        )
+        for prefix, row in sorted(stats.items()):
+            total = sum(row.values())
+            rate = row['hits'] / total if total else 0
+            self.stdout.write(
+                f'{prefix:<40} {row["hits"]:>10} {row["misses"]:>10} '
+                f'{row["evictions"]:>10} {rate:>9.1%}'
+            )
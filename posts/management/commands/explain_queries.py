@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from posts.models import Comment, Follow, Group, Post, User
+from posts.query_plans import collect_plans, view_urls
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Print EXPLAIN QUERY PLAN for the queries behind every feed view'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--problems-only', action='store_true',
+            help='Only print queries that scan a table or sort in memory'
+        )
+        parser.add_argument(
+            '--fail-on-scan', action='store_true',
+            help='Exit with an error if any query has a problem'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                found = self.run(options['problems_only'])
+                raise Rollback
+        except Rollback:
+            pass
+        if found and options['fail_on_scan']:
+            raise CommandError(f'{found} queries need an index')
+
+    def seed(self):
+        reader = User.objects.create(username='explain_reader')
+        author = User.objects.create(username='explain_author')
+        group = Group.objects.create(
+            title='explain', slug='explain-queries', description='explain'
+        )
+        Follow.objects.create(user=reader, author=author)
+        post = Post.objects.create(text='explain', author=author, group=group)
+        Comment.objects.create(post=post, author=reader, text='explain')
+        return reader, post, group
+
+    def run(self, problems_only):
+        reader, post, group = self.seed()
+        found = 0
+        plans = collect_plans(reader, view_urls(reader, post, group))
+        for name, queries in plans.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            for query in queries:
+                if problems_only and not query['problems']:
+                    continue
+                found += bool(query['problems'])
+                self.stdout.write(f'  {query["sql"]}')
+                for step in query['plan']:
+                    line = f'    {step}'
+                    if step in query['problems']:
+                        line = self.style.ERROR(line)
+                    self.stdout.write(line)
+        return found
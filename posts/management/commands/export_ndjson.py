@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.transfer import MODELS, export_ndjson
+
+
+class Command(BaseCommand):
+    help = (
+        'Stream posts, comments, follows, likes and profiles to a '
+        'newline-delimited JSON file in constant memory'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument(
+            '--models', default=','.join(MODELS),
+            help=f'Comma separated, out of {", ".join(MODELS)}'
+        )
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument(
+            '--resume', action='store_true',
+            help='Carry on from the checkpoint of an interrupted export'
+        )
+
+    def handle(self, *args, **options):
+        labels = options['models'].split(',')
+        unknown = set(labels) - set(MODELS)
+        if unknown:
+            raise CommandError(f'Unknown models: {", ".join(sorted(unknown))}')
+        throughput = export_ndjson(
+            options['path'],
+            labels=labels,
+            chunk_size=options['chunk_size'],
+            resume=options['resume'],
+            progress=self.progress if options['verbosity'] > 1 else None
+        )
+        for line in throughput.report():
+            self.stdout.write(line)
+
+    def progress(self, label, rows):
+        self.stderr.write(f'{label}: {rows} rows')
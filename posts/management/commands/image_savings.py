@@ -0,0 +1,88 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.images import report
+from posts.thumbnails import POST_THUMBNAIL
+
+EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp')
+
+
+def image_paths(paths):
+    for path in paths:
+        if os.path.isfile(path):
+            yield path
+            continue
+        for folder, _, names in os.walk(path):
+            for name in sorted(names):
+                if name.lower().endswith(EXTENSIONS):
+                    yield os.path.join(folder, name)
+
+
+def chosen(sizes, width):
+    # What srcset makes a browser download: the smallest that is wide
+    # enough, or the widest there is
+    wide_enough = [size for size in sorted(sizes) if size >= width]
+    return sizes[wide_enough[0] if wide_enough else max(sizes)]
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the bytes of uploaded images with the variants made from '
+        'them, for desktop and mobile layouts; writes nothing'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths', nargs='*',
+            help='Images or folders of them, MEDIA_ROOT/posts by default'
+        )
+        parser.add_argument('--geometry', default=POST_THUMBNAIL[0])
+        parser.add_argument('--desktop', type=int, default=960)
+        parser.add_argument('--mobile', type=int, default=480)
+
+    def handle(self, *args, **options):
+        paths = list(image_paths(
+            options['paths'] or [os.path.join(settings.MEDIA_ROOT, 'posts')]
+        ))
+        if not paths:
+            raise CommandError('No images found')
+        rows = report(paths, options['geometry'])
+        if len(rows) < len(paths):
+            self.stderr.write(self.style.WARNING(
+                f'Skipped {len(paths) - len(rows)} unreadable images'
+            ))
+        if not rows:
+            raise CommandError('No readable images found')
+        desktop, mobile = options['desktop'], options['mobile']
+        formats = list(rows[0][2])
+        columns = [
+            f'{name} {width}w'
+            for width in (desktop, mobile) for name in formats
+        ]
+        self.stdout.write(
+            f'{"image":<40} {"original":>10} '
+            + ' '.join(f'{column:>11}' for column in columns)
+        )
+        totals = [0] * (len(columns) + 1)
+        for path, original, variants in rows:
+            sizes = [original] + [
+                chosen(variants[name], width)
+                for width in (desktop, mobile) for name in formats
+            ]
+            totals = [total + size for total, size in zip(totals, sizes)]
+            self.stdout.write(
+                f'{os.path.basename(path)[:40]:<40} '
+                + ' '.join(f'{size / 1024:>10.1f}K' for size in sizes)
+            )
+        self.stdout.write(
+            f'{"total":<40} '
+            + ' '.join(f'{size / 1024:>10.1f}K' for size in totals)
+        )
+        self.stdout.write(
+            f'{"saved":<40} {"":>11} '
+            + ' '.join(
+                f'{1 - size / totals[0]:>11.1%}' for size in totals[1:]
+            )
+        )
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.transfer import import_ndjson
+
+
+class Command(BaseCommand):
+    help = (
+        'Load a file made by export_ndjson in bulk_create batches, '
+        'then rebuild counters, timelines, search and trending'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--resume', action='store_true',
+            help='Skip what the checkpoint of an interrupted import covers'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            throughput = import_ndjson(
+                options['path'],
+                batch_size=options['batch_size'],
+                resume=options['resume'],
+                progress=self.progress if options['verbosity'] > 1 else None
+            )
+        except (KeyError, ValueError) as error:
+            raise CommandError(f'Bad line in {options["path"]}: {error}')
+        for line in throughput.report():
+            self.stdout.write(line)
+
+    def progress(self, label, rows):
+        self.stderr.write(f'{label}: {rows} rows')
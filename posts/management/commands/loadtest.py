@@ -0,0 +1,250 @@
+import html
+import json
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from io import BytesIO
+from urllib.parse import urlencode
+from wsgiref.util import setup_testing_defaults
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+
+from posts.models import Post, User
+from posts.profiling import percentile
+
+MIX = 'index=60,follow=20,comment=10,like=10'
+
+# The pager's "next" link, ?page=N or ?after=<cursor> past the threshold
+NEXT_PAGE = re.compile(r'href="\?([^"]*)">Следующая')
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in Command.scenarios or not weight.isdigit():
+            raise CommandError(f'Bad --mix entry "{part}"')
+        mix[name] = int(weight)
+    return mix
+
+
+class Session:
+    """Cookies of one logged in visitor, made without the login form."""
+
+    def __init__(self, user):
+        client = Client()
+        client.force_login(user)
+        self.csrf = get_random_string(32)
+        self.cookie = '; '.join([
+            f'{settings.SESSION_COOKIE_NAME}='
+            f'{client.cookies[settings.SESSION_COOKIE_NAME].value}',
+            f'{settings.CSRF_COOKIE_NAME}={self.csrf}',
+        ])
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay a mix of feed reads, comments and likes against the WSGI '
+        'application in-process and report latency per view'
+    )
+    scenarios = ('index', 'follow', 'comment', 'like')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument(
+            '--mix', default=MIX, help=f'Weights per scenario, "{MIX}"'
+        )
+        parser.add_argument(
+            '--prefix', default='seed',
+            help='Log in as users made by seed_data with this prefix'
+        )
+        parser.add_argument('--sessions', type=int, default=50)
+        parser.add_argument('--random-seed', type=int, default=0)
+        parser.add_argument('--json', action='store_true')
+
+    def handle(self, *args, **options):
+        from yatube.wsgi import application
+        self.application = application
+        mix = parse_mix(options['mix'])
+        rng = random.Random(options['random_seed'])
+        # Readers who follow someone, so their feed is not empty
+        users = list(User.objects.filter(
+            username__startswith=f'{options["prefix"]}_user_',
+            follower__isnull=False
+        ).distinct()[:options['sessions']])
+        if not users:
+            raise CommandError(
+                f'No "{options["prefix"]}" users, run seed_data first'
+            )
+        self.sessions = [Session(user) for user in users]
+        self.posts = list(
+            Post.objects.order_by('-pub_date').values_list(
+                'author__username', 'pk'
+            )[:200]
+        )
+        self.index_pages = self.walk(reverse('index'), 5)
+        connection.close()
+        if settings.DEBUG:
+            self.stderr.write(self.style.WARNING(
+                'DEBUG is on, numbers will be worse than in production'
+            ))
+
+        results = defaultdict(list)
+        errors = defaultdict(int)
+        lock = threading.Lock()
+        per_thread = [
+            options['requests'] // options['threads']
+            + (i < options['requests'] % options['threads'])
+            for i in range(options['threads'])
+        ]
+
+        def worker(index, count):
+            local = random.Random(rng.random() + index)
+            names, weights = zip(*mix.items())
+            try:
+                for _ in range(count):
+                    name = local.choices(names, weights)[0]
+                    started = time.perf_counter()
+                    status = getattr(self, name)(local)
+                    elapsed = (time.perf_counter() - started) * 1000
+                    with lock:
+                        results[name].append(elapsed)
+                        if status >= 400:
+                            errors[name] += 1
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=worker, args=(i, count))
+            for i, count in enumerate(per_thread)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+
+        results['total'] = [
+            elapsed for name in mix for elapsed in results[name]
+        ]
+        errors['total'] = sum(errors.values())
+        report = {}
+        for name in list(mix) + ['total']:
+            latencies = sorted(results[name])
+            if not latencies:
+                continue
+            report[name] = {
+                'requests': len(latencies),
+                'errors': errors[name],
+                'rps': round(len(latencies) / wall, 1),
+                'p50': round(percentile(latencies, 50), 2),
+                'p95': round(percentile(latencies, 95), 2),
+                'p99': round(percentile(latencies, 99), 2),
+            }
+        if options['json']:
+            self.stdout.write(json.dumps({
+                'threads': options['threads'],
+                'seconds': round(wall, 3),
+                'views': report,
+            }, indent=2))
+            return
+        self.stdout.write(
+            f'{options["threads"]} threads, {wall:.2f}s\n'
+            f'{"view":<10} {"requests":>9} {"errors":>7} {"req/s":>8} '
+            f'{"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8}'
+        )
+        for name, row in report.items():
+            self.stdout.write(
+                f'{name:<10} {row["requests"]:>9} {row["errors"]:>7} '
+                f'{row["rps"]:>8} {row["p50"]:>8} {row["p95"]:>8} '
+                f'{row["p99"]:>8}'
+            )
+
+    def walk(self, path, depth):
+        # Queries of the first pages, found by following the "next" links
+        # as a reader would: past CURSOR_PAGINATION_THRESHOLD only the
+        # cursors they carry work, ?page=N is ignored
+        queries = ['']
+        while len(queries) < depth:
+            status, body = self.fetch(path, query=queries[-1])
+            found = NEXT_PAGE.search(body.decode())
+            if status >= 400 or found is None:
+                break
+            queries.append(html.unescape(found.group(1)))
+        return queries
+
+    def call(self, path, session=None, data=None, query=''):
+        return self.fetch(path, session, data, query)[0]
+
+    def fetch(self, path, session=None, data=None, query=''):
+        environ = {
+            'PATH_INFO': path,
+            'QUERY_STRING': query,
+            'SERVER_NAME': 'testserver',
+            # Not in INTERNAL_IPS, so no debug toolbar
+            'REMOTE_ADDR': '10.0.0.1',
+        }
+        if session is not None:
+            environ['HTTP_COOKIE'] = session.cookie
+        if data is not None:
+            data = dict(data, csrfmiddlewaretoken=session.csrf)
+            body = urlencode(data).encode()
+            environ.update({
+                'REQUEST_METHOD': 'POST',
+                'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+                'CONTENT_LENGTH': str(len(body)),
+                'wsgi.input': BytesIO(body),
+            })
+        setup_testing_defaults(environ)
+        statuses = []
+
+        def start_response(status, headers, exc_info=None):
+            statuses.append(int(status.split()[0]))
+
+        response = self.application(environ, start_response)
+        try:
+            body = b''.join(response)
+        finally:
+            if hasattr(response, 'close'):
+                response.close()
+        return statuses[0], body
+
+    def index(self, rng):
+        # Mostly the first page, sometimes a bit deeper
+        query = ''
+        if rng.random() >= 0.8 and len(self.index_pages) > 1:
+            query = rng.choice(self.index_pages[1:])
+        return self.call(reverse('index'), query=query)
+
+    def follow(self, rng):
+        return self.call(
+            reverse('follow_index'), session=rng.choice(self.sessions)
+        )
+
+    def comment(self, rng):
+        username, pk = rng.choice(self.posts)
+        return self.call(
+            reverse('add_comment', kwargs={
+                'username': username, 'post_id': pk
+            }),
+            session=rng.choice(self.sessions),
+            data={'text': 'load test comment'}
+        )
+
+    def like(self, rng):
+        username, pk = rng.choice(self.posts)
+        return self.call(
+            reverse('rating_plus', kwargs={
+                'username': username, 'post_id': pk
+            }),
+            session=rng.choice(self.sessions)
+        )
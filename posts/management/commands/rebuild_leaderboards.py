@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from posts.leaderboards import BOARDS, rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the author, group and post leaderboards in the cache; '
+        'only useful with a shared cache, YATUBE_CACHE=file or memcached'
+    )
+
+    def handle(self, *args, **options):
+        for name in BOARDS:
+            rebuild(name)
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {", ".join(BOARDS)} leaderboards'
+        ))
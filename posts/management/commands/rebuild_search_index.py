@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from posts.search import get_index, rebuild
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text index of posts, comments and groups'
+
+    def handle(self, *args, **options):
+        total = rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {total} documents with the {get_index().name} backend'
+        ))
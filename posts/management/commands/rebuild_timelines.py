@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Timeline
+from posts.timeline import rebuild_timelines
+
+
+class Command(BaseCommand):
+    help = 'Rebuild materialized follow timelines from follows and posts'
+
+    def handle(self, *args, **options):
+        rebuild_timelines()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {Timeline.objects.count()} timeline rows'
+        ))
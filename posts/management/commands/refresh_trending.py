@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts.trending import refresh
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the trending ranking from recent posts, comments and '
+        'likes; run it from cron if web processes are idle'
+    )
+
+    def handle(self, *args, **options):
+        ranked = refresh()
+        self.stdout.write(self.style.SUCCESS(f'Ranked {ranked} posts'))
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.models import User
+from posts.seed import SIZES, seed
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with a synthetic, reproducible social graph'
+
+    def add_arguments(self, parser):
+        for name, default in SIZES.items():
+            parser.add_argument(f'--{name}', type=int, default=default)
+        parser.add_argument(
+            '--prefix', default='seed',
+            help='Usernames, group slugs and texts start with it'
+        )
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument(
+            '--skew', type=float, default=0.5,
+            help='Power-law exponent of authorship and followers'
+        )
+        parser.add_argument(
+            '--bursts', type=int, default=50,
+            help='Spikes of activity most posts and comments fall into'
+        )
+        parser.add_argument('--random-seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}_user_').exists():
+            raise CommandError(
+                f'Users with the "{prefix}" prefix exist, pick another one'
+            )
+        if options['images'] > options['posts']:
+            raise CommandError('--images can not exceed --posts')
+        created = seed(
+            prefix=prefix,
+            days=options['days'],
+            skew=options['skew'],
+            bursts=options['bursts'],
+            random_seed=options['random_seed'],
+            **{name: options[name] for name in SIZES}
+        )
+        self.stdout.write(self.style.SUCCESS(', '.join(
+            f'{total} {name}' for name, total in created.items()
+        )))
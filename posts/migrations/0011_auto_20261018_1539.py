@@ -0,0 +1,37 @@
+# Generated by Django 2.2.6 on 2026-10-18 15:39
+
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def dedupe_preferences(apps, schema_editor):
+    Preference = apps.get_model('posts', 'Preference')
+    Post = apps.get_model('posts', 'Post')
+    duplicates = Preference.objects.values('user', 'post').annotate(
+        keep=Min('id'), total=Count('id')
+    ).filter(total__gt=1)
+    for row in duplicates:
+        Preference.objects.filter(
+            user=row['user'], post=row['post']
+        ).exclude(id=row['keep']).delete()
+    ratings = Preference.objects.values('post').annotate(total=Count('id'))
+    Post.objects.update(rating=0)
+    for row in ratings:
+        Post.objects.filter(pk=row['post']).update(rating=row['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0010_counter'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_preferences, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='preference',
+            unique_together={('user', 'post')},
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 2.2.6 on 2026-10-18 16:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def backdate_likes(apps, schema_editor):
+    # Likes from before this had no time: give them their post's, rather
+    # than the migration's, or every old post would look hot right now
+    Post = apps.get_model('posts', 'Post')
+    Preference = apps.get_model('posts', 'Preference')
+    Preference.objects.update(created=models.Subquery(
+        Post.objects.filter(pk=models.OuterRef('post_id')).values('pub_date')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Trending',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending', serialize=False, to='posts.Post')),
+                ('score', models.FloatField(verbose_name='Популярность')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='preference',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Время оценки'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backdate_likes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='trending',
+            index=models.Index(fields=['-score', '-post'], name='trending_score_idx'),
+        ),
+    ]
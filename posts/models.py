@@ -1,5 +1,7 @@
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 
 
 User = get_user_model()
@@ -14,6 +16,21 @@ class Group(models.Model):
         return str(self.title)
 
 
+class PostQuerySet(models.QuerySet):
+    def feed(self):
+        # Everything post_item.html needs in one statement
+        comment_count = Comment.objects.filter(
+            post=OuterRef('pk')
+        ).order_by().values('post').annotate(
+            total=Count('pk')
+        ).values('total')
+        return self.select_related('author', 'group').annotate(
+            comment_count=Coalesce(
+                Subquery(comment_count, output_field=IntegerField()), 0
+            )
+        )
+
+
 class Post(models.Model):
     text = models.TextField(
         verbose_name='Введите текст', help_text='Чем хотите поделиться?'
@@ -32,12 +49,16 @@ class Post(models.Model):
         blank=True, null=True,
         verbose_name='Изображение'
         )
+    # JSON written by posts.images.build(): the resized copies of image
+    image_variants = models.TextField(blank=True, default='', editable=False)
     rating = models.IntegerField(
         verbose_name="Рейтинг публикации",
         blank=True, null=True,
         default=0
     )
 
+    objects = PostQuerySet.as_manager()
+
     def __str__(self):
         text = self.text
         date = self.pub_date
@@ -47,6 +68,17 @@ class Post(models.Model):
 
     class Meta:
         ordering = ("-pub_date",)
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'], name='post_pub_date_id_idx'),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_date_idx'
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_date_idx'
+            ),
+        ]
 
 
 class Comment(models.Model):
@@ -70,6 +102,12 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ("-created",)
+        indexes = [
+            models.Index(
+                fields=['post', '-created', '-id'],
+                name='comment_post_page_idx'
+            ),
+        ]
 
 
 class Follow(models.Model):
@@ -107,7 +145,89 @@ class Profile_Author(models.Model):
         verbose_name='Ваша фотография',
         help_text='Она будет Вашим символом на этом сайте'
     )
+    image_variants = models.TextField(blank=True, default='', editable=False)
 
 class Preference(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='fun')
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='like')
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Время оценки'
+    )
+
+    class Meta:
+        unique_together = ['user', 'post']
+
+
+class Counter(models.Model):
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, related_name='counter'
+    )
+    followers = models.PositiveIntegerField(
+        verbose_name='Подписчиков', default=0
+    )
+    following = models.PositiveIntegerField(
+        verbose_name='Подписан', default=0
+    )
+    posts = models.PositiveIntegerField(
+        verbose_name='Количество публикаций', default=0
+    )
+
+
+class Timeline(models.Model):
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='timeline'
+    )
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, related_name='timeline'
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        ordering = ("-pub_date",)
+        unique_together = ['user', 'post']
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='timeline_user_feed_idx'
+            ),
+        ]
+
+
+class Trending(models.Model):
+    # Log of the decayed activity, see posts.trending
+    post = models.OneToOneField(
+        Post, on_delete=models.CASCADE, primary_key=True,
+        related_name='trending'
+    )
+    score = models.FloatField(verbose_name='Популярность')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-score', '-post'], name='trending_score_idx'),
+        ]
+
+
+class SearchDocument(models.Model):
+    # Only used when SQLite has no FTS5, see posts.search
+    kind = models.CharField(max_length=10)
+    object_id = models.PositiveIntegerField()
+    length = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['kind', 'object_id']
+
+
+class SearchTerm(models.Model):
+    document = models.ForeignKey(
+        SearchDocument, on_delete=models.CASCADE, related_name='terms'
+    )
+    term = models.CharField(max_length=64)
+    count = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['term', 'document'], name='search_term_document_idx'
+            ),
+        ]
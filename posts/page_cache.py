@@ -0,0 +1,144 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils.http import http_date
+
+from .cache import (
+    POSTS, bump_generation, get_generation, post_stamp, served_outdated, touch,
+    user_stamp
+)
+from .replicas import read_source
+
+# hit, stale or miss, for tests and anyone reading the headers
+CACHE_HEADER = 'X-Page-Cache'
+
+
+def _generation(path):
+    return f'page:{path}'
+
+
+def _key(request):
+    digest = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f'{read_source()}:page:{digest}'
+
+
+def purge(*paths):
+    """Make every cached page under these paths, any query, stale."""
+    bump_generation(*(_generation(path) for path in paths))
+
+
+def _post_paths(username, *slugs):
+    # The pages a post shows up on: the index, its author and its group
+    paths = [reverse('index'), reverse('profile', args=[username])]
+    paths += [reverse('group_posts', args=[slug]) for slug in slugs if slug]
+    return paths
+
+
+def purge_post(username, *slugs):
+    purge(*_post_paths(username, *slugs))
+
+
+def invalidate(*instances):
+    """Posts and profiles whose pages changed with no save of theirs,
+    e.g. once the files made from their image exist.
+
+    However many there are, POSTS is bumped once and every page purged
+    once; authors and groups are expected to be selected with them.
+    """
+    names, paths = set(), set()
+    for instance in instances:
+        username = instance.author.username
+        if instance._meta.label_lower == 'posts.post':
+            names.update((POSTS, post_stamp(instance.pk)))
+            paths.update(_post_paths(
+                username, instance.group.slug if instance.group_id else None
+            ))
+        else:
+            names.add(user_stamp(username))
+            paths.add(reverse('profile', args=[username]))
+    if POSTS in names:
+        bump_generation(POSTS)
+    if names:
+        touch(*names)
+        purge(*paths)
+
+
+def _served(response, state):
+    response[CACHE_HEADER] = state
+    return response
+
+
+def _wait(key, generation):
+    # Someone else renders the page: pick up theirs rather than render too
+    deadline = time.monotonic() + settings.PAGE_CACHE_LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(settings.PAGE_CACHE_POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None and entry['generation'] == generation:
+            return entry['response']
+    return None
+
+
+def anonymous_page_cache(view):
+    """Serves a GET view to logged-out visitors from the cache.
+
+    Anonymous pages are the same for everybody, so the whole response
+    is kept per path and query for PAGE_CACHE_TTL seconds, or until
+    purge() bumps the path's generation. One request re-renders a page
+    that expired or was purged, under a lock: meanwhile the others get
+    the previous copy, or wait for the new one when there is none.
+    """
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if (
+            not settings.PAGE_CACHE_TTL
+            or request.method not in ('GET', 'HEAD')
+            or request.user.is_authenticated
+        ):
+            return view(request, *args, **kwargs)
+        key = _key(request)
+        generation = get_generation(_generation(request.path))
+        entry = cache.get(key)
+        if (
+            entry is not None
+            and entry['generation'] == generation
+            and entry['expires'] > time.time()
+        ):
+            return _served(entry['response'], 'hit')
+        if not cache.add(f'{key}:lock', 1, settings.PAGE_CACHE_LOCK_TIMEOUT):
+            if entry is not None:
+                return _served(entry['response'], 'stale')
+            response = _wait(key, generation)
+            if response is not None:
+                return _served(response, 'hit')
+            return _served(view(request, *args, **kwargs), 'miss')
+        try:
+            response = view(request, *args, **kwargs)
+            # Cookies would leak one visitor's session or token to all;
+            # a page with outdated fragments would outlive them
+            if (
+                response.status_code == 200
+                and not response.cookies
+                and not served_outdated()
+            ):
+                # The validators of the state it was rendered from go with
+                # the copy; the current ones would outlive its body
+                validators = getattr(request, 'validators', None)
+                if validators is not None:
+                    response['ETag'] = validators[0]
+                    response['Last-Modified'] = http_date(validators[1])
+                cache.set(key, {
+                    'generation': generation,
+                    'expires': time.time() + settings.PAGE_CACHE_TTL,
+                    'response': response,
+                }, settings.PAGE_CACHE_TTL * 2)
+        finally:
+            cache.delete(f'{key}:lock')
+        return _served(response, 'miss')
+
+    return wrapper
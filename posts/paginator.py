@@ -0,0 +1,194 @@
+import base64
+import binascii
+from datetime import datetime
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import SimpleLazyObject
+
+
+def encode_cursor(value, pk):
+    # value is the date of a feed, or the float score of a ranking
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = f'{value!r}|{pk}' if isinstance(value, float) else f'{value}|{pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, parse=parse_datetime):
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        value, pk = raw.rsplit('|', 1)
+        value = parse(value)
+        pk = int(pk)
+    except (ValueError, UnicodeDecodeError, binascii.Error):
+        return None
+    if value is None:
+        return None
+    return value, pk
+
+
+class CursorPage:
+    is_cursor = True
+    number = None
+
+    def __init__(self, object_list, has_next, has_previous, key):
+        self.object_list = object_list
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.key = key
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __repr__(self):
+        return f'<Cursor page of {len(self)} items>'
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if not self._has_next or not self.object_list:
+            return None
+        last = self.object_list[-1]
+        return encode_cursor(*(getattr(last, field) for field in self.key))
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous or not self.object_list:
+            return None
+        first = self.object_list[0]
+        return encode_cursor(*(getattr(first, field) for field in self.key))
+
+
+class CursorPaginator:
+    """Seek pagination over a (date, id) key, newest first.
+
+    Pages are addressed by opaque ``after``/``before`` tokens instead of
+    page numbers, so no COUNT(*) or OFFSET is ever issued. ``key`` names
+    the two fields to seek on; they need a matching index. ``parse``
+    reads the first one back from a token, e.g. float for a score.
+    """
+    is_cursor = True
+    page_range = ()
+
+    def __init__(self, object_list, per_page, key=('pub_date', 'pk'),
+                 parse=parse_datetime):
+        self.object_list = object_list
+        self.per_page = per_page
+        self.key = key
+        self.parse = parse
+
+    def seek(self, cursor, direction):
+        date, pk = cursor
+        date_field, pk_field = self.key
+        return self.object_list.filter(
+            Q(**{f'{date_field}__{direction}': date})
+            | Q(**{date_field: date, f'{pk_field}__{direction}': pk})
+        )
+
+    def get_page(self, after=None, before=None):
+        after = decode_cursor(after, self.parse)
+        before = decode_cursor(before, self.parse) if after is None else None
+        date_field, pk_field = self.key
+        if before is not None:
+            rows = list(
+                self.seek(before, 'gt').order_by(
+                    date_field, pk_field
+                )[:self.per_page + 1]
+            )
+            # Nothing newer, e.g. those posts were deleted or the token is
+            # stale: the first page is where it leads
+            if rows:
+                has_previous = len(rows) > self.per_page
+                rows = rows[:self.per_page]
+                rows.reverse()
+                return CursorPage(
+                    rows, has_next=True, has_previous=has_previous,
+                    key=self.key
+                )
+        queryset = self.object_list
+        if after is not None:
+            queryset = self.seek(after, 'lt')
+        rows = list(
+            queryset.order_by(
+                f'-{date_field}', f'-{pk_field}'
+            )[:self.per_page + 1]
+        )
+        has_next = len(rows) > self.per_page
+        return CursorPage(
+            rows[:self.per_page],
+            has_next=has_next,
+            has_previous=after is not None,
+            key=self.key
+        )
+
+
+def bounded_count(object_list):
+    # Never looks at more than threshold + 1 rows
+    threshold = settings.CURSOR_PAGINATION_THRESHOLD
+    bounded = object_list.order_by().values('pk')[:threshold + 1]
+    count = bounded.count()
+    return count if count <= threshold else None
+
+
+def paginate(request, object_list, per_page, key=('pub_date', 'pk'),
+             parse=parse_datetime):
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    count = None
+    if not (after or before):
+        count = bounded_count(object_list)
+    if count is None:
+        paginator = CursorPaginator(object_list, per_page, key, parse)
+        # Fetched on first use, so a cached fragment that shows the page
+        # never runs the query
+        return paginator, SimpleLazyObject(
+            lambda: paginator.get_page(after=after, before=before)
+        )
+    paginator = Paginator(object_list, per_page)
+    # The bounded count is exact for small feeds; skip Paginator's own
+    paginator.count = count
+    return paginator, paginator.get_page(request.GET.get('page'))
+
+
+def cursor_slice(object_list, per_page, after=None, key=('pub_date', 'pk')):
+    """One page of ``object_list``, newest first, as a list.
+
+    Returns it with the token of the next page, or None on the last one.
+    Only for going forward, e.g. "show older" links.
+    """
+    paginator = CursorPaginator(object_list, per_page, key)
+    date_field, pk_field = key
+    cursor = decode_cursor(after)
+    if cursor is not None:
+        object_list = paginator.seek(cursor, 'lt')
+    # One row more than the page, as in get_page(), tells whether there
+    # is a next one without asking again
+    rows = list(object_list.order_by(
+        f'-{date_field}', f'-{pk_field}'
+    )[:per_page + 1])
+    if len(rows) <= per_page:
+        return rows, None
+    last = rows[per_page - 1]
+    return rows[:per_page], encode_cursor(
+        getattr(last, date_field), getattr(last, pk_field)
+    )
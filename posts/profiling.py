@@ -0,0 +1,181 @@
+import json
+import logging
+import math
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_lock = threading.Lock()
+# view name -> recent samples, newest last
+_samples = defaultdict(lambda: deque(maxlen=settings.PROFILING_WINDOW))
+_recorded = 0
+METRICS = ('total_ms', 'sql_ms', 'queries', 'template_ms', 'cache_hits')
+
+
+def percentile(ordered, share):
+    # Nearest rank, on an already sorted list
+    rank = max(math.ceil(share / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def current():
+    """The Profile of the request being handled by this thread, if any."""
+    return getattr(_local, 'profile', None)
+
+
+class Profile:
+    def __init__(self):
+        self.queries = []
+        self.sql_ms = 0
+        self.template_ms = 0
+        self.template_depth = 0
+        self.cache = defaultdict(int)
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            self.sql_ms += elapsed
+            self.queries.append((elapsed, sql))
+
+    def worst_queries(self):
+        worst = sorted(self.queries, reverse=True)
+        return [
+            {'ms': round(elapsed, 2), 'sql': sql}
+            for elapsed, sql in worst[:settings.PROFILING_TRACE_QUERIES]
+        ]
+
+
+def cache_event(event):
+    # Called by MeteredCache for hits, misses and evictions
+    profile = current()
+    if profile is not None:
+        profile.cache[event] += 1
+
+
+class ProfiledTemplate(Template):
+    def render(self, context=None, request=None):
+        profile = current()
+        if profile is None:
+            return super().render(context, request)
+        # Only the outermost render counts, nested ones are inside it
+        profile.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            profile.template_depth -= 1
+            if not profile.template_depth:
+                profile.template_ms += (time.perf_counter() - started) * 1000
+
+
+class ProfilingTemplates(DjangoTemplates):
+    """DjangoTemplates whose templates report their render time."""
+
+    def from_string(self, template_code):
+        return ProfiledTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return ProfiledTemplate(template.template, self)
+
+
+def record(view, sample):
+    global _recorded
+    with _lock:
+        _samples[view].append(sample)
+        _recorded += 1
+        due = not _recorded % settings.PROFILING_REPORT_EVERY
+    if due:
+        logger.info('Request profile %s', json.dumps(stats(), sort_keys=True))
+
+
+def stats():
+    """Rolling p50/p95/p99 of every metric per view, from this process."""
+    with _lock:
+        samples = {view: list(rows) for view, rows in _samples.items()}
+    report = {}
+    for view, rows in samples.items():
+        report[view] = {'requests': len(rows)}
+        for metric in METRICS:
+            values = sorted(row[metric] for row in rows)
+            report[view][metric] = {
+                f'p{share}': round(percentile(values, share), 2)
+                for share in (50, 95, 99)
+            }
+    return report
+
+
+def reset_stats():
+    with _lock:
+        _samples.clear()
+
+
+def dump_trace(trace):
+    line = json.dumps(trace, sort_keys=True)
+    if settings.PROFILING_TRACE_FILE:
+        with _lock, open(settings.PROFILING_TRACE_FILE, 'a') as traces:
+            traces.write(line + '\n')
+    else:
+        logger.warning('Slow request %s', line)
+
+
+class ProfilingMiddleware:
+    """Times a sample of requests: total, SQL, template render, cache.
+
+    PROFILING_SAMPLE_RATE of the requests are measured and kept in a
+    rolling window per view, see stats(), which is also logged every
+    PROFILING_REPORT_EVERY samples. Measured requests slower than
+    PROFILING_SLOW_MS are dumped with their worst queries.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.PROFILING_SAMPLE_RATE:
+            return self.get_response(request)
+        profile = _local.profile = Profile()
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile))
+                response = self.get_response(request)
+        finally:
+            _local.profile = None
+        total_ms = (time.perf_counter() - started) * 1000
+        match = request.resolver_match
+        view = match.view_name if match else '<unresolved>'
+        record(view, {
+            'total_ms': total_ms,
+            'sql_ms': profile.sql_ms,
+            'queries': len(profile.queries),
+            'template_ms': profile.template_ms,
+            'cache_hits': profile.cache['hits'],
+        })
+        if total_ms >= settings.PROFILING_SLOW_MS:
+            dump_trace({
+                'view': view,
+                'path': request.get_full_path(),
+                'method': request.method,
+                'status': response.status_code,
+                'total_ms': round(total_ms, 2),
+                'sql_ms': round(profile.sql_ms, 2),
+                'queries': len(profile.queries),
+                'template_ms': round(profile.template_ms, 2),
+                'cache': dict(profile.cache),
+                'worst_queries': profile.worst_queries(),
+            })
+        return response
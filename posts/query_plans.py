@@ -0,0 +1,69 @@
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+# Small lookup tables where a scan is cheaper than an index
+SCAN_ALLOWED = {'django_site', 'django_flatpage', 'posts_group'}
+
+
+def view_urls(user, post, group):
+    username = user.username
+    author = post.author.username
+    return {
+        'index': reverse('index'),
+        'follow_index': reverse('follow_index'),
+        'group': reverse('group'),
+        'group_posts': reverse('group_posts', kwargs={'slug': group.slug}),
+        'profile': reverse('profile', kwargs={'username': author}),
+        'post': reverse(
+            'post', kwargs={'username': author, 'post_id': post.pk}
+        ),
+        'following_view': reverse(
+            'following_view', kwargs={'username': username}
+        ),
+        'follower_view': reverse(
+            'follower_view', kwargs={'username': username}
+        ),
+    }
+
+
+def explain(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def problems(plan, tables):
+    found = []
+    for step in plan:
+        words = step.split()
+        if words[0] == 'SCAN' and 'INDEX' not in words:
+            table = words[2] if words[1] == 'TABLE' else words[1]
+            # Scans of subqueries and CTEs are not table scans
+            if table in tables and table not in SCAN_ALLOWED:
+                found.append(step)
+        elif 'TEMP B-TREE' in step and 'ORDER BY' in step:
+            found.append(step)
+    return found
+
+
+def collect_plans(user, urls):
+    client = Client()
+    client.force_login(user)
+    tables = set(connection.introspection.table_names())
+    plans = {}
+    for name, url in urls.items():
+        with CaptureQueriesContext(connection) as queries:
+            client.get(url)
+        plans[name] = []
+        for query in queries.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT'):
+                continue
+            # captured SQL has parameters inlined, which SQLite accepts
+            plan = explain(sql, ())
+            plans[name].append({
+                'sql': sql, 'plan': plan, 'problems': problems(plan, tables)
+            })
+    return plans
@@ -0,0 +1,100 @@
+import atexit
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Coalesce
+
+from .cache import LIKES, bump_generation, post_stamp, touch
+from .models import Post
+
+
+logger = logging.getLogger(__name__)
+
+
+def apply_ratings(deltas):
+    # One UPDATE for the whole batch, touching only the rating column
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if not deltas:
+        return 0
+    return Post.objects.filter(pk__in=deltas).update(
+        rating=Coalesce(F('rating'), 0) + Case(
+            *[When(pk=pk, then=Value(delta)) for pk, delta in deltas.items()],
+            default=Value(0),
+            output_field=IntegerField()
+        )
+    )
+
+
+class RatingBuffer:
+    """Coalesces rating deltas in memory and writes them in batches."""
+
+    def __init__(self):
+        self.deltas = defaultdict(int)
+        self.lock = threading.Lock()
+        self.worker = None
+        self.wakeup = threading.Event()
+
+    def add(self, post_id, delta):
+        with self.lock:
+            self.deltas[post_id] += delta
+
+    def pending(self):
+        with self.lock:
+            return dict(self.deltas)
+
+    def flush(self):
+        with self.lock:
+            deltas, self.deltas = self.deltas, defaultdict(int)
+        if not deltas:
+            return 0
+        try:
+            with transaction.atomic():
+                updated = apply_ratings(deltas)
+        except Exception:
+            # Put the batch back so the next flush retries it
+            with self.lock:
+                for pk, delta in deltas.items():
+                    self.deltas[pk] += delta
+            raise
+        # The new ratings are only visible now
+        touch(LIKES, *(post_stamp(pk) for pk in deltas))
+        bump_generation(LIKES)
+        return updated
+
+    def start(self):
+        if self.worker is not None:
+            return
+        with self.lock:
+            if self.worker is None:
+                self.worker = threading.Thread(
+                    target=self.run, name='rating-flush', daemon=True
+                )
+                self.worker.start()
+
+    def run(self):
+        while not self.wakeup.wait(settings.RATING_FLUSH_INTERVAL):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Rating flush failed, will retry')
+            finally:
+                connection.close()
+
+
+buffer = RatingBuffer()
+atexit.register(buffer.flush)
+
+
+def change_rating(post_id, delta):
+    if settings.RATING_BUFFER:
+        # Only once the like itself is saved, a rolled back one must not
+        # reach the next flush
+        transaction.on_commit(lambda: buffer.add(post_id, delta))
+        buffer.start()
+    else:
+        apply_ratings({post_id: delta})
+        bump_generation(LIKES)
@@ -0,0 +1,83 @@
+import random
+import threading
+from functools import wraps
+
+from django.conf import settings
+
+# Set for a while after a visitor writes, so they read their own writes
+# from the primary until the replicas have caught up
+PIN_COOKIE = 'replica_pin'
+
+_local = threading.local()
+
+
+def current_state():
+    return getattr(_local, 'state', None)
+
+
+def replica_for_read():
+    """The replica this request reads from, None for the default rules."""
+    state = current_state()
+    if state is None or not settings.DATABASE_REPLICAS:
+        return None
+    if state['wrote']:
+        return 'default'
+    return state['replica']
+
+
+def read_source():
+    # Where this request's reads go. Output rendered from a lagging
+    # replica is cached apart, so it never reaches a pinned writer.
+    return replica_for_read() or 'default'
+
+
+def reads_own_writes():
+    state = current_state()
+    return state is not None and (state['pinned'] or state['wrote'])
+
+
+def note_write():
+    state = current_state()
+    if state is not None:
+        state['wrote'] = True
+
+
+def replica_reads(view):
+    """Lets a read-only view read from one of DATABASE_REPLICAS."""
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        state = current_state()
+        replicas = settings.DATABASE_REPLICAS
+        if state is None or state['pinned'] or not replicas:
+            return view(request, *args, **kwargs)
+        state['replica'] = random.choice(replicas)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            state['replica'] = None
+
+    return wrapper
+
+
+class ReplicaMiddleware:
+    """Tracks writes per request and pins the writer to the primary."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = _local.state = {
+            'pinned': PIN_COOKIE in request.COOKIES,
+            'replica': None,
+            'wrote': False,
+        }
+        try:
+            response = self.get_response(request)
+        finally:
+            _local.state = None
+        if state['wrote'] and settings.DATABASE_REPLICAS:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=settings.REPLICA_STICKY_SECONDS
+            )
+        return response
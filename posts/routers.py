@@ -0,0 +1,66 @@
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from . import replicas
+
+READ_DB_ALIAS = 'read'
+
+
+class ReplicaRouter:
+    """Sends reads of replica_reads views to a replica.
+
+    Sessions, reads inside a transaction and everything after the
+    request's first write go to the primary, and so does everything
+    while the visitor is pinned there by an earlier write.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == 'sessions':
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return replicas.replica_for_read()
+
+    def db_for_write(self, model, **hints):
+        replicas.note_write()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if {obj1._state.db, obj2._state.db} <= aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return False if db in settings.DATABASE_REPLICAS else None
+
+
+class ReadWriteRouter:
+    """Sends reads to the read-only connection when SQLite is tuned.
+
+    Reads inside a transaction stay on the default connection, which is
+    the only one that sees the transaction's own writes.
+    """
+
+    def tuned(self):
+        return settings.SQLITE_TUNING and READ_DB_ALIAS in connections
+
+    def db_for_read(self, model, **hints):
+        if not self.tuned():
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return READ_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS if self.tuned() else None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, READ_DB_ALIAS}
+        if {obj1._state.db, obj2._state.db} <= aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Same file as the default database
+        return False if db == READ_DB_ALIAS else None
@@ -0,0 +1,284 @@
+import math
+import re
+from collections import Counter, defaultdict
+from functools import lru_cache
+
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Avg, Count
+
+from .models import Comment, Group, Post
+
+# What is searchable: kind -> (model, text field)
+DOCUMENTS = {
+    'post': ('Post', 'text'),
+    'comment': ('Comment', 'text'),
+    'group': ('Group', 'title'),
+}
+FTS_TABLE = 'posts_search'
+WORD = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return [word for word in WORD.findall(text.lower()) if len(word) > 1]
+
+
+@lru_cache(maxsize=None)
+def fts5_available(using=DEFAULT_DB_ALIAS):
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        return ('ENABLE_FTS5',) in cursor.fetchall()
+
+
+class FTS5Index:
+    """SQLite's own full-text index, ranked by bm25().
+
+    The rowid encodes the kind and the object id, so an update is a
+    single INSERT OR REPLACE and a delete a rowid lookup.
+    """
+    name = 'fts5'
+    kinds = list(DOCUMENTS)
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.connection = connections[using]
+
+    def rowid(self, kind, pk):
+        return pk * len(self.kinds) + self.kinds.index(kind)
+
+    def create(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+                f"body, tokenize = 'unicode61 remove_diacritics 2')"
+            )
+
+    def drop(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+
+    def add_many(self, kind, rows):
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT OR REPLACE INTO {FTS_TABLE} (rowid, body) '
+                f'VALUES (%s, %s)',
+                [(self.rowid(kind, pk), text) for pk, text in rows]
+            )
+
+    def remove(self, kind, pk):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                [self.rowid(kind, pk)]
+            )
+
+    def search(self, terms, kinds, limit):
+        # Every term quoted, so user input is never FTS5 syntax
+        match = ' '.join(
+            '"{}"'.format(term.replace('"', '""')) for term in terms
+        )
+        codes = [self.kinds.index(kind) for kind in kinds]
+        placeholders = ', '.join(['%s'] * len(codes))
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid, -bm25({FTS_TABLE}) AS score '
+                f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                f'AND rowid %% {len(self.kinds)} IN ({placeholders}) '
+                f'ORDER BY score DESC LIMIT %s',
+                [match, *codes, limit]
+            )
+            return [
+                (
+                    self.kinds[rowid % len(self.kinds)],
+                    rowid // len(self.kinds),
+                    score
+                )
+                for rowid, score in cursor.fetchall()
+            ]
+
+
+class InvertedIndex:
+    """Term -> document postings in ordinary tables, ranked in Python.
+
+    Used where SQLite lacks FTS5. Scores are BM25, like FTS5's bm25().
+    """
+    name = 'python'
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self, apps=global_apps, using=DEFAULT_DB_ALIAS):
+        self.documents = apps.get_model(
+            'posts', 'SearchDocument'
+        ).objects.db_manager(using)
+        self.terms = apps.get_model(
+            'posts', 'SearchTerm'
+        ).objects.db_manager(using)
+
+    def create(self):
+        pass
+
+    def drop(self):
+        pass
+
+    def clear(self):
+        self.documents.all().delete()
+
+    def add_many(self, kind, rows):
+        rows = list(rows)
+        self.documents.filter(
+            kind=kind, object_id__in=[pk for pk, _ in rows]
+        ).delete()
+        counts = {pk: Counter(tokenize(text)) for pk, text in rows}
+        self.documents.bulk_create(
+            (
+                self.documents.model(
+                    kind=kind, object_id=pk, length=sum(terms.values())
+                )
+                for pk, terms in counts.items()
+            ),
+            batch_size=500
+        )
+        ids = dict(self.documents.filter(
+            kind=kind, object_id__in=list(counts)
+        ).values_list('object_id', 'pk'))
+        self.terms.bulk_create(
+            (
+                self.terms.model(
+                    document_id=ids[pk], term=term[:64], count=count
+                )
+                for pk, terms in counts.items()
+                for term, count in terms.items()
+            ),
+            batch_size=500
+        )
+
+    def remove(self, kind, pk):
+        self.documents.filter(kind=kind, object_id=pk).delete()
+
+    def search(self, terms, kinds, limit):
+        stats = self.documents.aggregate(
+            total=Count('pk'), average=Avg('length')
+        )
+        total, average = stats['total'], stats['average']
+        if not total:
+            return []
+        # Cut like the indexed terms, or a long word would never match
+        terms = [term[:64] for term in terms]
+        postings = self.terms.filter(
+            term__in=terms, document__kind__in=kinds
+        ).values_list(
+            'term', 'count', 'document__kind', 'document__object_id',
+            'document__length'
+        )
+        found = defaultdict(dict)
+        frequency = Counter()
+        for term, count, kind, pk, length in postings.iterator():
+            found[(kind, pk, length)][term] = count
+            frequency[term] += 1
+        scores = []
+        for (kind, pk, length), counts in found.items():
+            if len(counts) < len(set(terms)):
+                continue  # every term must match, as in FTS5
+            score = 0
+            for term, count in counts.items():
+                idf = math.log(
+                    1 + (total - frequency[term] + 0.5)
+                    / (frequency[term] + 0.5)
+                )
+                norm = self.k1 * (1 - self.b + self.b * length / average)
+                score += idf * count * (self.k1 + 1) / (count + norm)
+            scores.append((kind, pk, score))
+        scores.sort(key=lambda hit: -hit[2])
+        return scores[:limit]
+
+
+def get_index(apps=global_apps, using=DEFAULT_DB_ALIAS):
+    backend = settings.SEARCH_BACKEND
+    if backend == 'auto':
+        backend = 'fts5' if fts5_available(using) else 'python'
+    if backend == 'fts5':
+        return FTS5Index(using)
+    return InvertedIndex(apps, using)
+
+
+def documents(kind, queryset):
+    _, field = DOCUMENTS[kind]
+    return queryset.values_list('pk', field).iterator()
+
+
+def rebuild(apps=global_apps, batch_size=500, using=DEFAULT_DB_ALIAS):
+    # A migration passes the alias of its schema editor's connection
+    index = get_index(apps, using)
+    total = 0
+    with transaction.atomic(using=using):
+        index.create()
+        index.clear()
+        for kind, (model_name, field) in DOCUMENTS.items():
+            model = apps.get_model('posts', model_name)
+            batch = []
+            for row in documents(kind, model.objects.using(using)):
+                batch.append(row)
+                if len(batch) == batch_size:
+                    index.add_many(kind, batch)
+                    total += len(batch)
+                    batch = []
+            index.add_many(kind, batch)
+            total += len(batch)
+    return total
+
+
+def update(instance):
+    kind = kind_of(instance)
+    _, field = DOCUMENTS[kind]
+    get_index().add_many(kind, [(instance.pk, getattr(instance, field))])
+
+
+def remove(instance):
+    get_index().remove(kind_of(instance), instance.pk)
+
+
+def kind_of(instance):
+    name = type(instance).__name__
+    return next(
+        kind for kind, (model_name, _) in DOCUMENTS.items()
+        if model_name == name
+    )
+
+
+def find(query, kinds=None, limit=None):
+    """Ranked (kind, pk, score) hits for all the words of ``query``."""
+    terms = tokenize(query)
+    if not terms:
+        return []
+    kinds = list(kinds or DOCUMENTS)
+    return get_index().search(
+        terms, kinds, limit or settings.SEARCH_MAX_RESULTS
+    )
+
+
+def results(hits):
+    """The objects behind ``hits`` as (kind, object), in rank order.
+
+    One query per kind; hits whose object is gone are skipped.
+    """
+    querysets = {
+        'post': Post.objects.feed(),
+        'comment': Comment.objects.select_related('author', 'post__author'),
+        'group': Group.objects.all(),
+    }
+    wanted = defaultdict(list)
+    for kind, pk, _ in hits:
+        wanted[kind].append(pk)
+    found = {
+        kind: querysets[kind].in_bulk(pks) for kind, pks in wanted.items()
+    }
+    return [
+        (kind, found[kind][pk]) for kind, pk, _ in hits if pk in found[kind]
+    ]
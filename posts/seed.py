@@ -0,0 +1,204 @@
+import random
+from datetime import timedelta
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from PIL import Image
+
+from .counters import counted_users
+from .models import Comment, Counter, Follow, Group, Post, Preference, User
+from .search import rebuild as rebuild_search
+from .timeline import rebuild_timelines
+from .trending import refresh as refresh_trending
+
+
+# A mid-sized yatube: enough rows that a missing index or an N+1 shows
+SIZES = {
+    'users': 2000,
+    'groups': 20,
+    'posts': 5000,
+    'comments': 10000,
+    'follows': 10000,
+    'likes': 10000,
+    'images': 0,
+}
+
+
+def timestamps(count, days, rng, bursts=0):
+    """Random moments over the last ``days``, oldest first.
+
+    With ``bursts``, most of them cluster in that many short spikes of
+    activity, the way posting really happens, instead of spreading out.
+    """
+    period = days * 86400
+    centers = [rng.randrange(period) for _ in range(bursts)]
+    now = timezone.now()
+    seconds = []
+    for _ in range(count):
+        if centers and rng.random() < 0.8:
+            ago = rng.choice(centers) + rng.expovariate(1 / 600)
+        else:
+            ago = rng.randrange(period)
+        seconds.append(min(ago, period))
+    seconds.sort(reverse=True)
+    return [now - timedelta(seconds=ago) for ago in seconds]
+
+
+def backdate(model, field, pks, moments):
+    # bulk_create stamps auto_now_add fields with the current time;
+    # executemany is much cheaper than bulk_update's CASE for this
+    quote = connection.ops.quote_name
+    rows = [
+        (connection.ops.adapt_datetimefield_value(moment), pk)
+        for pk, moment in zip(pks, moments)
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'UPDATE {quote(model._meta.db_table)} SET {quote(field)} = %s '
+            f'WHERE {quote(model._meta.pk.column)} = %s',
+            rows
+        )
+
+
+def attach_images(post_ids, prefix, rng):
+    for pk in post_ids:
+        data = BytesIO()
+        color = tuple(rng.randrange(256) for _ in range(3))
+        Image.new('RGB', (1200, 800), color=color).save(data, 'JPEG')
+        name = default_storage.save(
+            f'posts/{prefix}_{pk}.jpg', ContentFile(data.getvalue())
+        )
+        Post.objects.filter(pk=pk).update(image=name)
+
+
+@transaction.atomic
+def seed(prefix='seed', days=365, skew=0.5, bursts=0, random_seed=0,
+         **sizes):
+    """Fill the database with a random but reproducible social graph.
+
+    Authorship and followers follow a power law with exponent ``skew``.
+    Counters and timelines are rebuilt at the end, since bulk_create
+    skips the signals that normally keep them up to date.
+    """
+    sizes = dict(SIZES, **sizes)
+    rng = random.Random(random_seed)
+    User.objects.bulk_create(
+        User(username=f'{prefix}_user_{i}', password='!')
+        for i in range(sizes['users'])
+    )
+    users = list(User.objects.filter(
+        username__startswith=f'{prefix}_user_'
+    ).values_list('pk', flat=True))
+    Group.objects.bulk_create(
+        Group(
+            title=f'{prefix} group {i}',
+            slug=f'{prefix}-group-{i}',
+            description=f'{prefix} group {i}'
+        )
+        for i in range(sizes['groups'])
+    )
+    groups = list(Group.objects.filter(
+        slug__startswith=f'{prefix}-group-'
+    ).values_list('pk', flat=True)) + [None]
+
+    # Long-tailed: a few prolific, popular authors and many quiet ones
+    popularity = [(i + 1) ** -skew for i in range(len(users))]
+    authors = rng.choices(users, weights=popularity, k=sizes['posts'])
+    posts = [
+        Post(
+            text=f'{prefix} post {i}',
+            author_id=author,
+            group_id=rng.choice(groups)
+        )
+        for i, author in enumerate(authors)
+    ]
+    Post.objects.bulk_create(posts, batch_size=500)
+    post_ids = list(Post.objects.filter(
+        author_id__in=users, text__startswith=f'{prefix} post '
+    ).values_list('pk', flat=True))
+    backdate(
+        Post, 'pub_date', post_ids,
+        timestamps(len(post_ids), days, rng, bursts)
+    )
+    attach_images(rng.sample(post_ids, sizes['images']), prefix, rng)
+
+    comments = [
+        Comment(
+            post_id=rng.choice(post_ids),
+            author_id=rng.choice(users),
+            text=f'{prefix} comment {i}'
+        )
+        for i in range(sizes['comments'])
+    ]
+    Comment.objects.bulk_create(comments, batch_size=500)
+    comments = list(Comment.objects.filter(
+        post_id__in=post_ids
+    ).values_list('pk', flat=True))
+    backdate(
+        Comment, 'created', comments,
+        timestamps(len(comments), days, rng, bursts)
+    )
+
+    followed = rng.choices(users, weights=popularity, k=sizes['follows'])
+    Follow.objects.bulk_create(
+        (
+            Follow(user_id=rng.choice(users), author_id=author)
+            for author in followed
+        ),
+        batch_size=500,
+        ignore_conflicts=True
+    )
+    Follow.objects.filter(user=F('author')).delete()
+
+    Preference.objects.bulk_create(
+        (
+            Preference(user_id=rng.choice(users), post_id=rng.choice(post_ids))
+            for _ in range(sizes['likes'])
+        ),
+        batch_size=500,
+        ignore_conflicts=True
+    )
+    liked = list(Preference.objects.filter(
+        post_id__in=post_ids
+    ).values_list('pk', flat=True))
+    backdate(
+        Preference, 'created', liked,
+        timestamps(len(liked), days, rng, bursts)
+    )
+    likes = Preference.objects.filter(
+        post=OuterRef('pk')
+    ).order_by().values('post').annotate(total=Count('pk')).values('total')
+    Post.objects.filter(pk__in=post_ids).update(rating=Coalesce(
+        Subquery(likes, output_field=IntegerField()), 0
+    ))
+
+    # The users are new, so there are no counter rows to update
+    Counter.objects.bulk_create(
+        (
+            Counter(
+                user_id=user.pk,
+                followers=user.followers_total,
+                following=user.following_total,
+                posts=user.posts_total
+            )
+            for user in counted_users(User.objects.filter(pk__in=users))
+        ),
+        batch_size=500
+    )
+    rebuild_timelines()
+    rebuild_search()
+    refresh_trending()
+    return {
+        'users': len(users),
+        'groups': len(groups) - 1,
+        'posts': len(post_ids),
+        'comments': len(comments),
+        'follows': Follow.objects.filter(user_id__in=users).count(),
+        'likes': len(liked),
+        'images': sizes['images'],
+    }
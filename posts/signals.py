@@ -0,0 +1,133 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.urls import reverse
+
+from . import search
+from .cache import (
+    LIKES, POSTS, bump_generation, post_stamp, touch, user_stamp
+)
+from .counters import change_counter
+from .leaderboards import offer, since
+from .models import (
+    Comment, Counter, Follow, Group, Post, Preference, Profile_Author, User
+)
+from .page_cache import purge, purge_post
+from .timeline import backfill, catch_up, clean_up, fan_out
+from .trending import add_event
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw=False, **kwargs):
+    # So change_counter() always has a row to update
+    if created and not raw:
+        Counter.objects.create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        change_counter(instance.author_id, posts=1)
+        fan_out(instance)
+        add_event(instance.pk, 'post', instance.pub_date)
+        if instance.group_id:
+            offer('groups', instance.group_id, 1)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    change_counter(instance.author_id, posts=-1)
+    if instance.group_id and instance.pub_date >= since():
+        offer('groups', instance.group_id, -1)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def post_changed(sender, instance, raw=False, **kwargs):
+    # Here rather than in the views, so edits from the admin or a shell
+    # reach the conditional GETs too
+    if not raw:
+        username = instance.author.username
+        touch(POSTS, post_stamp(instance.pk), user_stamp(username))
+        purge_post(
+            username, instance.group.slug if instance.group_id else None
+        )
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def comment_changed(sender, instance, raw=False, **kwargs):
+    # Comment counts are on the feeds too
+    if raw:
+        return
+    post = Post.objects.filter(pk=instance.post_id).values_list(
+        'author__username', 'group__slug'
+    ).first()
+    if post is None:
+        return  # deleted along with its post, which did all this
+    touch(POSTS, post_stamp(instance.post_id))
+    purge_post(*post)
+
+
+@receiver(post_save, sender=Profile_Author)
+def profile_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        touch(user_stamp(instance.author.username))
+        purge(reverse('profile', args=[instance.author.username]))
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        backfill(instance.user_id, instance.author_id)
+        change_counter(instance.author_id, followers=1)
+        change_counter(instance.user_id, following=1)
+        offer('authors', instance.author_id, 1)
+        touch(
+            user_stamp(instance.author.username),
+            user_stamp(instance.user.username)
+        )
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    clean_up(instance.user_id, instance.author_id)
+    change_counter(instance.author_id, followers=-1)
+    change_counter(instance.user_id, following=-1)
+    if catch_up(instance.author_id):
+        # Every follower's feed changed, not only this one
+        bump_generation(POSTS)
+    offer('authors', instance.author_id, -1)
+    touch(*(
+        user_stamp(username) for username in User.objects.filter(
+            pk__in=[instance.user_id, instance.author_id]
+        ).values_list('username', flat=True)
+    ))
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Comment)
+@receiver(post_save, sender=Group)
+def searchable_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.update(instance)
+
+
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=Comment)
+@receiver(post_delete, sender=Group)
+def searchable_deleted(sender, instance, **kwargs):
+    search.remove(instance)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        add_event(instance.post_id, 'comment', instance.created)
+
+
+@receiver(post_save, sender=Preference)
+def like_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        add_event(instance.post_id, 'like', instance.created)
+        offer('posts', instance.post_id, 1)
+        touch(LIKES, post_stamp(instance.post_id))
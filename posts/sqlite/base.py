@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """The stock SQLite backend plus the opt-in SQLITE_TUNING mode.
+
+    Tuned connections journal in WAL mode, so readers and the writer no
+    longer block each other, wait SQLITE_BUSY_TIMEOUT for a lock instead
+    of failing at once, and fsync less often. Write transactions take
+    the lock up front with BEGIN IMMEDIATE: a deferred transaction that
+    read first can not wait for it later and fails with "database is
+    locked". A connection with the ``read_only`` option refuses writes.
+    """
+    read_only = False
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.read_only = params.pop('read_only', False)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        if settings.SQLITE_TUNING:
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute(
+                f'PRAGMA busy_timeout = {int(settings.SQLITE_BUSY_TIMEOUT)}'
+            )
+            conn.execute(f'PRAGMA synchronous = {settings.SQLITE_SYNCHRONOUS}')
+            if self.read_only:
+                conn.execute('PRAGMA query_only = ON')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        if settings.SQLITE_TUNING and not self.read_only:
+            self.cursor().execute('BEGIN IMMEDIATE')
+        else:
+            super()._start_transaction_under_autocommit()
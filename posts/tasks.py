@@ -0,0 +1,56 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+_running = set()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.BACKGROUND_WORKERS,
+                thread_name_prefix='yatube-worker'
+            )
+        return _executor
+
+
+def _run(key, func, args, in_worker=False):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception('Background task %s failed', key)
+    finally:
+        with _executor_lock:
+            _running.discard(key)
+        if in_worker:
+            connection.close()
+
+
+def submit(key, func, *args):
+    # Tasks with the same key are not queued twice while one is pending.
+    # BACKGROUND_WORKERS = 0 runs them inline (tests, management commands).
+    with _executor_lock:
+        if key in _running:
+            return
+        _running.add(key)
+    if not settings.BACKGROUND_WORKERS:
+        _run(key, func, args)
+        return
+    _get_executor().submit(_run, key, func, args, True)
+
+
+def wait():
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
@@ -0,0 +1,11 @@
+from django import template
+
+from posts import images
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def variants(instance):
+    return images.variants(instance)
@@ -0,0 +1,11 @@
+from django import template
+
+from posts.leaderboards import top
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def leaderboard(name):
+    return top(name)
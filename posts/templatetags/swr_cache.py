@@ -0,0 +1,59 @@
+from django import template
+from django.core.cache.utils import make_template_fragment_key
+
+from posts.cache import remember
+
+
+register = template.Library()
+
+
+class SWRCacheNode(template.Node):
+    def __init__(self, nodelist, ttl, name, vary_on, version):
+        self.nodelist = nodelist
+        self.ttl = ttl
+        self.name = name
+        self.vary_on = vary_on
+        self.version = version
+
+    def render(self, context):
+        ttl = self.ttl.resolve(context)
+        if not isinstance(ttl, int):
+            raise template.TemplateSyntaxError(
+                f'"swrcache" tag got a non-integer timeout value: {ttl!r}'
+            )
+        key = make_template_fragment_key(
+            self.name, [var.resolve(context) for var in self.vary_on]
+        )
+        version = self.version.resolve(context) if self.version else None
+        return remember(
+            key, lambda: self.nodelist.render(context), ttl, version
+        )
+
+
+@register.tag('swrcache')
+def do_swrcache(parser, token):
+    """Like {% cache %}, serving the old fragment while one request
+    renders the new one.
+
+        {% swrcache ttl name [vary_on ...] [version=expression] %}
+
+    A fragment is stale after ``ttl`` seconds or once ``version``
+    changes; see posts.cache.remember().
+    """
+    nodelist = parser.parse(('endswrcache',))
+    parser.delete_first_token()
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(
+            f'"{bits[0]}" tag requires at least 2 arguments.'
+        )
+    version = None
+    vary_on = []
+    for bit in bits[3:]:
+        if bit.startswith('version='):
+            version = parser.compile_filter(bit[len('version='):])
+        else:
+            vary_on.append(parser.compile_filter(bit))
+    return SWRCacheNode(
+        nodelist, parser.compile_filter(bits[1]), bits[2], vary_on, version
+    )
@@ -0,0 +1,241 @@
+import json
+import os
+import statistics
+import time
+from unittest import mock
+
+from django.contrib.flatpages.models import FlatPage
+from django.contrib.sites.models import Site
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, get_resolver, reverse
+
+from posts import urls as posts_urls
+from posts.models import Follow, Group, Post, User
+from posts.seed import seed
+
+# Wall-clock budgets are only reported unless this is set, e.g. =1;
+# on a shared CI runner they would fail at random
+TIMED = bool(os.environ.get('YATUBE_PERF_TIMED'))
+# Slower machines can stretch the wall-clock budgets, e.g. =2.5
+SLACK = float(os.environ.get('YATUBE_PERF_SLACK', 1))
+# Where to write the JSON report, to diff it between releases
+REPORT = os.environ.get('YATUBE_PERF_REPORT')
+RUNS = 3
+
+
+def throwaway_post(test):
+    post = Post.objects.create(text='to delete', author=test.author)
+    return reverse(
+        'post_delete',
+        kwargs={'username': test.author.username, 'post_id': post.pk}
+    )
+
+
+def post_kwargs(test):
+    return {'username': test.post.author.username, 'post_id': test.post.pk}
+
+
+def own_post_kwargs(test):
+    return {'username': test.author.username, 'post_id': test.own_post.pk}
+
+
+def author_kwargs(test):
+    return {'username': test.author.username}
+
+
+# label: (method, url, data, query ceiling, milliseconds)
+BUDGETS = {
+    'index': ('get', lambda t: reverse('index'), None, 5, 150),
+    'follow_index': (
+        'get', lambda t: reverse('follow_index'), None, 5, 150
+    ),
+    'trending': ('get', lambda t: reverse('trending'), None, 4, 150),
+    'new_post': ('get', lambda t: reverse('new_post'), None, 3, 100),
+    'new_post:submit': (
+        'post', lambda t: reverse('new_post'), {'text': 'budget'}, 14, 150
+    ),
+    'group': ('get', lambda t: reverse('group'), None, 4, 100),
+    'search': (
+        'get', lambda t: f'{reverse("search")}?q={t.post.text.split()[-1]}',
+        None, 6, 150
+    ),
+    'group_posts': (
+        'get',
+        lambda t: reverse('group_posts', kwargs={'slug': t.group.slug}),
+        None, 6, 150
+    ),
+    'profile': (
+        'get', lambda t: reverse('profile', kwargs=author_kwargs(t)),
+        None, 8, 150
+    ),
+    'post': (
+        'get', lambda t: reverse('post', kwargs=post_kwargs(t)), None, 9, 150
+    ),
+    'post_comments': (
+        'get', lambda t: reverse('post_comments', kwargs=post_kwargs(t)),
+        None, 3, 100
+    ),
+    'post_edit': (
+        'get', lambda t: reverse('post_edit', kwargs=own_post_kwargs(t)),
+        None, 5, 100
+    ),
+    'add_comment': (
+        'post', lambda t: reverse('add_comment', kwargs=post_kwargs(t)),
+        {'text': 'budget'}, 8, 100
+    ),
+    'profile_follow': (
+        'get', lambda t: reverse('profile_follow', kwargs={
+            'username': t.post.author.username
+        }), None, 18, 100
+    ),
+    'profile_unfollow': (
+        'get', lambda t: reverse('profile_unfollow', kwargs={
+            'username': t.post.author.username
+        }), None, 16, 100
+    ),
+    'post_delete': ('get', throwaway_post, None, 16, 150),
+    'profile_edit': (
+        'get', lambda t: reverse('profile_edit', kwargs=author_kwargs(t)),
+        None, 3, 100
+    ),
+    'following_view': (
+        'get', lambda t: reverse('following_view', kwargs=author_kwargs(t)),
+        None, 5, 100
+    ),
+    'follower_view': (
+        'get', lambda t: reverse('follower_view', kwargs=author_kwargs(t)),
+        None, 5, 100
+    ),
+    'rating_plus': (
+        'get', lambda t: reverse('rating_plus', kwargs=post_kwargs(t)),
+        None, 9, 100
+    ),
+    'rating_minus': (
+        'get', lambda t: reverse('rating_minus', kwargs=post_kwargs(t)),
+        None, 7, 100
+    ),
+    'admin/': ('get', lambda t: '/admin/', None, 2, 100),
+    # The flat pages and the login form look up the current Site
+    'about/': ('get', lambda t: '/about/about-us/', None, 4, 100),
+    'auth/': ('get', lambda t: reverse('signup'), None, 2, 100),
+    'auth/login/': ('get', lambda t: reverse('login'), None, 3, 100),
+    'about-us/': ('get', lambda t: '/about-us/', None, 4, 100),
+    'about-author/': ('get', lambda t: '/about-author/', None, 4, 100),
+    'terms/': ('get', lambda t: '/terms/', None, 4, 100),
+    'about-spec/': ('get', lambda t: '/about-spec/', None, 4, 100),
+    # Shadowed by the profile route, so these render a profile 404,
+    # after the conditional GET's MAX()
+    '404/': ('get', lambda t: '/404/', None, 4, 100),
+    '500/': ('get', lambda t: '/500/', None, 4, 100),
+}
+
+
+class TestPerformanceBudgets(TestCase):
+    """Seeds a realistic dataset and holds every URL to a budget.
+
+    Query ceilings are exact regression guards; wall-clock budgets are
+    the median of a few cold-cache requests, enforced only with
+    YATUBE_PERF_TIMED set. Set YATUBE_PERF_REPORT to a path to get the
+    measurements as JSON.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.dataset = seed(prefix='perf')
+        users = User.objects.filter(username__startswith='perf_user_')
+        # The busiest objects make the worst case
+        cls.author = users.annotate(
+            total=Count('posts')
+        ).order_by('-total').first()
+        cls.reader = users.annotate(
+            total=Count('follower')
+        ).order_by('-total').first()
+        cls.post = Post.objects.filter(
+            author__in=users
+        ).exclude(author=cls.author).annotate(
+            total=Count('comments')
+        ).order_by('-total').first()
+        cls.own_post = cls.author.posts.first()
+        cls.group = Group.objects.annotate(
+            total=Count('posts')
+        ).order_by('-total').first()
+        Follow.objects.get_or_create(user=cls.author, author=cls.reader)
+        site = Site.objects.get_current()
+        for url in ('/about-us/', '/about-author/', '/terms/', '/about-spec/'):
+            page = FlatPage.objects.create(url=url, title=url, content=url)
+            page.sites.add(site)
+
+    @classmethod
+    def tearDownClass(cls):
+        if REPORT and getattr(cls, 'report', None):
+            with open(REPORT, 'w') as report:
+                json.dump(cls.report, report, indent=2, sort_keys=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.author)
+        # measure() clears the cache, which would make every request
+        # start background rebuilds of the rankings and leaderboards
+        for target in (
+            'posts.views.schedule_refresh',
+            'posts.leaderboards.schedule_rebuild',
+        ):
+            patcher = mock.patch(target)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def measure(self, method, url, data):
+        # Every request starts from the same empty caches, whatever the
+        # tests before left in them
+        cache.clear()
+        Site.objects.clear_cache()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = getattr(self.client, method)(url, data)
+            elapsed = time.perf_counter() - started
+        return response.status_code, len(queries), elapsed * 1000
+
+    def test_every_route_has_a_budget(self):
+        routes = {
+            pattern.name for pattern in posts_urls.urlpatterns
+        } | {
+            str(pattern.pattern) for pattern in get_resolver().url_patterns
+            if str(pattern.pattern) and (
+                not isinstance(pattern, URLPattern)
+                or pattern.callback.__module__ != 'debug_toolbar.views'
+            )
+        }
+        routes.discard('')
+        self.assertEqual(routes - set(BUDGETS), set())
+
+    def test_views_stay_within_budget(self):
+        views = {}
+        for label, (method, url, data, ceiling, budget) in BUDGETS.items():
+            with self.subTest(view=label):
+                runs = [
+                    self.measure(method, url(self), data) for _ in range(RUNS)
+                ]
+                status = runs[0][0]
+                queries = max(run[1] for run in runs)
+                elapsed = statistics.median(run[2] for run in runs)
+                views[label] = {
+                    'method': method.upper(),
+                    'status': status,
+                    'queries': queries,
+                    'max_queries': ceiling,
+                    'ms': round(elapsed, 2),
+                    'budget_ms': budget * SLACK,
+                }
+                self.assertLess(status, 500)
+                self.assertLessEqual(queries, ceiling)
+                if TIMED:
+                    self.assertLessEqual(elapsed, budget * SLACK)
+        type(self).report = {
+            'dataset': self.dataset,
+            'views': views,
+        }
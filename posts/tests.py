@@ -1,10 +1,51 @@
+import importlib
+import json
+import os
+import shutil
+import sqlite3
 import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
+from django.apps import apps as global_apps
 from django.core.cache import cache
-from django.test import Client, TestCase
+from django.core.cache.utils import make_template_fragment_key
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import (
+    IntegrityError, OperationalError, connection, connections, transaction
+)
+from django.test import (
+    Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+)
+from django.test.utils import CaptureQueriesContext
+from django.template import Context, Template
 from django.urls import reverse
+from django.utils import timezone
 from PIL import Image
 
-from posts.models import Group, Post, User, Follow
+from posts.models import (
+    Group, Post, User, Follow, Comment, Counter, Preference, Timeline,
+    Trending
+)
+from posts import (
+    images, leaderboards, page_cache, profiling, replicas, thumbnails,
+    transfer, trending
+)
+from posts.thumbnails import POST_THUMBNAIL
+from posts.cache import (
+    POSTS, bump_generation, get_generation, remember, reset_outdated,
+    served_outdated
+)
+from posts.counters import rebuild_counters
+from posts.management.commands import loadtest
+from posts.paginator import CursorPage, encode_cursor
+from posts.query_plans import collect_plans, view_urls
+from posts.ratings import buffer, change_rating
+from yatube import settings_module
 
 
 class TestContent(TestCase):
@@ -19,6 +60,9 @@ class TestContent(TestCase):
             )
 
     def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media)
+        self.settings_override.enable()
         self.authorized_client = Client()
         self.unauthorized_client = Client()
         self.user = User.objects.create(
@@ -28,6 +72,10 @@ class TestContent(TestCase):
         self.authorized_client.force_login(self.user)
         self.group = Group.objects.create(title='test_group', slug='testgroup')
 
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media, ignore_errors=True)
+
     def assert_post_to_url(self, url, base):
         response = self.authorized_client.get(url)
         paginator = response.context.get('page')
@@ -207,6 +255,12 @@ class TestContent(TestCase):
         response3 = self.authorized_client.get(reverse('index'))
         self.assertContains(response3, post2.text)
 
+    def test_cache_index_page_per_login_state(self):
+        self.create_post_for_tests()
+        self.unauthorized_client.get(reverse('index'))
+        response = self.authorized_client.get(reverse('index'))
+        self.assertContains(response, 'Посмотреть публикацию полностью')
+
     def test_authorized_user_can_subscribe_and_delete_subscribings(self):
         count_1 = Follow.objects.count()
         self.create_author_and_subscribe_user()
@@ -254,3 +308,1772 @@ class TestContent(TestCase):
         kwargs={'username': self.user.username, 'post_id':post.pk}
         ))
         self.assertContains(response, 'Это ж-ж-ж-ж неспроста')
+
+
+@override_settings(CURSOR_PAGINATION_THRESHOLD=5)
+class TestCursorPagination(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create(username='arthur')
+        self.group = Group.objects.create(title='test_group', slug='testgroup')
+        for i in range(25):
+            Post.objects.create(
+                text=f'post {i}', author=self.user, group=self.group
+            )
+
+    def walk(self, url):
+        seen = []
+        response = self.client.get(url)
+        page = response.context['page']
+        self.assertTrue(page.is_cursor)
+        while True:
+            seen.extend(post.pk for post in page)
+            if not page.has_next():
+                return seen, page
+            response = self.client.get(url, {'after': page.next_cursor})
+            page = response.context['page']
+
+    def test_cursor_pages_cover_feed_in_order(self):
+        expected = list(
+            Post.objects.order_by('-pub_date', '-id').values_list('pk', flat=True)
+        )
+        urls = [
+            reverse('index'),
+            reverse('group_posts', kwargs={'slug': self.group.slug}),
+            reverse('profile', kwargs={'username': self.user.username}),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                cache.clear()
+                seen, _ = self.walk(url)
+                self.assertEqual(seen, expected)
+
+    def test_before_cursor_returns_previous_page(self):
+        url = reverse('profile', kwargs={'username': self.user.username})
+        first = self.client.get(url).context['page']
+        second = self.client.get(url, {'after': first.next_cursor}).context['page']
+        back = self.client.get(url, {'before': second.previous_cursor}).context['page']
+        self.assertEqual([p.pk for p in back], [p.pk for p in first])
+        self.assertFalse(back.has_previous())
+
+    def test_broken_cursor_falls_back_to_first_page(self):
+        url = reverse('profile', kwargs={'username': self.user.username})
+        page = self.client.get(url, {'after': 'not-a-cursor'}).context['page']
+        self.assertFalse(page.has_previous())
+        self.assertEqual(len(page), 10)
+
+    def test_before_the_newest_post_falls_back_to_first_page(self):
+        url = reverse('profile', kwargs={'username': self.user.username})
+        newest = Post.objects.order_by('-pub_date', '-id').first()
+        response = self.client.get(
+            url, {'before': encode_cursor(newest.pub_date, newest.pk)}
+        )
+        self.assertEqual(response.status_code, 200)
+        page = response.context['page']
+        self.assertEqual(page[0], newest)
+        self.assertFalse(page.has_previous())
+        empty = CursorPage(
+            [], has_next=True, has_previous=True, key=('pub_date', 'pk')
+        )
+        self.assertIsNone(empty.next_cursor)
+        self.assertIsNone(empty.previous_cursor)
+
+    @override_settings(CURSOR_PAGINATION_THRESHOLD=100)
+    def test_small_feed_keeps_numbered_pages(self):
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['paginator'].num_pages, 3)
+        self.assertContains(response, '?page=3')
+
+
+class TestFeedQueries(TestCase):
+    def setUp(self):
+        self.reader = User.objects.create(username='reader')
+        self.client = Client()
+        self.client.force_login(self.reader)
+        self.group = Group.objects.create(title='test_group', slug='testgroup')
+        self.author = User.objects.create(username='author')
+        Follow.objects.create(user=self.reader, author=self.author)
+
+    def create_posts(self, count):
+        start = Post.objects.count()
+        for i in range(start, start + count):
+            author = User.objects.create(username=f'extra{i}')
+            Follow.objects.create(user=self.reader, author=author)
+            post = Post.objects.create(
+                text=f'post {i}', author=author, group=self.group
+            )
+            Comment.objects.create(post=post, author=self.author, text='hi')
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_feed_query_count_does_not_depend_on_page_size(self):
+        urls = [
+            reverse('index'),
+            reverse('group_posts', kwargs={'slug': self.group.slug}),
+            reverse('follow_index'),
+        ]
+        self.create_posts(2)
+        small = [self.count_queries(url) for url in urls]
+        self.create_posts(8)
+        full = [self.count_queries(url) for url in urls]
+        self.assertEqual(small, full)
+
+    def test_profile_query_count_does_not_depend_on_page_size(self):
+        url = reverse('profile', kwargs={'username': self.author.username})
+        Post.objects.create(text='first', author=self.author)
+        self.count_queries(url)  # builds the author's counter row
+        small = self.count_queries(url)
+        for i in range(9):
+            post = Post.objects.create(text=f'post {i}', author=self.author)
+            Comment.objects.create(post=post, author=self.reader, text='hi')
+        self.assertEqual(self.count_queries(url), small)
+
+    def test_feed_annotates_comment_count(self):
+        post = Post.objects.create(text='post', author=self.author)
+        Comment.objects.create(post=post, author=self.reader, text='1')
+        Comment.objects.create(post=post, author=self.reader, text='2')
+        Post.objects.create(text='quiet', author=self.author)
+        counts = dict(Post.objects.feed().values_list('text', 'comment_count'))
+        self.assertEqual(counts, {'post': 2, 'quiet': 0})
+
+
+class TestCounters(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='arthur')
+        self.author = User.objects.create(username='merlin')
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def counts(self, user):
+        counter = Counter.objects.get(user=user)
+        return counter.followers, counter.following, counter.posts
+
+    def test_views_maintain_counters(self):
+        self.client.get(reverse('profile_follow', kwargs={'username': 'merlin'}))
+        self.client.get(reverse('profile_follow', kwargs={'username': 'merlin'}))
+        self.assertEqual(self.counts(self.author), (1, 0, 0))
+        self.assertEqual(self.counts(self.user), (0, 1, 0))
+        self.client.post(reverse('new_post'), {'text': 'hello'})
+        self.assertEqual(self.counts(self.user), (0, 1, 1))
+        post = Post.objects.get(author=self.user)
+        self.client.get(reverse(
+            'post_delete',
+            kwargs={'username': 'arthur', 'post_id': post.pk}
+        ))
+        self.client.get(reverse('profile_unfollow', kwargs={'username': 'merlin'}))
+        self.client.get(reverse('profile_unfollow', kwargs={'username': 'merlin'}))
+        self.assertEqual(self.counts(self.author), (0, 0, 0))
+        self.assertEqual(self.counts(self.user), (0, 0, 0))
+
+    def test_deletes_outside_the_views_maintain_counters(self):
+        follow = Follow.objects.create(user=self.user, author=self.author)
+        Post.objects.create(text='one', author=self.author)
+        Post.objects.filter(author=self.author).delete()
+        follow.delete()
+        self.assertEqual(self.counts(self.author), (0, 0, 0))
+        self.assertEqual(self.counts(self.user), (0, 0, 0))
+
+    def test_drifted_counter_does_not_go_negative(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        Counter.objects.filter(user=self.author).update(followers=0)
+        self.client.get(reverse('profile_unfollow', kwargs={'username': 'merlin'}))
+        self.assertEqual(self.counts(self.author), (0, 0, 0))
+
+    def test_invalid_comment_renders_the_whole_post_page(self):
+        post = Post.objects.create(text='one', author=self.author)
+        response = self.client.post(
+            reverse(
+                'add_comment',
+                kwargs={'username': 'merlin', 'post_id': post.pk}
+            ),
+            {'text': ''}
+        )
+        self.assertEqual(response.context['author'], self.author)
+        self.assertEqual(response.context['counter'].posts, 1)
+        self.assertContains(response, 'Количество публикаций: 1')
+
+    def test_profile_card_shows_counters(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        Post.objects.create(text='one', author=self.author)
+        response = self.client.get(
+            reverse('profile', kwargs={'username': 'merlin'})
+        )
+        self.assertContains(response, 'Подписчиков: 1')
+        self.assertContains(response, 'Количество публикаций: 1')
+
+    def test_rebuild_counters_repairs_drift(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        Post.objects.create(text='one', author=self.author)
+        Counter.objects.filter(user=self.author).update(followers=7, posts=3)
+        call_command('rebuild_counters', stdout=tempfile.TemporaryFile('w+'))
+        self.assertEqual(self.counts(self.author), (1, 0, 1))
+        self.assertEqual(self.counts(self.user), (0, 1, 0))
+
+
+class TestRating(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='arthur')
+        self.client = Client()
+        self.client.force_login(self.user)
+        self.post = Post.objects.create(text='hot', author=self.user)
+        self.kwargs = {'username': 'arthur', 'post_id': self.post.pk}
+
+    def test_rating_counts_each_user_once(self):
+        self.client.get(reverse('rating_plus', kwargs=self.kwargs))
+        self.client.get(reverse('rating_plus', kwargs=self.kwargs))
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.rating, 1)
+        self.client.get(reverse('rating_minus', kwargs=self.kwargs))
+        self.client.get(reverse('rating_minus', kwargs=self.kwargs))
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.rating, 0)
+
+    def test_rating_update_does_not_rewrite_post(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('rating_plus', kwargs=self.kwargs))
+        updates = [
+            q['sql'] for q in queries
+            if q['sql'].startswith('UPDATE "posts_post"')
+        ]
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn('"text"', updates[0])
+
+
+class TestConcurrentRating(TransactionTestCase):
+    def test_parallel_likes_are_all_counted(self):
+        author = User.objects.create(username='arthur')
+        post = Post.objects.create(text='hot', author=author)
+        users = [User.objects.create(username=f'fan{i}') for i in range(20)]
+        barrier = threading.Barrier(len(users))
+        errors = []
+
+        clients = {}
+        for user in users:
+            clients[user] = Client()
+            clients[user].force_login(user)
+
+        def like(user):
+            client = clients[user]
+            barrier.wait()
+            kwargs = {'username': 'arthur', 'post_id': post.pk}
+            try:
+                for _ in range(3):
+                    client.get(reverse('rating_plus', kwargs=kwargs))
+                if user.pk % 2:
+                    client.get(reverse('rating_minus', kwargs=kwargs))
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=like, args=(u,)) for u in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        likes = Preference.objects.filter(post=post).count()
+        self.assertEqual(likes, len([u for u in users if not u.pk % 2]))
+        post.refresh_from_db()
+        self.assertEqual(post.rating, likes)
+
+
+@override_settings(RATING_BUFFER=True, RATING_FLUSH_INTERVAL=3600)
+class TestRatingBuffer(TransactionTestCase):
+    def setUp(self):
+        buffer.flush()
+        self.author = User.objects.create(username='arthur')
+        self.post = Post.objects.create(text='viral', author=self.author)
+        self.kwargs = {'username': 'arthur', 'post_id': self.post.pk}
+
+    def like(self, username, view='rating_plus'):
+        client = Client()
+        client.force_login(User.objects.get_or_create(username=username)[0])
+        client.get(reverse(view, kwargs=self.kwargs))
+
+    def test_likes_are_coalesced_into_one_update(self):
+        for i in range(5):
+            self.like(f'fan{i}')
+        self.like('fan0', 'rating_minus')
+        self.assertEqual(Preference.objects.filter(post=self.post).count(), 4)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.rating, 0)
+        self.assertEqual(buffer.pending(), {self.post.pk: 4})
+        with CaptureQueriesContext(connection) as queries:
+            buffer.flush()
+        updates = [q for q in queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.rating, 4)
+        self.assertEqual(buffer.pending(), {})
+
+    def test_rolled_back_likes_are_not_buffered(self):
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                change_rating(self.post.pk, 1)
+                Preference.objects.create(user=self.author, post=self.post)
+                Preference.objects.create(user=self.author, post=self.post)
+        self.assertEqual(buffer.pending(), {})
+
+
+class TestTimeline(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='arthur')
+        self.author = User.objects.create(username='merlin')
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def follow(self, view='profile_follow'):
+        self.client.get(reverse(view, kwargs={'username': 'merlin'}))
+
+    def feed(self):
+        response = self.client.get(reverse('follow_index'))
+        return [post.text for post in response.context['page']]
+
+    def test_timeline_follows_posts_and_subscriptions(self):
+        Post.objects.create(text='old', author=self.author)
+        self.follow()
+        self.assertEqual(Timeline.objects.filter(user=self.user).count(), 1)
+        author_client = Client()
+        author_client.force_login(self.author)
+        author_client.post(reverse('new_post'), {'text': 'new'})
+        self.assertEqual(self.feed(), ['new', 'old'])
+        post = Post.objects.get(text='new')
+        author_client.get(reverse(
+            'post_delete', kwargs={'username': 'merlin', 'post_id': post.pk}
+        ))
+        self.assertEqual(self.feed(), ['old'])
+        self.follow('profile_unfollow')
+        self.assertEqual(self.feed(), [])
+        self.assertFalse(Timeline.objects.exists())
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_author_back_under_the_limit_is_fanned_out(self):
+        self.follow()
+        other = Client()
+        other.force_login(User.objects.create(username='morgana'))
+        other.get(reverse('profile_follow', kwargs={'username': 'merlin'}))
+        Post.objects.create(text='new', author=self.author)
+        self.assertFalse(Timeline.objects.filter(post__text='new').exists())
+        other.get(reverse('profile_unfollow', kwargs={'username': 'merlin'}))
+        self.assertEqual(self.feed(), ['new'])
+        self.assertEqual(Timeline.objects.filter(post__text='new').count(), 1)
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_catch_up_follows_deletes_outside_the_views(self):
+        self.follow()
+        others = [User.objects.create(username=f'user{i}') for i in range(2)]
+        for other in others:
+            Follow.objects.create(user=other, author=self.author)
+        Post.objects.create(text='new', author=self.author)
+        # Both at once, as the admin's bulk delete does
+        Follow.objects.filter(user__in=others).delete()
+        self.assertEqual(self.feed(), ['new'])
+        self.assertEqual(Timeline.objects.filter(post__text='new').count(), 1)
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_big_authors_are_merged_at_read_time(self):
+        other = User.objects.create(username='morgana')
+        Follow.objects.create(user=self.user, author=other)
+        Post.objects.create(text='small', author=other)
+        Post.objects.create(text='old', author=self.author)
+        self.follow()
+        Post.objects.create(text='new', author=self.author)
+        self.assertFalse(Timeline.objects.filter(post__text='new').exists())
+        self.assertEqual(self.feed(), ['new', 'old', 'small'])
+
+
+@override_settings(CURSOR_PAGINATION_THRESHOLD=1000)
+class TestFeedCache(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='arthur')
+        self.author = User.objects.create(username='merlin')
+        self.client = Client()
+        self.client.force_login(self.user)
+        for i in range(15):
+            Post.objects.create(text=f'post number {i}', author=self.author)
+
+    def test_pages_do_not_share_cache(self):
+        self.client.get(reverse('index'))
+        response = self.client.get(reverse('index'), {'page': 2})
+        self.assertContains(response, 'post number 0')
+        self.assertNotContains(response, 'post number 14')
+
+    def test_follow_feed_is_per_user(self):
+        self.client.get(reverse('profile_follow', kwargs={'username': 'merlin'}))
+        self.assertContains(self.client.get(reverse('follow_index')), 'post number 14')
+        other = Client()
+        other.force_login(User.objects.create(username='morgana'))
+        self.assertNotContains(other.get(reverse('follow_index')), 'post number 14')
+
+    def test_views_invalidate_feed(self):
+        self.client.get(reverse('index'))
+        self.client.get(reverse('follow_index'))
+        self.client.post(reverse('new_post'), {'text': 'fresh news'})
+        self.assertContains(self.client.get(reverse('index')), 'fresh news')
+        self.client.get(reverse('profile_follow', kwargs={'username': 'merlin'}))
+        self.assertContains(self.client.get(reverse('follow_index')), 'post number 14')
+        post = Post.objects.get(text='fresh news')
+        self.client.post(
+            reverse('post_edit', kwargs={'username': 'arthur', 'post_id': post.pk}),
+            {'text': 'edited news'}
+        )
+        self.assertContains(self.client.get(reverse('index')), 'edited news')
+        self.client.get(reverse(
+            'post_delete', kwargs={'username': 'arthur', 'post_id': post.pk}
+        ))
+        self.assertNotContains(self.client.get(reverse('index')), 'edited news')
+
+    @override_settings(RATING_BUFFER=False)
+    def test_likes_invalidate_feed(self):
+        post = Post.objects.get(text='post number 14')
+        self.assertContains(
+            self.client.get(reverse('index')), 'Рейтинг публикации: 0'
+        )
+        self.client.get(reverse(
+            'rating_plus', kwargs={'username': 'merlin', 'post_id': post.pk}
+        ))
+        self.assertContains(
+            self.client.get(reverse('index')), 'Рейтинг публикации: 1'
+        )
+
+    @override_settings(CURSOR_PAGINATION_THRESHOLD=5)
+    def test_cached_fragment_skips_the_page_query(self):
+        self.client.get(reverse('index'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('index'))
+        self.assertContains(response, 'post number 14')
+        self.assertContains(response, 'after=')
+        # Only the bounded count, no page of posts
+        self.assertFalse([q for q in queries if 'ORDER BY' in q['sql']])
+
+
+class TestMeteredCache(TestCase):
+    def metered(self, backend, location, **options):
+        return override_settings(CACHES={'default': {
+            'BACKEND': 'posts.cache_backends.MeteredCache',
+            'LOCATION': location,
+            'OPTIONS': dict(options, backend=backend),
+        }})
+
+    def test_file_cache_counts_hits_and_misses_per_prefix(self):
+        with tempfile.TemporaryDirectory() as location:
+            with self.metered(
+                'django.core.cache.backends.filebased.FileBasedCache', location
+            ):
+                cache.set('generation:posts', 1)
+                cache.get('generation:posts')
+                cache.get('generation:posts')
+                cache.get('generation:missing')
+                cache.get_many(['feed:1', 'generation:posts'])
+                stats = cache.stats()
+                self.assertEqual(
+                    stats['generation'],
+                    {'hits': 3, 'misses': 1, 'evictions': 0}
+                )
+                self.assertEqual(stats['feed']['misses'], 1)
+                output = tempfile.TemporaryFile('w+')
+                call_command('cache_stats', stdout=output)
+                output.seek(0)
+                self.assertIn('generation', output.read())
+                cache.reset_stats()
+                self.assertEqual(cache.stats(), {})
+
+    def test_fragment_keys_are_counted_per_fragment(self):
+        template = Template(
+            '{% load swr_cache %}'
+            '{% swrcache 60 follow_page user page %}x{% endswrcache %}'
+        )
+        with self.metered(
+            'django.core.cache.backends.locmem.LocMemCache', 'fragments'
+        ):
+            for user in range(3):
+                template.render(Context({'user': user, 'page': ''}))
+                template.render(Context({'user': user, 'page': ''}))
+            stats = cache.stats()
+            self.assertEqual(
+                stats['default:template.cache.follow_page'],
+                {'hits': 3, 'misses': 3, 'evictions': 0}
+            )
+            self.assertFalse(
+                [prefix for prefix in stats if 'follow_page.' in prefix]
+            )
+            cache.clear()
+
+    def test_evicted_keys_are_counted(self):
+        with self.metered(
+            'django.core.cache.backends.locmem.LocMemCache', 'evictions',
+            MAX_ENTRIES=10, CULL_FREQUENCY=1
+        ):
+            cache.clear()
+            for i in range(12):
+                cache.set(f'page:{i}', i)
+            for i in range(12):
+                cache.get(f'page:{i}')
+            cache.get('page:never-set')
+            stats = cache.stats()['page']
+            self.assertEqual(stats, {'hits': 2, 'misses': 1, 'evictions': 10})
+            cache.clear()
+
+
+def make_image(name='photo.jpg', size=(1200, 800)):
+    data = BytesIO()
+    Image.new('RGB', size, color='navy').save(data, 'JPEG')
+    return SimpleUploadedFile(name, data.getvalue(), content_type='image/jpeg')
+
+
+@override_settings(BACKGROUND_WORKERS=0)
+class TestThumbnails(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media)
+        self.settings_override.enable()
+        self.user = User.objects.create(username='arthur')
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media, ignore_errors=True)
+
+    def post_page(self, post):
+        return self.client.get(reverse(
+            'post', kwargs={'username': 'arthur', 'post_id': post.pk}
+        ))
+
+    def test_thumbnail_is_ready_before_first_render(self):
+        self.client.post(reverse('new_post'), {
+            'text': 'with image', 'image': make_image()
+        })
+        post = Post.objects.get(text='with image')
+        response = self.post_page(post)
+        self.assertContains(response, 'variants/')
+        self.assertNotContains(response, 'Изображение обрабатывается')
+
+    def test_missing_thumbnail_renders_placeholder_and_is_queued(self):
+        post = Post.objects.create(text='imported', author=self.user)
+        post.image.save('imported.jpg', make_image())
+        self.assertContains(self.post_page(post), 'Изображение обрабатывается')
+        self.assertContains(self.post_page(post), 'variants/')
+
+    @override_settings(PAGE_CACHE_TTL=60)
+    def test_generated_thumbnail_purges_the_pages_showing_it(self):
+        post = Post.objects.create(text='imported', author=self.user)
+        post.image.save('imported.jpg', make_image())
+        url = reverse('profile', kwargs={'username': 'arthur'})
+        anonymous = Client()
+        anonymous.get(url)  # builds the variants, which purges it too
+        anonymous.get(url)
+        self.assertEqual(anonymous.get(url)['X-Page-Cache'], 'hit')
+        generation = get_generation(POSTS)
+        thumbnails.generate(post.image.name, *POST_THUMBNAIL)
+        self.assertGreater(get_generation(POSTS), generation)
+        self.assertEqual(anonymous.get(url)['X-Page-Cache'], 'miss')
+
+
+class TestQueryPlans(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create(username='reader')
+        self.author = User.objects.create(username='author')
+        self.group = Group.objects.create(title='group', slug='group')
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.post = Post.objects.create(
+            text='text', author=self.author, group=self.group
+        )
+        Comment.objects.create(post=self.post, author=self.reader, text='c')
+
+    def test_views_use_indexes(self):
+        plans = collect_plans(
+            self.reader, view_urls(self.reader, self.post, self.group)
+        )
+        self.assertEqual(len(plans), 8)
+        for name, queries in plans.items():
+            self.assertTrue(queries, name)
+            for query in queries:
+                self.assertEqual(query['problems'], [], (name, query['sql']))
+
+    def test_explain_queries_command(self):
+        out = StringIO()
+        call_command('explain_queries', '--fail-on-scan', stdout=out)
+        self.assertIn('follow_index', out.getvalue())
+
+
+class TestLoadTest(TransactionTestCase):
+    def test_seed_data_is_reproducible(self):
+        sizes = ['--users', '30', '--posts', '60', '--comments', '40',
+                 '--follows', '80', '--likes', '50']
+        for prefix in ('one', 'two'):
+            call_command(
+                'seed_data', '--prefix', prefix, *sizes, stdout=StringIO()
+            )
+        users = User.objects.filter(username__startswith='one_')
+        self.assertEqual(users.count(), 30)
+
+        def graph(prefix):
+            return sorted(
+                (follow.user.username[4:], follow.author.username[4:])
+                for follow in Follow.objects.filter(
+                    user__username__startswith=prefix
+                )
+            )
+
+        self.assertEqual(graph('one_'), graph('two_'))
+        self.assertEqual(
+            Timeline.objects.count(),
+            Post.objects.filter(author__following__isnull=False).count()
+        )
+
+    def test_loadtest_reports_every_scenario(self):
+        call_command(
+            'seed_data', '--users', '20', '--posts', '40', '--comments', '20',
+            '--follows', '60', '--likes', '20', stdout=StringIO()
+        )
+        out = StringIO()
+        call_command(
+            'loadtest', '--threads', '2', '--requests', '40', '--json',
+            '--mix', 'index=1,follow=1,comment=1,like=1',
+            stdout=out, stderr=StringIO()
+        )
+        report = json.loads(out.getvalue())['views']
+        self.assertEqual(report['total']['requests'], 40)
+        self.assertEqual(report['total']['errors'], 0)
+        self.assertEqual(
+            set(report), {'index', 'follow', 'comment', 'like', 'total'}
+        )
+        self.assertEqual(
+            Comment.objects.filter(text='load test comment').count(),
+            report['comment']['requests']
+        )
+
+    @override_settings(CURSOR_PAGINATION_THRESHOLD=5)
+    def test_loadtest_follows_index_cursors(self):
+        call_command(
+            'seed_data', '--users', '10', '--posts', '60', '--comments', '0',
+            '--follows', '20', '--likes', '0', stdout=StringIO()
+        )
+        command = loadtest.Command()
+        call_command(
+            command, '--threads', '1', '--requests', '4', '--mix', 'index=1',
+            stdout=StringIO(), stderr=StringIO()
+        )
+        self.assertEqual(len(command.index_pages), 5)
+        self.assertTrue(all(
+            query.startswith('after=') for query in command.index_pages[1:]
+        ))
+
+
+class TestProfiling(TestCase):
+    def setUp(self):
+        cache.clear()
+        profiling.reset_stats()
+        self.traces = tempfile.NamedTemporaryFile(suffix='.jsonl')
+        self.addCleanup(self.traces.close)
+        self.user = User.objects.create(username='arthur')
+        Post.objects.create(text='profiled', author=self.user)
+
+    def test_sampled_request_is_broken_down(self):
+        with override_settings(
+            PROFILING_SAMPLE_RATE=1, PROFILING_SLOW_MS=0,
+            PROFILING_TRACE_FILE=self.traces.name, PAGE_CACHE_TTL=0
+        ):
+            self.client.get(reverse('index'))
+            self.client.get(reverse('index'))
+        stats = profiling.stats()['index']
+        self.assertEqual(stats['requests'], 2)
+        self.assertGreater(stats['queries']['p50'], 0)
+        self.assertGreater(stats['sql_ms']['p99'], 0)
+        self.assertGreater(stats['template_ms']['p50'], 0)
+        # The second render finds the feed fragment in the cache
+        self.assertGreater(stats['cache_hits']['p99'], 0)
+        traces = [json.loads(line) for line in open(self.traces.name)]
+        self.assertEqual(len(traces), 2)
+        self.assertEqual(traces[0]['view'], 'index')
+        self.assertTrue(traces[0]['worst_queries'][0]['sql'])
+
+    def test_unsampled_request_is_not_recorded(self):
+        with override_settings(PROFILING_SAMPLE_RATE=0):
+            self.client.get(reverse('index'))
+        self.assertEqual(profiling.stats(), {})
+
+
+class TestProductionSettings(TestCase):
+    def load(self, **environ):
+        with mock.patch.dict(os.environ, environ):
+            module = importlib.import_module('yatube.settings_production')
+            return importlib.reload(module)
+
+    def test_production_profile(self):
+        production = self.load(YATUBE_SECRET_KEY='production key')
+        self.assertEqual(production.SECRET_KEY, 'production key')
+        self.assertEqual(production.PROFILING_SAMPLE_RATE, 0.05)
+        self.assertFalse(production.DEBUG)
+        self.assertNotIn('debug_toolbar', production.INSTALLED_APPS)
+        self.assertFalse(any(
+            'debug_toolbar' in middleware
+            for middleware in production.MIDDLEWARE
+        ))
+        self.assertEqual(production.DATABASES['default']['CONN_MAX_AGE'], 600)
+        loaders = production.TEMPLATES[0]['OPTIONS']['loaders']
+        self.assertEqual(loaders[0][0], 'django.template.loaders.cached.Loader')
+        self.assertFalse(production.TEMPLATES[0]['APP_DIRS'])
+
+    def test_secret_key_is_required(self):
+        with mock.patch.dict(os.environ):
+            os.environ.pop('YATUBE_SECRET_KEY', None)
+            with self.assertRaises(ImproperlyConfigured):
+                self.load()
+
+    def test_environment_selects_settings(self):
+        with mock.patch.dict(os.environ, {'YATUBE_ENV': 'production'}):
+            self.assertEqual(settings_module(), 'yatube.settings_production')
+        with mock.patch.dict(os.environ):
+            os.environ.pop('YATUBE_ENV', None)
+            self.assertEqual(settings_module(), 'yatube.settings')
+
+
+@override_settings(SQLITE_TUNING=True)
+class TestSQLiteTuning(TransactionTestCase):
+    databases = {'default', 'read'}
+
+    def setUp(self):
+        # New connections pick up the tuning
+        connections.close_all()
+        cache.clear()
+        self.author = User.objects.create(username='arthur')
+        self.post = Post.objects.create(text='busy', author=self.author)
+
+    def tearDown(self):
+        connections.close_all()
+
+    def test_reads_are_split_from_writes(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+        with CaptureQueriesContext(connections['read']) as reads:
+            Post.objects.count()
+        self.assertEqual(len(reads), 1)
+        with transaction.atomic():
+            with CaptureQueriesContext(connections['read']) as reads:
+                Post.objects.count()
+        self.assertEqual(len(reads), 0)
+        with self.assertRaises(OperationalError):
+            Post.objects.using('read').update(text='changed')
+
+    def test_readers_are_not_blocked_by_a_writer(self):
+        readers = [Client() for _ in range(4)]
+        writers = []
+        for i in range(4):
+            client = Client()
+            client.force_login(User.objects.create(username=f'fan{i}'))
+            writers.append(client)
+        like = reverse(
+            'rating_plus',
+            kwargs={'username': 'arthur', 'post_id': self.post.pk}
+        )
+        read_statuses = []
+        write_statuses = []
+
+        def read(client):
+            try:
+                for _ in range(3):
+                    response = client.get(reverse('index'))
+                    read_statuses.append(response.status_code)
+            finally:
+                connections.close_all()
+
+        def write(client):
+            try:
+                write_statuses.append(client.get(like).status_code)
+            finally:
+                connections.close_all()
+
+        # Another process in the middle of committing a big write
+        holder = sqlite3.connect(
+            connection.settings_dict['NAME'], isolation_level=None
+        )
+        holder.execute('BEGIN EXCLUSIVE')
+        holder.execute(
+            "INSERT INTO posts_group (title, slug, description) "
+            "VALUES ('held', 'held', 'held')"
+        )
+        threads = [
+            threading.Thread(target=write, args=(client,))
+            for client in writers
+        ] + [
+            threading.Thread(target=read, args=(client,))
+            for client in readers
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads[len(writers):]:
+            thread.join()
+        # Every read finished while the write lock was still held
+        self.assertEqual(read_statuses, [200] * 12)
+        self.assertEqual(write_statuses, [])
+        holder.execute('COMMIT')
+        holder.close()
+        for thread in threads[:len(writers)]:
+            thread.join()
+        # The likes waited for the lock instead of failing
+        self.assertEqual(write_statuses, [302] * 4)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.rating, 4)
+
+
+class ReplicaFiles:
+    """Two SQLite replicas of the test database, synced on demand."""
+    aliases = ('replica_0', 'replica_1')
+
+    def setUp(self):
+        super().setUp()
+        self.replica_dir = tempfile.mkdtemp()
+        for alias in self.aliases:
+            connections.databases[alias] = dict(
+                connection.settings_dict,
+                NAME=os.path.join(self.replica_dir, f'{alias}.sqlite3'),
+                OPTIONS={'read_only': True}
+            )
+        self.settings_override = override_settings(
+            DATABASE_REPLICAS=list(self.aliases)
+        )
+        self.settings_override.enable()
+        self.sync()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        for alias in self.aliases:
+            connections[alias].close()
+            del connections[alias]
+            del connections.databases[alias]
+        shutil.rmtree(self.replica_dir, ignore_errors=True)
+        super().tearDown()
+
+    def sync(self):
+        # What replication would do, all at once
+        source = sqlite3.connect(connection.settings_dict['NAME'])
+        for alias in self.aliases:
+            connections[alias].close()
+            target = sqlite3.connect(connections.databases[alias]['NAME'])
+            source.backup(target)
+            target.close()
+        source.close()
+
+
+class TestReplicas(ReplicaFiles, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.author = User.objects.create(username='arthur')
+        self.client.force_login(self.author)
+        self.anonymous = Client()
+        self.sync()
+
+    def index_texts(self, client):
+        cache.clear()
+        response = client.get(reverse('index'))
+        return [post.text for post in response.context['page']]
+
+    def test_feeds_read_from_replicas(self):
+        Post.objects.create(text='not replicated yet', author=self.author)
+        self.assertEqual(self.index_texts(self.anonymous), [])
+        profile = self.anonymous.get(
+            reverse('profile', kwargs={'username': 'arthur'})
+        )
+        self.assertEqual(len(profile.context['page']), 0)
+        self.sync()
+        self.assertEqual(
+            self.index_texts(self.anonymous), ['not replicated yet']
+        )
+
+    def test_writer_reads_own_writes(self):
+        response = self.client.post(
+            reverse('new_post'), {'text': 'my new post'}, follow=True
+        )
+        self.assertEqual(
+            [post.text for post in response.context['page']], ['my new post']
+        )
+        self.assertIn(replicas.PIN_COOKIE, self.client.cookies)
+        self.assertEqual(self.index_texts(self.client), ['my new post'])
+        # Everyone else still sees the lagging replicas
+        self.assertEqual(self.index_texts(self.anonymous), [])
+        # Once the pin expires the writer reads from replicas again
+        del self.client.cookies[replicas.PIN_COOKIE]
+        self.sync()
+        self.assertEqual(self.index_texts(self.client), ['my new post'])
+        self.assertNotIn(replicas.PIN_COOKIE, self.client.cookies)
+
+    def test_writer_sees_own_writes_in_cached_html(self):
+        reader = Client()
+        reader.force_login(User.objects.create(username='reader'))
+        self.sync()
+        for client in (self.client, reader, self.anonymous):
+            client.get(reverse('index'))
+        self.client.post(reverse('new_post'), {'text': 'my new post'})
+        # Rendered from a lagging replica under the new version
+        for client in (reader, self.anonymous):
+            self.assertNotContains(client.get(reverse('index')), 'my new post')
+        self.assertContains(self.client.get(reverse('index')), 'my new post')
+
+    def test_other_views_and_writes_use_primary(self):
+        reader = User.objects.create(username='reader')
+        Follow.objects.create(user=reader, author=self.author)
+        Post.objects.create(text='followed', author=self.author)
+        client = Client()
+        client.force_login(reader)
+        response = client.get(reverse('follow_index'))
+        self.assertEqual(
+            [post.text for post in response.context['page']], ['followed']
+        )
+        self.assertNotIn(replicas.PIN_COOKIE, client.cookies)
+        for alias in self.aliases:
+            with connections[alias].cursor() as cursor:
+                cursor.execute('SELECT COUNT(*) FROM posts_post')
+                self.assertEqual(cursor.fetchone()[0], 0)
+
+
+class TestSearch(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='reader')
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def fill(self):
+        self.group = Group.objects.create(
+            title='Звёздные корабли', slug='ships'
+        )
+        self.many = Post.objects.create(
+            text='Корабли, корабли и ещё корабли', author=self.user
+        )
+        self.once = Post.objects.create(
+            text='Один корабли среди звёзд', author=self.user
+        )
+        self.comment = Comment.objects.create(
+            post=self.once, author=self.user, text='Красивые корабли'
+        )
+        Post.objects.create(text='Совсем о другом', author=self.user)
+
+    def found(self, query, **params):
+        response = self.client.get(reverse('search'), dict(params, q=query))
+        return [item for _, item in response.context['page']]
+
+    def test_migration_indexes_through_its_own_connection(self):
+        migration = importlib.import_module('posts.migrations.0014_search')
+        editor = mock.Mock()
+        editor.connection.alias = 'elsewhere'
+        with mock.patch('posts.search.rebuild') as rebuild:
+            migration.build_index(global_apps, editor)
+        rebuild.assert_called_once_with(global_apps, using='elsewhere')
+        with mock.patch('posts.search.connections') as patched:
+            migration.drop_index(global_apps, editor)
+        patched.__getitem__.assert_called_once_with('elsewhere')
+
+    def test_ranked_results_from_both_backends(self):
+        for backend in ('fts5', 'python'):
+            with self.subTest(backend=backend), transaction.atomic(), \
+                    override_settings(SEARCH_BACKEND=backend):
+                self.fill()
+                found = self.found('КОРАБЛИ')
+                self.assertEqual(found[0], self.many)
+                self.assertCountEqual(
+                    found, [self.many, self.once, self.comment, self.group]
+                )
+                self.assertEqual(self.found('корабли звёзд'), [self.once])
+                self.assertEqual(
+                    self.found('корабли', kind='comment'), [self.comment]
+                )
+                self.assertEqual(self.found('"*'), [])
+                transaction.set_rollback(True)
+
+    @override_settings(SEARCH_BACKEND='python')
+    def test_long_words_match_their_indexed_prefix(self):
+        word = 'а' * 70
+        post = Post.objects.create(text=f'{word} и ещё', author=self.user)
+        self.assertEqual(self.found(word), [post])
+
+    def test_index_follows_edits_and_deletes(self):
+        self.fill()
+        self.many.text = 'Переписано'
+        self.many.save()
+        self.assertNotIn(self.many, self.found('корабли'))
+        self.assertEqual(self.found('переписано'), [self.many])
+        self.once.delete()
+        self.assertEqual(self.found('корабли'), [self.group])
+
+    def test_pages_keep_the_query(self):
+        for number in range(12):
+            Post.objects.create(text=f'повтор {number}', author=self.user)
+        response = self.client.get(reverse('search'), {'q': 'повтор'})
+        self.assertEqual(response.context['paginator'].count, 12)
+        self.assertContains(response, 'href="?q=%D0%BF%D0%BE%D0%B2')
+        second = self.client.get(
+            reverse('search'), {'q': 'повтор', 'page': 2}
+        )
+        self.assertEqual(len(second.context['page']), 2)
+
+    def test_admin_search_uses_index(self):
+        self.fill()
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        response = self.client.get('/admin/posts/post/', {'q': 'корабли'})
+        self.assertCountEqual(
+            response.context['cl'].result_list, [self.many, self.once]
+        )
+        # icontains would have matched the substring
+        response = self.client.get('/admin/posts/post/', {'q': 'орабл'})
+        self.assertEqual(list(response.context['cl'].result_list), [])
+
+
+class TestTransfer(TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'dump.ndjson')
+        self.author = User.objects.create(username='author')
+        self.reader = User.objects.create(username='reader')
+        Follow.objects.create(user=self.reader, author=self.author)
+        for number in range(5):
+            post = Post.objects.create(
+                text=f'пост {number}', author=self.author
+            )
+            Comment.objects.create(
+                post=post, author=self.reader, text=f'ответ {number}'
+            )
+        Preference.objects.create(user=self.reader, post=post)
+        self.posts = list(Post.objects.values_list('pk', 'text', 'pub_date'))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def wipe(self):
+        Post.objects.all().delete()
+        Follow.objects.all().delete()
+
+    def crash_after(self, calls):
+        seen = []
+
+        def progress(label, rows):
+            seen.append(label)
+            if len(seen) == calls:
+                raise KeyboardInterrupt
+        return progress
+
+    def test_round_trip_restores_rows_and_derived_data(self):
+        out = StringIO()
+        call_command('export_ndjson', self.path, stdout=out)
+        self.assertIn('rows/s', out.getvalue())
+        self.wipe()
+        call_command('import_ndjson', self.path, stdout=StringIO())
+        self.assertCountEqual(
+            Post.objects.values_list('pk', 'text', 'pub_date'), self.posts
+        )
+        self.assertEqual(Comment.objects.count(), 5)
+        self.assertEqual(Preference.objects.count(), 1)
+        self.assertEqual(Timeline.objects.filter(user=self.reader).count(), 5)
+        self.assertEqual(Counter.objects.get(user=self.author).posts, 5)
+        response = self.client.get(reverse('search'), {'q': 'ответ'})
+        self.assertEqual(response.context['paginator'].count, 5)
+
+    def test_interrupted_export_resumes(self):
+        with self.assertRaises(KeyboardInterrupt):
+            transfer.export_ndjson(
+                self.path, chunk_size=2, progress=self.crash_after(2)
+            )
+        transfer.export_ndjson(self.path, chunk_size=2, resume=True)
+        with open(self.path) as dump:
+            rows = [json.loads(line) for line in dump]
+        self.assertEqual(len(rows), 12)
+        self.assertEqual(
+            len({(row['model'], row['pk']) for row in rows}), len(rows)
+        )
+        self.assertFalse(os.path.exists(f'{self.path}.checkpoint'))
+
+    def test_interrupted_import_resumes(self):
+        transfer.export_ndjson(self.path)
+        self.wipe()
+        with self.assertRaises(KeyboardInterrupt):
+            transfer.import_ndjson(
+                self.path, batch_size=2, progress=self.crash_after(4)
+            )
+        # Posts in batches of 2, 2 and 1, then the first comments
+        self.assertEqual(Post.objects.count(), 5)
+        self.assertEqual(Comment.objects.count(), 2)
+        imported = []
+        transfer.import_ndjson(
+            self.path, batch_size=2, resume=True,
+            progress=lambda label, rows: imported.append(label)
+        )
+        # Only the rest of the file is read again
+        self.assertEqual(imported[0], 'posts.comment')
+        self.assertEqual(Comment.objects.count(), 5)
+        self.assertEqual(Follow.objects.count(), 1)
+
+    def test_rows_already_there_keep_their_dates(self):
+        transfer.export_ndjson(self.path)
+        moved = timezone.now() - timedelta(days=3)
+        Post.objects.filter(pk=self.posts[0][0]).update(pub_date=moved)
+        transfer.import_ndjson(self.path)
+        self.assertEqual(
+            Post.objects.get(pk=self.posts[0][0]).pub_date, moved
+        )
+
+
+@override_settings(BACKGROUND_WORKERS=0)
+class TestTrending(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='author')
+        self.reader = User.objects.create(username='reader')
+        self.client = Client()
+        self.client.force_login(self.reader)
+        self.quiet, self.liked, self.discussed = [
+            Post.objects.create(text=text, author=self.author)
+            for text in ('quiet', 'liked', 'discussed')
+        ]
+
+    def ranking(self, **params):
+        response = self.client.get(reverse('trending'), params)
+        return response, [post.text for post in response.context['page']]
+
+    def like(self, post, user):
+        self.client.force_login(user)
+        self.client.get(reverse('rating_plus', kwargs={
+            'username': post.author.username, 'post_id': post.pk
+        }))
+
+    def test_activity_ranks_posts_incrementally(self):
+        self.like(self.liked, self.reader)
+        for text in ('one', 'two'):
+            Comment.objects.create(
+                post=self.discussed, author=self.reader, text=text
+            )
+        incremental = dict(Trending.objects.values_list('post_id', 'score'))
+        _, texts = self.ranking()
+        self.assertEqual(texts, ['discussed', 'liked', 'quiet'])
+        # The first visit refreshed the table from scratch: same scores
+        for pk, score in Trending.objects.values_list('post_id', 'score'):
+            self.assertAlmostEqual(score, incremental[pk])
+
+    def test_old_activity_decays(self):
+        old = timezone.now() - timedelta(hours=24)
+        Post.objects.filter(pk=self.liked.pk).update(pub_date=old)
+        Preference.objects.bulk_create([
+            Preference(user=self.reader, post=self.liked),
+            Preference(user=self.author, post=self.liked),
+        ])
+        Preference.objects.filter(post=self.liked).update(created=old)
+        trending.refresh()
+        # Three events two half-lives ago count less than one now
+        _, texts = self.ranking()
+        self.assertEqual(texts[-1], 'liked')
+        Post.objects.filter(pk=self.quiet.pk).update(
+            pub_date=timezone.now() - timedelta(days=30)
+        )
+        trending.refresh()
+        self.assertNotIn('quiet', self.ranking()[1])
+
+    def test_refresh_runs_once_it_is_due(self):
+        with mock.patch('posts.trending.refresh') as refresh:
+            cache.set(trending.REFRESHED_KEY, time.time())
+            self.ranking()
+            refresh.assert_not_called()
+            cache.delete(trending.REFRESHED_KEY)
+            self.ranking()
+            refresh.assert_called_once_with()
+
+    @override_settings(CURSOR_PAGINATION_THRESHOLD=5)
+    def test_deep_pages_use_cursors(self):
+        for number in range(12):
+            Post.objects.create(text=f'post {number}', author=self.author)
+        trending.refresh()
+        response, texts = self.ranking()
+        self.assertTrue(response.context['page'].is_cursor)
+        seen = texts
+        while response.context['page'].has_next():
+            response, texts = self.ranking(
+                after=response.context['page'].next_cursor
+            )
+            seen += texts
+        expected = Trending.objects.order_by('-score', '-post').values_list(
+            'post__text', flat=True
+        )
+        self.assertEqual(seen, list(expected))
+        self.assertEqual(len(seen), 15)
+        _, texts = self.ranking(after='bm90IGEgY3Vyc29y')
+        self.assertEqual(len(texts), 10)
+
+
+@override_settings(BACKGROUND_WORKERS=0, LEADERBOARD_SIZE=2, LEADERBOARD_SLACK=2)
+class TestLeaderboards(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.users = [User.objects.create(username=f'user{i}') for i in range(6)]
+        self.group = Group.objects.create(title='busy', slug='busy')
+        self.quiet = Group.objects.create(title='quiet', slug='quiet')
+
+    def follow(self, user, *authors):
+        for author in authors:
+            Follow.objects.create(user=user, author=author)
+
+    def names(self, board):
+        return [(str(item), score) for item, score in leaderboards.top(board)]
+
+    def test_events_update_cached_boards(self):
+        self.follow(self.users[0], self.users[1], self.users[2])
+        self.follow(self.users[3], self.users[1])
+        Counter.objects.all().delete()
+        rebuild_counters()
+        # The first read builds the boards
+        self.assertEqual(self.names('authors'), [('user1', 2), ('user2', 1)])
+        self.follow(self.users[4], self.users[2], self.users[5])
+        self.follow(self.users[3], self.users[2])
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                self.names('authors'), [('user2', 3), ('user1', 2)]
+            )
+        with self.assertNumQueries(0):
+            self.names('authors')
+        Follow.objects.filter(author=self.users[2]).delete()
+        self.assertEqual(self.names('authors'), [('user1', 2), ('user5', 1)])
+
+    def test_posts_and_likes_of_the_week(self):
+        post = Post.objects.create(
+            text='liked', author=self.users[0], group=self.group
+        )
+        Post.objects.create(text='other', author=self.users[0])
+        self.assertEqual(self.names('groups'), [('busy', 1)])
+        self.assertEqual(self.names('posts'), [])
+        Preference.objects.create(user=self.users[1], post=post)
+        Post.objects.create(
+            text='second', author=self.users[1], group=self.group
+        )
+        Post.objects.create(
+            text='third', author=self.users[1], group=self.quiet
+        )
+        self.assertEqual(self.names('groups'), [('busy', 2), ('quiet', 1)])
+        self.assertEqual(len(self.names('posts')), 1)
+        client = Client()
+        client.force_login(self.users[1])
+        client.get(reverse('rating_minus', kwargs={
+            'username': 'user0', 'post_id': post.pk
+        }))
+        self.assertEqual(self.names('posts'), [])
+        Preference.objects.create(user=self.users[1], post=post)
+        self.assertEqual(len(self.names('posts')), 1)
+        # Older than the window: gone after the periodic rebuild
+        Preference.objects.update(created=timezone.now() - timedelta(days=8))
+        leaderboards.rebuild_all()
+        self.assertEqual(self.names('posts'), [])
+
+    def test_widgets_render(self):
+        self.follow(self.users[0], self.users[1])
+        Post.objects.create(
+            text='post', author=self.users[0], group=self.group
+        )
+        client = Client()
+        client.force_login(self.users[0])
+        rebuild_counters()
+        leaderboards.rebuild_all()
+        self.assertContains(client.get(reverse('index')), 'Самые популярные')
+        self.assertContains(client.get(reverse('group')), 'busy')
+
+
+@override_settings(COMMENTS_PER_PAGE=20)
+class TestCommentPages(TestCase):
+    def setUp(self):
+        self.author = User.objects.create(username='author')
+        self.post = Post.objects.create(text='popular', author=self.author)
+        self.kwargs = {'username': 'author', 'post_id': self.post.pk}
+        self.client = Client()
+        self.client.force_login(self.author)
+
+    def comment(self, count):
+        start = Comment.objects.count()
+        for number in range(start, start + count):
+            commenter = User.objects.create(username=f'c{number}')
+            Comment.objects.create(
+                post=self.post, author=commenter, text=f'comment {number}'
+            )
+
+    def test_post_page_shows_the_newest_page(self):
+        self.comment(45)
+        response = self.client.get(reverse('post', kwargs=self.kwargs))
+        items = response.context['items']
+        self.assertIsInstance(items, list)
+        self.assertEqual(
+            [item.text for item in items],
+            [f'comment {number}' for number in range(44, 24, -1)]
+        )
+        self.assertContains(response, 'Показать ещё')
+        older = self.client.get(
+            reverse('post', kwargs=self.kwargs),
+            {'after': response.context['next_comments']}
+        )
+        self.assertEqual(older.context['items'][0].text, 'comment 24')
+
+    def test_queries_do_not_grow_with_comments(self):
+        self.comment(3)
+        url = reverse('post', kwargs=self.kwargs)
+        self.client.get(url)  # creates the author's counter
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(url)
+        self.comment(40)
+        with self.assertNumQueries(len(few)):
+            self.client.get(url)
+
+    def test_json_pages_walk_all_comments(self):
+        self.comment(45)
+        url = reverse('post_comments', kwargs=self.kwargs)
+        seen = []
+        while url:
+            page = self.client.get(url).json()
+            seen += [comment['text'] for comment in page['comments']]
+            url = page['next']
+        self.assertEqual(
+            seen, [f'comment {number}' for number in range(44, -1, -1)]
+        )
+        first = self.client.get(
+            reverse('post_comments', kwargs=self.kwargs), {'after': 'junk'}
+        ).json()
+        self.assertEqual(first['comments'][0]['text'], 'comment 44')
+        self.assertEqual(first['comments'][0]['author'], 'c44')
+        missing = reverse(
+            'post_comments', kwargs={'username': 'nobody', 'post_id': 1}
+        )
+        self.assertEqual(self.client.get(missing).status_code, 404)
+
+
+@override_settings(BACKGROUND_WORKERS=0)
+class TestConditionalGet(TestCase):
+    def setUp(self):
+        self.author = User.objects.create(username='author')
+        self.reader = User.objects.create(username='reader')
+        self.group = Group.objects.create(title='group', slug='group')
+        self.post = Post.objects.create(
+            text='first', author=self.author, group=self.group
+        )
+        self.kwargs = {'username': 'author', 'post_id': self.post.pk}
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.client = Client()
+        self.client.force_login(self.reader)
+        self.urls = [
+            reverse('index'),
+            reverse('group_posts', args=['group']),
+            reverse('profile', args=['author']),
+            reverse('post', kwargs=self.kwargs),
+        ]
+
+    def etags(self, urls=None):
+        # Fresh validators, after a first load built anything lazy
+        tags = {}
+        for url in urls or self.urls:
+            self.client.get(url)
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            tags[url] = response['ETag']
+        return tags
+
+    def revalidate(self, tags):
+        return {
+            url: self.client.get(url, HTTP_IF_NONE_MATCH=tag).status_code
+            for url, tag in tags.items()
+        }
+
+    def test_unchanged_pages_answer_304(self):
+        tags = self.etags()
+        self.assertEqual(set(self.revalidate(tags).values()), {304})
+        response = self.client.get(self.urls[0])
+        self.assertIn('Last-Modified', response)
+        self.assertIn('no-cache', response['Cache-Control'])
+        modified = self.client.get(
+            self.urls[0], HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        )
+        self.assertEqual(modified.status_code, 304)
+
+    def test_304_skips_rendering(self):
+        tags = self.etags()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                self.urls[3], HTTP_IF_NONE_MATCH=tags[self.urls[3]]
+            )
+        self.assertEqual(response.status_code, 304)
+        # The session, the user and one MAX()
+        self.assertLessEqual(len(queries), 3)
+
+    def test_validators_differ_per_user(self):
+        tags = self.etags()
+        other = self.author_client.get(
+            self.urls[0], HTTP_IF_NONE_MATCH=tags[self.urls[0]]
+        )
+        self.assertEqual(other.status_code, 200)
+
+    def test_edit_invalidates(self):
+        tags = self.etags()
+        self.author_client.post(
+            reverse('post_edit', kwargs=self.kwargs), {'text': 'edited'}
+        )
+        self.assertEqual(set(self.revalidate(tags).values()), {200})
+
+    def test_changes_outside_the_views_invalidate(self):
+        tags = self.etags()
+        self.post.text = 'edited in the admin'
+        self.post.save()
+        self.assertEqual(set(self.revalidate(tags).values()), {200})
+        post_url = self.urls[3]
+        comment = Comment.objects.create(
+            post=self.post, author=self.reader, text='hello'
+        )
+        tags = self.etags([post_url])
+        comment.delete()
+        self.assertEqual(self.revalidate(tags), {post_url: 200})
+
+    def test_comment_invalidates(self):
+        tags = self.etags()
+        self.client.post(
+            reverse('add_comment', kwargs=self.kwargs), {'text': 'hello'}
+        )
+        changed = self.revalidate(tags)
+        self.assertEqual(changed[self.urls[3]], 200)
+        self.assertEqual(changed[self.urls[0]], 200)  # comment counts
+
+    def test_like_and_unlike_invalidate(self):
+        for name in ('rating_plus', 'rating_minus'):
+            tags = self.etags()
+            self.client.get(reverse(name, kwargs=self.kwargs))
+            self.assertEqual(set(self.revalidate(tags).values()), {200})
+
+    def test_delete_invalidates(self):
+        tags = self.etags(self.urls[:3])
+        self.author_client.get(reverse('post_delete', kwargs=self.kwargs))
+        self.assertEqual(set(self.revalidate(tags).values()), {200})
+        self.assertEqual(self.client.get(self.urls[3]).status_code, 404)
+
+    def test_follow_invalidates_profile(self):
+        tags = self.etags(self.urls[2:])
+        self.client.get(reverse('profile_follow', args=['author']))
+        self.assertEqual(set(self.revalidate(tags).values()), {200})
+
+    def test_lost_stamps_never_give_a_stale_304(self):
+        tags = self.etags()
+        cache.clear()
+        self.assertEqual(set(self.revalidate(tags).values()), {200})
+
+
+@override_settings(
+    BACKGROUND_WORKERS=0, PAGE_CACHE_TTL=60, PAGE_CACHE_LOCK_TIMEOUT=0.2
+)
+class TestPageCache(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='author')
+        self.cats = Group.objects.create(title='cats', slug='cats')
+        self.dogs = Group.objects.create(title='dogs', slug='dogs')
+        self.post = Post.objects.create(
+            text='first', author=self.author, group=self.cats
+        )
+        self.urls = {
+            'index': reverse('index'),
+            'cats': reverse('group_posts', args=['cats']),
+            'dogs': reverse('group_posts', args=['dogs']),
+            'author': reverse('profile', args=['author']),
+        }
+        for url in self.urls.values():
+            self.client.get(url)
+
+    def served(self, name, **params):
+        return self.client.get(self.urls[name], params)['X-Page-Cache']
+
+    def lock(self, name):
+        request = RequestFactory().get(self.urls[name])
+        cache.set(f'{page_cache._key(request)}:lock', 1)
+
+    def test_anonymous_pages_come_from_the_cache(self):
+        for name in self.urls:
+            self.assertEqual(self.served(name), 'hit')
+        self.assertEqual(self.served('index', page=2), 'miss')
+        with self.assertNumQueries(1):  # the conditional GET's MAX()
+            self.client.get(self.urls['index'])
+
+    def test_logged_in_visitors_bypass_it(self):
+        self.client.force_login(self.author)
+        response = self.client.get(self.urls['index'])
+        self.assertNotIn('X-Page-Cache', response)
+
+    def test_new_post_purges_its_pages_only(self):
+        self.served('index', page=2)
+        Post.objects.create(text='second', author=self.author, group=self.cats)
+        for name in ('index', 'cats', 'author'):
+            self.assertEqual(self.served(name), 'miss')
+        self.assertEqual(self.served('index', page=2), 'miss')
+        self.assertEqual(self.served('dogs'), 'hit')
+        self.assertContains(self.client.get(self.urls['cats']), 'second')
+
+    def test_comment_purges(self):
+        Comment.objects.create(post=self.post, author=self.author, text='hi')
+        self.assertEqual(self.served('cats'), 'miss')
+        self.assertEqual(self.served('dogs'), 'hit')
+
+    def test_moving_a_post_purges_both_groups(self):
+        client = Client()
+        client.force_login(self.author)
+        client.post(
+            reverse('post_edit', args=['author', self.post.pk]),
+            {'text': 'moved', 'group': self.dogs.pk}
+        )
+        self.assertEqual(self.served('cats'), 'miss')
+        self.assertEqual(self.served('dogs'), 'miss')
+
+    def test_delete_purges(self):
+        self.post.delete()
+        self.assertEqual(self.served('author'), 'miss')
+
+    def test_stale_copy_while_another_request_renders(self):
+        Post.objects.create(text='zebra', author=self.author)
+        self.lock('index')
+        response = self.client.get(self.urls['index'])
+        self.assertEqual(response['X-Page-Cache'], 'stale')
+        self.assertNotContains(response, 'zebra')
+        self.assertNotEqual(response['ETag'], self.etag('index'))
+
+    def test_pages_with_outdated_fragments_are_not_kept(self):
+        Post.objects.create(text='zebra', author=self.author)
+        bump_generation(POSTS)
+        key = make_template_fragment_key('index_page', [False, ''])
+        cache.set(f'default:{key}:lock', 1)
+        response = self.client.get(self.urls['index'])
+        self.assertNotContains(response, 'zebra')
+        self.assertNotIn('ETag', response)
+        self.assertEqual(self.served('index'), 'miss')
+
+    def etag(self, name):
+        # What a fresh render would be sent with
+        with self.settings(PAGE_CACHE_TTL=0):
+            return self.client.get(self.urls[name])['ETag']
+
+    def test_copies_keep_the_validators_they_were_rendered_with(self):
+        etag = self.client.get(self.urls['author'])['ETag']
+        fan = User.objects.create(username='fan')
+        client = Client()
+        client.force_login(fan)
+        client.get(reverse('profile_follow', args=['author']))
+        response = self.client.get(self.urls['author'])
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertEqual(response['ETag'], etag)
+        self.assertNotEqual(self.etag('author'), etag)
+        cached = self.client.get(self.urls['author'], HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.status_code, 304)
+
+    def test_without_a_copy_waits_for_the_lock(self):
+        self.lock('index')
+        cache.delete(page_cache._key(RequestFactory().get(self.urls['index'])))
+        started = time.monotonic()
+        self.assertEqual(self.served('index'), 'miss')
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+
+
+@override_settings(
+    CACHE_LOCK_TIMEOUT=1, CACHE_POLL_INTERVAL=0.01, CACHE_EARLY_EXPIRY_BETA=0
+)
+class TestRemember(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.computed = []
+
+    def compute(self, value, seconds=0):
+        def compute():
+            time.sleep(seconds)
+            self.computed.append(value)
+            return value
+        return compute
+
+    def test_fresh_value_is_computed_once(self):
+        self.assertEqual(remember('k', self.compute(1), 60), 1)
+        self.assertEqual(remember('k', self.compute(2), 60), 1)
+        self.assertEqual(self.computed, [1])
+
+    def test_new_version_or_expiry_recomputes(self):
+        remember('k', self.compute(1), 60, version='a')
+        self.assertEqual(remember('k', self.compute(2), 60, version='b'), 2)
+        remember('e', self.compute(3), 0)
+        self.assertEqual(remember('e', self.compute(4), 0), 4)
+
+    def test_stale_value_while_another_request_recomputes(self):
+        remember('k', self.compute(1), 60, version='a')
+        cache.set('default:k:lock', 1)
+        reset_outdated()
+        self.assertEqual(remember('k', self.compute(2), 60, version='b'), 1)
+        self.assertEqual(self.computed, [1])
+        self.assertTrue(served_outdated())
+
+    def test_single_flight_without_a_copy(self):
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                remember('k', self.compute('slow', 0.2), 60)
+            ))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['slow'] * 8)
+        self.assertEqual(self.computed, ['slow'])
+
+    def test_gives_up_waiting_for_a_stuck_lock(self):
+        cache.set('default:k:lock', 1)
+        self.assertEqual(remember('k', self.compute(1), 60), 1)
+        self.assertTrue(cache.get('default:k:lock'))  # not ours to release
+
+    def test_early_expiration(self):
+        remember('k', self.compute(1, 0.05), 60)
+        with override_settings(CACHE_EARLY_EXPIRY_BETA=10 ** 6):
+            self.assertEqual(remember('k', self.compute(2), 60), 2)
+
+    def test_template_tag(self):
+        template = Template(
+            '{% load swr_cache %}'
+            '{% swrcache 60 fragment page version=version %}'
+            '{{ value }}{% endswrcache %}'
+        )
+        render = lambda **context: template.render(Context(context))
+        self.assertEqual(render(page=1, version=1, value='a'), 'a')
+        self.assertEqual(render(page=1, version=1, value='b'), 'a')
+        self.assertEqual(render(page=2, version=1, value='c'), 'c')
+        self.assertEqual(render(page=1, version=2, value='d'), 'd')
+
+
+@override_settings(
+    BACKGROUND_WORKERS=0, IMAGE_VARIANT_WIDTHS=(320, 640, 960, 1920),
+    IMAGE_VARIANT_FORMATS=('avif', 'webp', 'jpeg')
+)
+class TestImageVariants(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media)
+        self.settings_override.enable()
+        self.user = User.objects.create(username='arthur')
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media, ignore_errors=True)
+
+    def upload(self, **kwargs):
+        self.client.post(reverse('new_post'), {
+            'text': 'with image', 'image': make_image(**kwargs)
+        })
+        return Post.objects.get(text='with image')
+
+    def test_upload_records_variants_no_wider_than_it(self):
+        post = self.upload(size=(1200, 800))
+        files = json.loads(post.image_variants)['files']
+        self.assertIn('webp', files)
+        self.assertEqual([size[0] for size in files['jpeg']], [320, 640, 960])
+        for width, height, path, size in files['webp']:
+            self.assertEqual(height, round(width * 339 / 960))
+            self.assertTrue(os.path.exists(os.path.join(self.media, path)))
+            with Image.open(os.path.join(self.media, path)) as image:
+                self.assertEqual(image.format, 'WEBP')
+                self.assertEqual(image.size, (width, height))
+
+    def test_pages_render_a_picture(self):
+        post = self.upload()
+        response = self.client.get(reverse('post', args=['arthur', post.pk]))
+        self.assertContains(response, '<source type="image/webp"')
+        self.assertContains(response, '_320w.webp 320w')
+        self.assertContains(response, 'src="/media/variants/posts/photo_960w.jpeg"')
+        self.assertContains(self.client.get(reverse('index')), '<picture>')
+
+    def test_profile_photo(self):
+        self.client.post(
+            reverse('profile_edit', args=['arthur']),
+            {'text': 'me', 'image': make_image('me.jpg', (400, 400))}
+        )
+        response = self.client.get(reverse('profile', args=['arthur']))
+        self.assertContains(response, 'me_320w.webp 320w')
+
+    def test_replaced_image_drops_the_old_variants(self):
+        post = self.upload()
+        old = json.loads(post.image_variants)['files']['webp'][0][2]
+        self.client.post(
+            reverse('post_edit', args=['arthur', post.pk]),
+            {'text': 'with image', 'image': make_image('other.jpg')}
+        )
+        post.refresh_from_db()
+        self.assertIn('other_320w', post.image_variants)
+        self.assertFalse(os.path.exists(os.path.join(self.media, old)))
+
+    def test_records_the_names_the_storage_gave(self):
+        post = self.upload()
+        first = json.loads(post.image_variants)['files']['webp']
+        Post.objects.filter(pk=post.pk).update(image_variants='')
+        # Files it could not delete make it pick other names
+        with mock.patch.object(images.default_storage, 'delete'):
+            images.build('posts.post', post.pk)
+        post.refresh_from_db()
+        files = json.loads(post.image_variants)['files']['webp']
+        for (_, _, old, _), (_, _, new, _) in zip(first, files):
+            self.assertNotEqual(new, old)
+            self.assertTrue(os.path.exists(os.path.join(self.media, new)))
+
+    def test_builds_are_invalidated_in_one_batch(self):
+        posts = []
+        for name in ('one.jpg', 'two.jpg'):
+            post = Post.objects.create(text=name, author=self.user)
+            post.image.save(name, make_image(name))
+            posts.append(post)
+        with mock.patch('posts.tasks.submit') as submit:
+            for post in posts:
+                images.schedule(post)
+        self.assertEqual(submit.call_count, 1)
+        generation = get_generation(POSTS)
+        images.build_pending()
+        self.assertEqual(get_generation(POSTS), generation + 1)
+        for post in posts:
+            post.refresh_from_db()
+            self.assertIsNotNone(images.recorded(post))
+
+    def test_unreadable_image_is_recorded_once(self):
+        post = Post.objects.create(text='broken', author=self.user)
+        post.image.save('broken.jpg', SimpleUploadedFile('broken.jpg', b'x'))
+        self.assertIsNone(images.variants(post))
+        post.refresh_from_db()
+        self.assertEqual(json.loads(post.image_variants)['files'], {})
+        with mock.patch('posts.images.schedule') as schedule:
+            self.assertIsNone(images.variants(post))
+        schedule.assert_not_called()
+
+    def test_savings_report(self):
+        path = os.path.join(self.media, 'big.jpg')
+        with open(path, 'wb') as image:
+            image.write(make_image(size=(2400, 1600)).read())
+        out = StringIO()
+        call_command('image_savings', self.media, stdout=out)
+        self.assertIn('big.jpg', out.getvalue())
+        self.assertIn('webp', out.getvalue())
+
+    def test_savings_report_skips_unreadable_images(self):
+        with open(os.path.join(self.media, 'broken.jpg'), 'wb') as image:
+            image.write(b'x')
+        with open(os.path.join(self.media, 'good.jpg'), 'wb') as image:
+            image.write(make_image().read())
+        out, err = StringIO(), StringIO()
+        call_command('image_savings', self.media, stdout=out, stderr=err)
+        self.assertIn('good.jpg', out.getvalue())
+        self.assertNotIn('broken.jpg', out.getvalue())
+        self.assertIn('Skipped 1 unreadable images', err.getvalue())
+        os.remove(os.path.join(self.media, 'good.jpg'))
+        with self.assertRaises(CommandError):
+            call_command('image_savings', self.media, stderr=StringIO())
@@ -0,0 +1,66 @@
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings
+from sorl.thumbnail.images import ImageFile
+
+from . import tasks
+from .models import Post, Profile_Author
+from .page_cache import invalidate
+
+# Geometry and options used by the templates; they must match exactly
+# or the pre-generated file gets a different name
+POST_THUMBNAIL = ('960x339', {'crop': 'center', 'upscale': True})
+PROFILE_THUMBNAIL = ('1100x952', {'crop': 'center', 'upscale': True})
+
+
+class DeferredThumbnailBackend(ThumbnailBackend):
+    """Thumbnail backend that never resizes during a page render.
+
+    ``{% thumbnail ... lazy=True %}`` returns the thumbnail only if it
+    already exists; otherwise generation is queued to the background
+    workers and the tag renders its ``{% empty %}`` placeholder.
+    """
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        if not options.pop('lazy', False):
+            return super().get_thumbnail(file_, geometry_string, **options)
+        cached = self.cached_thumbnail(file_, geometry_string, options)
+        if cached:
+            return cached
+        pregenerate(file_, geometry_string, options)
+        return None
+
+    def cached_thumbnail(self, file_, geometry_string, options):
+        # Same option normalisation as ThumbnailBackend.get_thumbnail
+        source = ImageFile(file_)
+        options = dict(options)
+        if settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(settings, attr)
+            if value != getattr(default_settings, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return default.kvstore.get(ImageFile(name, default.storage))
+
+
+def generate(name, geometry_string, options):
+    ThumbnailBackend().get_thumbnail(name, geometry_string, **options)
+    # Pages rendered meanwhile were cached with the placeholder
+    invalidate(
+        *Post.objects.filter(image=name).select_related('author', 'group'),
+        *Profile_Author.objects.filter(image=name).select_related('author')
+    )
+
+
+def pregenerate(image, geometry_string, options):
+    if not image:
+        return
+    name = getattr(image, 'name', image)
+    tasks.submit(
+        ('thumbnail', name, geometry_string),
+        generate, name, geometry_string, options
+    )
@@ -0,0 +1,126 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+
+from .models import Counter, Follow, Post, Timeline
+
+
+def is_celebrity(author):
+    # Too many followers to copy every post into every timeline.
+    # Must agree with the read side in timeline_posts(); catch_up()
+    # fills the gap when an author drops back under the limit.
+    return Counter.objects.filter(
+        user=author, followers__gt=settings.TIMELINE_FANOUT_LIMIT
+    ).exists()
+
+
+def fan_out(post):
+    if is_celebrity(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    Timeline.objects.bulk_create(
+        (
+            Timeline(user_id=user_id, post=post, pub_date=post.pub_date)
+            for user_id in followers.iterator()
+        ),
+        batch_size=500,
+        ignore_conflicts=True
+    )
+
+
+def backfill(user_id, author_id):
+    if is_celebrity(author_id):
+        return
+    posts = Post.objects.filter(
+        author_id=author_id
+    ).values_list('pk', 'pub_date')
+    Timeline.objects.bulk_create(
+        (
+            Timeline(user_id=user_id, post_id=pk, pub_date=pub_date)
+            for pk, pub_date in posts.iterator()
+        ),
+        batch_size=500,
+        ignore_conflicts=True
+    )
+
+
+def catch_up(author_id):
+    # After an unfollow: if that took the author back under the limit,
+    # timeline_posts() stops merging them at read time, so copy in what
+    # fan_out() skipped meanwhile. Only rows actually missing are written.
+    if is_celebrity(author_id):
+        return False
+    tables = {
+        model.__name__.lower(): connection.ops.quote_name(model._meta.db_table)
+        for model in (Timeline, Follow, Post)
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {tables["timeline"]} (user_id, post_id, pub_date) '
+            f'SELECT follow.user_id, post.id, post.pub_date '
+            f'FROM {tables["follow"]} follow '
+            f'INNER JOIN {tables["post"]} post '
+            f'ON post.author_id = follow.author_id '
+            f'WHERE follow.author_id = %s AND NOT EXISTS ('
+            f'SELECT 1 FROM {tables["timeline"]} timeline '
+            f'WHERE timeline.user_id = follow.user_id '
+            f'AND timeline.post_id = post.id)',
+            [author_id]
+        )
+        return cursor.rowcount > 0
+
+
+def clean_up(user_id, author_id):
+    Timeline.objects.filter(
+        user_id=user_id, post__author_id=author_id
+    ).delete()
+
+
+@transaction.atomic
+def rebuild_timelines():
+    # One INSERT ... SELECT instead of a backfill() per follow
+    Timeline.objects.all().delete()
+    tables = {
+        model.__name__.lower(): connection.ops.quote_name(model._meta.db_table)
+        for model in (Timeline, Follow, Post, Counter)
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {tables["timeline"]} (user_id, post_id, pub_date) '
+            f'SELECT follow.user_id, post.id, post.pub_date '
+            f'FROM {tables["follow"]} follow '
+            f'INNER JOIN {tables["post"]} post '
+            f'ON post.author_id = follow.author_id '
+            f'LEFT OUTER JOIN {tables["counter"]} counter '
+            f'ON counter.user_id = follow.author_id '
+            f'WHERE COALESCE(counter.followers, 0) <= %s',
+            [settings.TIMELINE_FANOUT_LIMIT]
+        )
+
+
+# Cursor key for timeline_posts() querysets
+TIMELINE_KEY = ('feed_date', 'feed_post')
+
+
+def timeline_posts(user):
+    celebrities = [
+        follow.author for follow in Follow.objects.filter(
+            user=user,
+            author__counter__followers__gt=settings.TIMELINE_FANOUT_LIMIT
+        ).select_related('author')
+    ]
+    posts = Post.objects.feed()
+    if not celebrities:
+        # Page on the timeline's own columns so its index does the sorting
+        return posts.filter(timeline__user=user).annotate(
+            feed_date=F('timeline__pub_date'), feed_post=F('timeline__post')
+        ).order_by('-feed_date', '-feed_post')
+    # Hybrid: fanned-out posts plus a read-time merge of big authors
+    return posts.filter(
+        Q(pk__in=Timeline.objects.filter(user=user).values('post'))
+        | Q(author__in=celebrities)
+    ).annotate(
+        feed_date=F('pub_date'), feed_post=F('pk')
+    ).order_by('-feed_date', '-feed_post')
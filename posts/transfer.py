@@ -0,0 +1,229 @@
+import json
+import os
+import time
+from datetime import datetime
+
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+
+from . import search, trending
+from .cache import POSTS, bump_generation
+from .counters import rebuild_counters
+from .models import Comment, Follow, Post, Preference, Profile_Author
+from .seed import backdate
+from .timeline import rebuild_timelines
+
+# Exported in this order, so rows only point at rows already imported.
+# Users and groups are not here: load them first, e.g. with dumpdata.
+MODELS = {
+    model._meta.label_lower: model
+    for model in (Post, Comment, Follow, Preference, Profile_Author)
+}
+
+
+class Encoder(DjangoJSONEncoder):
+    def default(self, o):
+        # DjangoJSONEncoder drops microseconds, keep them for a round trip
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def columns(model):
+    return [
+        field for field in model._meta.concrete_fields
+        if not field.primary_key
+    ]
+
+
+class Checkpoint:
+    """Progress of an export or import kept next to the data file.
+
+    Saved after every chunk that reached the file or the database, so
+    a run that died can carry on from there with --resume.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.state = {}
+
+    def load(self):
+        if os.path.exists(self.path):
+            with open(self.path) as checkpoint:
+                self.state = json.load(checkpoint)
+        return self.state
+
+    def save(self, **state):
+        self.state.update(state)
+        partial = f'{self.path}.tmp'
+        with open(partial, 'w') as checkpoint:
+            json.dump(self.state, checkpoint)
+        os.replace(partial, self.path)
+
+    def delete(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class Throughput:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.rows = {}
+        self.seconds = {}
+
+    def add(self, label, rows, seconds):
+        self.rows[label] = self.rows.get(label, 0) + rows
+        self.seconds[label] = self.seconds.get(label, 0) + seconds
+
+    def report(self):
+        lines = []
+        for label, rows in self.rows.items():
+            seconds = self.seconds[label]
+            lines.append(
+                f'{label}: {rows} rows in {seconds:.2f}s, '
+                f'{rows / seconds if seconds else 0:.0f} rows/s'
+            )
+        total = sum(self.rows.values())
+        wall = time.perf_counter() - self.started
+        lines.append(
+            f'total: {total} rows in {wall:.2f}s, '
+            f'{total / wall if wall else 0:.0f} rows/s'
+        )
+        return lines
+
+
+def export_ndjson(path, labels=None, chunk_size=2000, resume=False,
+                  progress=None):
+    """Write the rows of MODELS to ``path``, one JSON object per line.
+
+    Rows are read in primary key order a chunk at a time (keyset, no
+    OFFSET), so memory stays flat however big the tables are.
+    """
+    checkpoint = Checkpoint(f'{path}.checkpoint')
+    state = checkpoint.load() if resume else {}
+    done = state.get('done', {})
+    throughput = Throughput()
+    with open(path, 'ab' if resume else 'wb') as stream:
+        # Whatever was written after the last checkpoint is redone
+        stream.truncate(state.get('offset', 0))
+        stream.seek(0, os.SEEK_END)
+        for label in labels or MODELS:
+            model = MODELS[label]
+            fields = columns(model)
+            names = [field.attname for field in fields]
+            last = done.get(label, 0)
+            while True:
+                started = time.perf_counter()
+                chunk = list(
+                    model.objects.filter(pk__gt=last).order_by('pk')
+                    .values_list('pk', *names)[:chunk_size]
+                )
+                if not chunk:
+                    break
+                stream.write(b''.join(
+                    json.dumps({
+                        'model': label,
+                        'pk': row[0],
+                        'fields': dict(zip(names, row[1:])),
+                    }, cls=Encoder, ensure_ascii=False).encode()
+                    + b'\n'
+                    for row in chunk
+                ))
+                stream.flush()
+                last = chunk[-1][0]
+                done[label] = last
+                checkpoint.save(done=done, offset=stream.tell())
+                throughput.add(
+                    label, len(chunk), time.perf_counter() - started
+                )
+                if progress:
+                    progress(label, throughput.rows[label])
+    checkpoint.delete()
+    return throughput
+
+
+def read_batches(stream, batch_size):
+    # (label, rows, offset after them); a batch never mixes models
+    label, rows = None, []
+    offset = stream.tell()
+    for line in stream:
+        offset += len(line)
+        if not line.strip():
+            continue
+        row = json.loads(line)
+        if rows and (row['model'] != label or len(rows) == batch_size):
+            yield label, rows, offset - len(line)
+            rows = []
+        label = row['model']
+        rows.append(row)
+    if rows:
+        yield label, rows, offset
+
+
+def build(model, rows):
+    fields = columns(model)
+    objects = []
+    for row in rows:
+        values = row['fields']
+        objects.append(model(pk=row['pk'], **{
+            field.attname: field.to_python(values[field.attname])
+            for field in fields if field.attname in values
+        }))
+    return objects
+
+
+def import_ndjson(path, batch_size=1000, resume=False, progress=None):
+    """Load a file made by export_ndjson, batch by batch.
+
+    Rows whose primary key exists are left alone, so a batch that was
+    committed but not checkpointed can be replayed safely. Counters,
+    timelines, the search index and trending are rebuilt at the end, as
+    bulk_create sends no signals.
+    """
+    checkpoint = Checkpoint(f'{path}.checkpoint')
+    state = checkpoint.load() if resume else {}
+    throughput = Throughput()
+    with open(path, 'rb') as stream:
+        stream.seek(state.get('offset', 0))
+        for label, rows, offset in read_batches(stream, batch_size):
+            model = MODELS[label]
+            started = time.perf_counter()
+            objects = build(model, rows)
+            with transaction.atomic():
+                # Only the new rows: a replayed batch must not backdate
+                # what was imported, or edited, since
+                existing = set(model.objects.filter(
+                    pk__in=[obj.pk for obj in objects]
+                ).values_list('pk', flat=True))
+                objects = [obj for obj in objects if obj.pk not in existing]
+                # bulk_create stamps these with now, put the originals back
+                stamps = {
+                    field.column: [
+                        getattr(obj, field.attname) for obj in objects
+                    ]
+                    for field in columns(model)
+                    if getattr(field, 'auto_now_add', False)
+                }
+                model.objects.bulk_create(objects, ignore_conflicts=True)
+                for column, moments in stamps.items():
+                    backdate(
+                        model, column, [obj.pk for obj in objects], moments
+                    )
+            checkpoint.save(offset=offset)
+            throughput.add(label, len(rows), time.perf_counter() - started)
+            if progress:
+                progress(label, throughput.rows[label])
+    reset = connection.ops.sequence_reset_sql(no_style(), MODELS.values())
+    if reset:
+        with connection.cursor() as cursor:
+            for sql in reset:
+                cursor.execute(sql)
+    with transaction.atomic():
+        rebuild_counters()
+        rebuild_timelines()
+        search.rebuild()
+    trending.refresh()
+    bump_generation(POSTS)
+    checkpoint.delete()
+    return throughput
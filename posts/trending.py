@@ -0,0 +1,116 @@
+import math
+import time
+from datetime import datetime, timedelta
+from itertools import chain
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import tasks
+from .models import Comment, Post, Preference, Trending
+
+# Scores are logs of activity decayed towards this fixed moment, so
+# every stored score is on the same scale and none has to be decayed
+# again as time passes: newer events simply weigh exponentially more.
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+TRENDING_KEY = ('trending_score', 'trending_post')
+REFRESHED_KEY = 'trending:refreshed'
+
+
+def event_score(kind, moment):
+    hours = (moment - EPOCH).total_seconds() / 3600
+    return (
+        math.log(settings.TRENDING_WEIGHTS[kind])
+        + hours / settings.TRENDING_HALF_LIFE * math.log(2)
+    )
+
+
+def log_add(total, score):
+    # log(exp(total) + exp(score)) without overflowing
+    if total is None:
+        return score
+    high, low = max(total, score), min(total, score)
+    return high + math.log1p(math.exp(low - high))
+
+
+def add_event(post_id, kind, moment):
+    """Fold one post, comment or like into the post's trending score.
+
+    Two concurrent events can race and one of them be lost; the next
+    refresh() recomputes the scores from scratch anyway.
+    """
+    score = event_score(kind, moment)
+    current = Trending.objects.filter(post_id=post_id).values_list(
+        'score', flat=True
+    ).first()
+    if current is None:
+        Trending.objects.bulk_create(
+            [Trending(post_id=post_id, score=score)], ignore_conflicts=True
+        )
+    else:
+        Trending.objects.filter(post_id=post_id).update(
+            score=log_add(current, score)
+        )
+
+
+def events(since):
+    # (post id, kind, moment) of everything that happened since then
+    return chain(
+        (
+            (pk, 'post', moment) for pk, moment in Post.objects.filter(
+                pub_date__gte=since
+            ).values_list('pk', 'pub_date').iterator()
+        ),
+        (
+            (pk, 'comment', moment) for pk, moment in Comment.objects.filter(
+                created__gte=since
+            ).values_list('post_id', 'created').iterator()
+        ),
+        (
+            (pk, 'like', moment) for pk, moment in Preference.objects.filter(
+                created__gte=since
+            ).values_list('post_id', 'created').iterator()
+        ),
+    )
+
+
+def refresh(now=None):
+    """Recompute the ranking table from the last TRENDING_WINDOW_DAYS.
+
+    Drops posts nobody touched in the window and corrects anything the
+    incremental updates missed: races, unlikes, deleted comments.
+    """
+    now = now or timezone.now()
+    since = now - timedelta(days=settings.TRENDING_WINDOW_DAYS)
+    scores = {}
+    for post_id, kind, moment in events(since):
+        scores[post_id] = log_add(
+            scores.get(post_id), event_score(kind, moment)
+        )
+    with transaction.atomic():
+        Trending.objects.all().delete()
+        Trending.objects.bulk_create(
+            (Trending(post_id=pk, score=score) for pk, score in scores.items()),
+            batch_size=500
+        )
+    cache.set(REFRESHED_KEY, now.timestamp(), None)
+    return len(scores)
+
+
+def schedule_refresh():
+    # Runs refresh() in the background once it is due; readers never wait
+    refreshed = cache.get(REFRESHED_KEY, 0)
+    if time.time() - refreshed >= settings.TRENDING_REFRESH_INTERVAL:
+        tasks.submit(REFRESHED_KEY, refresh)
+
+
+def trending_posts():
+    # Both sort keys from the ranking table, so trending_score_idx is
+    # walked in order and nothing is sorted
+    return Post.objects.feed().filter(trending__isnull=False).annotate(
+        trending_score=F('trending__score'),
+        trending_post=F('trending__post'),
+    ).order_by('-trending_score', '-trending_post')
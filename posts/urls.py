@@ -6,9 +6,11 @@ from . import views
 urlpatterns = [
     path("", views.index, name="index"),
     path('follow/', views.follow_index, name='follow_index'),
+    path('trending/', views.trending, name='trending'),
     path('new/', views.new_post, name='new_post'),
     path('group/<slug:slug>/', views.group_posts, name="group_posts"),
     path('group/', views.groups, name='group'),       
+    path('search/', views.search, name='search'),
     path('<str:username>/', views.profile, name='profile'),
     path('<str:username>/<int:post_id>/', views.post_view, name='post'),
     path(
@@ -16,6 +18,11 @@ urlpatterns = [
         views.post_edit,
         name='post_edit'
         ),
+    path(
+        '<str:username>/<int:post_id>/comments/',
+        views.post_comments,
+        name='post_comments'
+    ),
     path('<str:username>/<int:post_id>/comment/',
          views.add_comment,
          name='add_comment'
@@ -1,9 +1,34 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
+from django.db import IntegrityError, transaction
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
-
+from django.urls import reverse
+from django.utils.formats import date_format
+from django.utils.http import urlencode
+from django.utils.timezone import localtime
+
+from .cache import (
+    LIKES, POSTS, bump_generation, feed_page, feed_version, post_stamp,
+    timeline_generation, touch
+)
+from .conditional import (
+    conditional, group_state, index_state, post_state, profile_state
+)
+from .counters import get_counter
 from .forms import PostForm, CommentForm, ProfileForm
+from .images import schedule
+from .leaderboards import offer
 from .models import Group, Post, User, Follow, Profile_Author, Preference
+from .page_cache import anonymous_page_cache, purge_post
+from .paginator import cursor_slice, paginate
+from .ratings import change_rating
+from .replicas import replica_reads
+from .search import DOCUMENTS, find, results
+from .thumbnails import POST_THUMBNAIL, PROFILE_THUMBNAIL, pregenerate
+from .timeline import TIMELINE_KEY, timeline_posts
+from .trending import TRENDING_KEY, schedule_refresh, trending_posts
 
 
 def page_not_found(request, exception):
@@ -24,29 +49,60 @@ def server_error(request):
                 )
 
 
+@replica_reads
+@conditional(index_state)
+@anonymous_page_cache
 def index(request):
-    post_list = Post.objects.order_by('-pub_date').all()
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    post_list = Post.objects.feed().order_by('-pub_date')
+    paginator, page = paginate(request, post_list, 10)
     return render(
         request,
         "index.html",
-        {"page": page, 'paginator': paginator}
+        {
+            "page": page,
+            'paginator': paginator,
+            'feed_page': feed_page(request),
+            'feed_version': feed_version(POSTS, LIKES),
+            'feed_ttl': settings.FEED_CACHE_TTL
+        }
         )
 
 
+@replica_reads
+@conditional(group_state)
+@anonymous_page_cache
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    posts = group.posts.feed()
+    paginator, page = paginate(request, posts, 10)
     return render(request, 'group.html', {
         'group': group, 'page': page, 'paginator': paginator, 'posts':posts
         })
 
 
+def search(request):
+    query = request.GET.get('q', '').strip()
+    kind = request.GET.get('kind', '')
+    hits = []
+    if query:
+        hits = find(query, [kind] if kind in DOCUMENTS else None)
+    # Ranking is done on ids, only the shown page is loaded
+    paginator = Paginator(hits, 10)
+    page = paginator.get_page(request.GET.get('page'))
+    page.object_list = results(page.object_list)
+    return render(
+        request,
+        'search.html',
+        {
+            'query': query,
+            'kind': kind,
+            'page': page,
+            'paginator': paginator,
+            'page_query': urlencode({'q': query, 'kind': kind}) + '&',
+        }
+        )
+
+
 @login_required
 def new_post(request):
     if request.method == 'POST':
@@ -54,7 +110,11 @@ def new_post(request):
         if form.is_valid():
             post_get = form.save(commit=False)
             post_get.author = request.user
-            post_get.save()
+            with transaction.atomic():
+                post_get.save()  # with the signals' counter and timeline
+            bump_generation(POSTS)
+            pregenerate(post_get.image, *POST_THUMBNAIL)
+            schedule(post_get)
             return redirect('index')
     form = PostForm()
     return render(request, 'new.html', {'form': form})
@@ -73,13 +133,14 @@ def groups(request):
         )
 
 
+@replica_reads
+@conditional(profile_state)
+@anonymous_page_cache
 def profile(request, username):
     user = get_object_or_404(User, username=username)
     profile_author = Profile_Author.objects.filter(author__username=username).first()
-    posts = user.posts.all()
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    posts = user.posts.feed()
+    paginator, page = paginate(request, posts, 10)
     following = False
     if request.user.is_authenticated:
         following = Follow.objects.filter(author=user, user=request.user)
@@ -91,46 +152,105 @@ def profile(request, username):
             'page': page,
             'paginator': paginator,
             'following': following,
-            'profile': profile_author
+            'profile': profile_author,
+            'counter': get_counter(user)
         }
         )
 
 
+def post_context(post, form, after=None):
+    # post.html needs all of this, whichever view renders it
+    items, next_comments = comment_page(post, after)
+    return {
+        'author': post.author,
+        'post': post,
+        'items': items,
+        'next_comments': next_comments,
+        # The whole thread, never evaluated here; the page shows items
+        'comments': post.comments.all(),
+        'form': form,
+        'profile': Profile_Author.objects.filter(
+            author_id=post.author_id
+        ).first(),
+        'counter': get_counter(post.author)
+    }
+
+
+@replica_reads
+@conditional(post_state)
 def post_view(request, username, post_id):
-    profile_author = Profile_Author.objects.filter(author__username=username).first()
     post = get_object_or_404(
         Post,
         author__username=username,
         pk=post_id
         )
-    items = post.comments.all()
     form = CommentForm(request.POST or None)
-    return render(request, 'post.html', {
-        'author': post.author,
-        'post': post,
-        'items': items,
-        'form': form,
-        'profile': profile_author
-        })
+    return render(
+        request, 'post.html',
+        post_context(post, form, request.GET.get('after'))
+    )
 
 
 def post_edit(request, username, post_id):
     post = get_object_or_404(
-        Post,
+        Post.objects.select_related('group'),
         pk=post_id,
         author__username=username
         )
+    group = post.group
     if request.user != post.author:
         return redirect('post', post_id=post_id)
     form = PostForm(request.POST or None, files=request.FILES or None, instance=post)
     if form.is_valid():
-        form.save()
+        post = form.save()
+        if group and group != post.group:
+            purge_post(username, group.slug)  # the one it moved out of
+        bump_generation(POSTS)
+        pregenerate(post.image, *POST_THUMBNAIL)
+        schedule(post)
         return redirect('post', username=username, post_id=post_id)
     else:
         edit = True
         return render(request, 'new.html', {'form': form, 'post': post, 'edit': edit})
 
 
+def comment_page(post, after=None):
+    return cursor_slice(
+        post.comments.select_related('author'),
+        settings.COMMENTS_PER_PAGE, after, key=('created', 'pk')
+    )
+
+
+@replica_reads
+def post_comments(request, username, post_id):
+    post = get_object_or_404(
+        Post.objects.only('pk'), author__username=username, pk=post_id
+    )
+    items, next_comments = comment_page(post, request.GET.get('after'))
+    next_url = None
+    if next_comments:
+        next_url = '{}?{}'.format(
+            reverse('post_comments', args=[username, post_id]),
+            urlencode({'after': next_comments})
+        )
+    return JsonResponse({
+        'comments': [
+            {
+                'id': item.pk,
+                'author': item.author.username,
+                'author_name': item.author.get_full_name(),
+                'author_url': reverse('profile', args=[item.author.username]),
+                'text': item.text,
+                'created': date_format(
+                    localtime(item.created), 'DATETIME_FORMAT'
+                ),
+            }
+            for item in items
+        ],
+        'next': next_url,
+    })
+
+
 @login_required
 def add_comment(request, username, post_id):
     form = CommentForm(request.POST or None)
@@ -140,25 +260,44 @@ def add_comment(request, username, post_id):
         comment_get.author = request.user
         comment_get.post_id = post.pk
         comment_get.save()
+        bump_generation(POSTS)
         return redirect('post', username=username, post_id=post_id)
-    post = get_object_or_404(Post, pk=post_id)
-    items = post.comments.all()
-    return render(request, 'post.html', {'form':form, 'items': items, 'post': post})
+    return render(request, 'post.html', post_context(post, form))
+
+
+@replica_reads
+def trending(request):
+    schedule_refresh()
+    paginator, page = paginate(
+        request, trending_posts(), 10, TRENDING_KEY, parse=float
+    )
+    return render(
+        request,
+        'trending.html',
+        {'page': page, 'paginator': paginator, 'trending': True}
+        )
 
 
 @login_required
 def follow_index(request):
-    post_list = Post.objects.filter(author__following__user=request.user)
+    post_list = timeline_posts(request.user)
     follow = False
     if post_list is not None:
-        paginator = Paginator(post_list, 10)
-        page_number = request.GET.get('page')
-        page = paginator.get_page(page_number)
+        paginator, page = paginate(request, post_list, 10, TIMELINE_KEY)
         follow = True
     return render(
         request,
         "follow.html",
-        {"page": page, 'paginator': paginator, 'follow': follow}
+        {
+            "page": page,
+            'paginator': paginator,
+            'follow': follow,
+            'feed_page': feed_page(request),
+            'feed_version': feed_version(
+                POSTS, LIKES, timeline_generation(request.user)
+            ),
+            'feed_ttl': settings.FEED_CACHE_TTL
+        }
         )
 
 
@@ -167,6 +306,7 @@ def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     if author.username != request.user.username:
         Follow.objects.get_or_create(user=request.user, author=author)
+        bump_generation(timeline_generation(request.user))
     return redirect('profile', username=username)
 
 
@@ -174,15 +314,18 @@ def profile_follow(request, username):
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
     if author.username != request.user.username:
-        Follow.objects.get(user=request.user, author=author).delete()
+        # The signals fix up the counters and timelines
+        Follow.objects.filter(user=request.user, author=author).delete()
+        bump_generation(timeline_generation(request.user))
     return redirect('profile', username=username)
 
 @login_required
 def post_delete(request, post_id, username):
     author = get_object_or_404(User, username=username)
     if request.user == author:
-        post = get_object_or_404(Post, id=post_id)
+        post = get_object_or_404(Post, id=post_id, author=author)
         post.delete()
+        bump_generation(POSTS)
     return redirect('profile', username=username)
 
 @login_required
@@ -197,12 +340,15 @@ def profile_edit(request, username):
         new_profile = form.save(commit=False)
         new_profile.author = request.user
         new_profile.save()
+        pregenerate(new_profile.image, *PROFILE_THUMBNAIL)
+        schedule(new_profile)
         return redirect('profile', username=username)
     return render(request, 'profile_edit.html', {'form': form})
 
+@replica_reads
 def following_view(request, username):
     author = get_object_or_404(User, username=username)
-    followings = Follow.objects.filter(author=author)
+    followings = Follow.objects.filter(author=author).select_related('user')
     paginator = Paginator(followings, 10)
     page_number = request.GET.get('page')
     page = paginator.get_page(page_number)
@@ -216,9 +362,10 @@ def following_view(request, username):
         }
         )
 
+@replica_reads
 def follower_view(request, username):
     author = get_object_or_404(User, username=username)
-    followers = Follow.objects.filter(user=author)
+    followers = Follow.objects.filter(user=author).select_related('author')
     paginator = Paginator(followers, 10)
     page_number = request.GET.get('page')
     page = paginator.get_page(page_number)
@@ -233,16 +380,27 @@ def follower_view(request, username):
 @login_required
 def rating_plus(request, post_id, username):
     post = get_object_or_404(Post, pk=post_id)
-    Preference.objects.get_or_create(user=request.user, post=post)
-    post.rating = post.like.all().count()
-    post.save()
+    try:
+        with transaction.atomic():
+            Preference.objects.create(user=request.user, post=post)
+            change_rating(post.pk, 1)
+    except IntegrityError:
+        pass  # already liked, the unique constraint keeps it to one
     return redirect('post', username=username, post_id=post_id)
 
 @login_required
 def rating_minus(request, post_id, username):
     post = get_object_or_404(Post, id=post_id)
-    preference = Preference.objects.filter(user=request.user, post=post)
-    preference.delete()
-    post.rating = post.like.all().count()
-    post.save()
+    with transaction.atomic():
+        deleted, _ = Preference.objects.filter(
+            user=request.user, post=post
+        ).delete()
+        if deleted:
+            change_rating(post.pk, -1)
+    if deleted:
+        # Not a signal: a delete receiver would turn this single DELETE
+        # into SELECT + DELETE. The like may predate the window, the
+        # next rebuild corrects the board if so.
+        offer('posts', post.pk, -1)
+        touch(LIKES, post_stamp(post.pk))
     return redirect('post', username=username, post_id=post_id)
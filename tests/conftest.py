@@ -1,4 +1,14 @@
+import pytest
+
 pytest_plugins = [
     'tests.fixtures.fixture_user',
     'tests.fixtures.fixture_data',
 ]
+
+
+@pytest.fixture(autouse=True)
+def media_root(settings, tmp_path):
+    # Uploads and the thumbnails made from them stay out of MEDIA_ROOT;
+    # inline, so no worker writes them after the test put it back
+    settings.MEDIA_ROOT = str(tmp_path / 'media')
+    settings.BACKGROUND_WORKERS = 0
@@ -0,0 +1,11 @@
+import os
+
+SETTINGS_MODULES = {
+    'development': 'yatube.settings',
+    'production': 'yatube.settings_production',
+}
+
+
+def settings_module():
+    # YATUBE_ENV picks the settings when DJANGO_SETTINGS_MODULE is unset
+    return SETTINGS_MODULES[os.environ.get('YATUBE_ENV', 'development')]
@@ -52,6 +52,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'posts.profiling.ProfilingMiddleware',
+    'posts.replicas.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -71,7 +73,8 @@ ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # DjangoTemplates that reports render time to the profiler
+        "BACKEND": "posts.profiling.ProfilingTemplates",
         "DIRS": [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -93,10 +96,50 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # django.db.backends.sqlite3 plus SQLITE_TUNING, see below
+        'ENGINE': 'posts.sqlite',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # On disk so threaded tests can share it
+        'TEST': {'NAME': os.path.join(BASE_DIR, 'test_db.sqlite3')},
     }
 }
+# A second, read-only connection to the same file. Only used when
+# SQLITE_TUNING is on, by posts.routers.ReadWriteRouter.
+DATABASES['read'] = dict(
+    DATABASES['default'],
+    OPTIONS={'read_only': True},
+    TEST={'MIRROR': 'default'}
+)
+
+# Read-only copies of the default database, kept in sync outside Django:
+# YATUBE_DATABASE_REPLICAS=/srv/replica1.sqlite3,/srv/replica2.sqlite3
+# The feed and profile views read from them, see posts.replicas.
+DATABASE_REPLICAS = []
+for index, name in enumerate(
+    filter(None, os.environ.get('YATUBE_DATABASE_REPLICAS', '').split(','))
+):
+    DATABASES[f'replica_{index}'] = dict(
+        DATABASES['default'],
+        NAME=name,
+        OPTIONS={'read_only': True},
+        TEST={'MIRROR': 'default'}
+    )
+    DATABASE_REPLICAS.append(f'replica_{index}')
+# How long a visitor reads from the primary after writing something;
+# must cover the replication lag
+REPLICA_STICKY_SECONDS = 15
+
+DATABASE_ROUTERS = [
+    'posts.routers.ReplicaRouter',
+    'posts.routers.ReadWriteRouter',
+]
+
+# YATUBE_SQLITE_TUNING=1 turns on WAL journaling, busy timeouts, relaxed
+# fsync and the read/write connection split, so a comment or a like no
+# longer locks readers of the feeds out
+SQLITE_TUNING = os.environ.get('YATUBE_SQLITE_TUNING') == '1'
+SQLITE_BUSY_TIMEOUT = 5000  # ms
+SQLITE_SYNCHRONOUS = 'NORMAL'
 
 
 # Password validation
@@ -151,8 +194,138 @@ LOGOUT_REDIRECT_URL = "index"
 EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
 
+# CACHE
+# YATUBE_CACHE picks the backend: "locmem" (per process, the default),
+# "file" (shared between workers on one host, also usable in tests) or
+# "memcached" (shared between hosts, needs python-memcached).
+# Every backend is wrapped by MeteredCache; see `manage.py cache_stats`.
+CACHE_BACKENDS = {
+    'locmem': {
+        'backend': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'yatube',
+    },
+    'file': {
+        'backend': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+    },
+    'memcached': {
+        'backend': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': '127.0.0.1:11211',
+    },
+}
+CACHE_BACKEND = CACHE_BACKENDS[os.environ.get('YATUBE_CACHE', 'locmem')]
+
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'posts.cache_backends.MeteredCache',
+        'LOCATION': os.environ.get(
+            'YATUBE_CACHE_LOCATION', CACHE_BACKEND['LOCATION']
+        ),
+        'OPTIONS': {'backend': CACHE_BACKEND['backend']},
     }
 }
+
+# PAGINATION
+# Feeds longer than this switch from numbered pages to keyset cursors
+CURSOR_PAGINATION_THRESHOLD = 1000
+# Comments under a post, the rest are fetched on demand
+COMMENTS_PER_PAGE = 20
+
+# RATINGS
+# Buffer likes in memory and write them to Post.rating in batches
+RATING_BUFFER = os.environ.get('YATUBE_RATING_BUFFER') == '1'
+RATING_FLUSH_INTERVAL = 5
+
+# TIMELINE
+# Authors with more followers are merged into follow feeds at read time
+TIMELINE_FANOUT_LIMIT = 5000
+
+# FEED CACHE
+# Feed fragments are versioned by generation counters that the views
+# bump on every post, comment and follow change
+FEED_CACHE_TTL = 300
+# posts.cache.remember(): a value past its TTL or version is served for
+# CACHE_STALE_TTL more seconds while one request recomputes it. Others
+# with nothing to serve wait for it at most CACHE_LOCK_TIMEOUT seconds.
+# Larger CACHE_EARLY_EXPIRY_BETA recomputes further ahead of expiry.
+CACHE_STALE_TTL = 600
+CACHE_LOCK_TIMEOUT = 10
+CACHE_POLL_INTERVAL = 0.05
+CACHE_EARLY_EXPIRY_BETA = 1.0
+
+# PAGE CACHE
+# Whole feed and profile pages for logged-out visitors, purged when a
+# post or comment lands on them; likes and follows show within the TTL.
+# One request re-renders an expired page, the others wait for it at
+# most PAGE_CACHE_LOCK_TIMEOUT seconds. 0 turns the cache off.
+PAGE_CACHE_TTL = 60
+PAGE_CACHE_LOCK_TIMEOUT = 10
+PAGE_CACHE_POLL_INTERVAL = 0.05
+
+# TRENDING
+# Activity counts half as much every TRENDING_HALF_LIFE hours; the
+# ranking table is rebuilt from the last TRENDING_WINDOW_DAYS in the
+# background every TRENDING_REFRESH_INTERVAL seconds
+TRENDING_HALF_LIFE = 12
+TRENDING_WINDOW_DAYS = 7
+TRENDING_REFRESH_INTERVAL = 300
+TRENDING_WEIGHTS = {'post': 1, 'like': 1, 'comment': 2}
+
+# LEADERBOARDS
+# Top LEADERBOARD_SIZE authors, groups and posts, kept in the cache and
+# updated from events; LEADERBOARD_SLACK times as many are tracked so
+# members can drop out. Rebuilt from the database in the background
+# every LEADERBOARD_REFRESH_INTERVAL seconds.
+LEADERBOARD_SIZE = 5
+LEADERBOARD_SLACK = 3
+LEADERBOARD_WINDOW_DAYS = 7
+LEADERBOARD_REFRESH_INTERVAL = 600
+
+# SEARCH
+# 'fts5' needs SQLite built with it, 'python' is the inverted index in
+# SearchDocument/SearchTerm; 'auto' picks FTS5 when there is one
+SEARCH_BACKEND = os.environ.get('YATUBE_SEARCH_BACKEND', 'auto')
+SEARCH_MAX_RESULTS = 1000
+
+# BACKGROUND WORKERS
+# Thread pool for work done after the response, e.g. thumbnails.
+# 0 runs the tasks inline.
+BACKGROUND_WORKERS = 2
+
+# THUMBNAILS
+THUMBNAIL_BACKEND = 'posts.thumbnails.DeferredThumbnailBackend'
+
+# IMAGE VARIANTS
+# Every uploaded image is also saved cropped like its thumbnail at these
+# widths (none wider than the upload) in these formats, for srcset and
+# <picture>. Formats Pillow can not write here, often AVIF, are skipped;
+# JPEG is the fallback and must stay.
+IMAGE_VARIANT_WIDTHS = (320, 480, 640, 960, 1280, 1920)
+IMAGE_VARIANT_FORMATS = ('avif', 'webp', 'jpeg')
+IMAGE_VARIANT_QUALITY = 80
+
+# PROFILING
+# Share of requests timed by ProfilingMiddleware. Off here, so test runs
+# print no traces; settings_production samples a few percent
+PROFILING_SAMPLE_RATE = float(
+    os.environ.get('YATUBE_PROFILING_SAMPLE_RATE', '0')
+)
+# Samples kept per view for the rolling percentiles
+PROFILING_WINDOW = 1000
+PROFILING_REPORT_EVERY = 500
+# Sampled requests slower than this are dumped with their worst queries,
+# to PROFILING_TRACE_FILE as JSON lines or to the posts.profiling log
+PROFILING_SLOW_MS = 500
+PROFILING_TRACE_QUERIES = 5
+PROFILING_TRACE_FILE = os.environ.get('YATUBE_PROFILING_TRACE_FILE')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'posts.profiling': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
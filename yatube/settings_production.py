@@ -0,0 +1,54 @@
+"""
+Production settings for yatube, on top of the development ones.
+
+Selected with YATUBE_ENV=production (see manage.py and wsgi.py) or
+directly with DJANGO_SETTINGS_MODULE=yatube.settings_production.
+"""
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .settings import *  # noqa
+
+DEBUG = False
+
+# Never the development key, which is in the repository
+SECRET_KEY = os.environ.get('YATUBE_SECRET_KEY')
+if not SECRET_KEY:
+    raise ImproperlyConfigured('Set YATUBE_SECRET_KEY for production')
+
+# Cheap enough to leave on at a few percent
+PROFILING_SAMPLE_RATE = float(
+    os.environ.get('YATUBE_PROFILING_SAMPLE_RATE', '0.05')
+)
+
+if os.environ.get('YATUBE_ALLOWED_HOSTS'):
+    ALLOWED_HOSTS = os.environ['YATUBE_ALLOWED_HOSTS'].split(',')
+
+# The debug toolbar only slows requests down outside DEBUG
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app != 'debug_toolbar']
+MIDDLEWARE = [
+    middleware for middleware in MIDDLEWARE
+    if not middleware.startswith('debug_toolbar.')
+]
+
+# Keep database connections open between requests instead of
+# reconnecting every time
+DATABASES = {
+    alias: dict(database, CONN_MAX_AGE=600)
+    for alias, database in DATABASES.items()
+}
+
+# Parse every template once per process, not on every render
+TEMPLATES = [
+    dict(
+        template,
+        APP_DIRS=False,
+        OPTIONS=dict(template['OPTIONS'], loaders=[
+            ('django.template.loaders.cached.Loader', [
+                'django.template.loaders.filesystem.Loader',
+                'django.template.loaders.app_directories.Loader',
+            ]),
+        ])
+    )
+    for template in TEMPLATES
+]